@@ -1,24 +1,54 @@
 import os
+import re
+import threading
+import time
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
 from langchain_core.tools import tool
-from langchain_classic.agents import AgentExecutor
-from langchain_classic.agents import create_tool_calling_agent
+from langchain_classic.agents.format_scratchpad.tools import format_to_tool_messages
+from langchain_classic.agents.output_parsers.tools import ToolsAgentOutputParser
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.runnables import RunnablePassthrough
+
+from parallel_agent import ParallelAgentExecutor
+from prompt_budget import budget_stage
+from retrieval_prefetch import take_prefetched
 
 # 引入 RAG 相关（模拟员工手册数据）
 from langchain_community.embeddings import DashScopeEmbeddings
 from langchain_community.vectorstores import FAISS
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-  
+
 load_dotenv()
 api_key = os.getenv("OPENAI_API_KEY")
 base_url = os.getenv("DASHSCOPE_BASE_URL")
 
-llm = ChatOpenAI(
-    base_url=base_url,
-    model="qwen-plus"
-)
+# ============================================================================
+# 0. 延迟初始化
+# ============================================================================
+# 切分文本、调用 Embedding 接口、构建 FAISS、创建 LLM 都比较 "重"，
+# 而且 Embedding 需要联网。如果在 import 时就做，uvicorn 的 worker 启动（以及每次 reload）
+# 都会卡在网络上，模型服务慢一点就直接启动失败。
+# 所以这里把它们都改成 "第一次用到时才创建"，server.py 也可以在后台线程里提前 warmup()。
+_init_lock = threading.RLock()
+_llm = None
+_retriever = None
+_agent_executor = None
+_ready = threading.Event()
+_last_error = None
+
+
+def get_llm() -> ChatOpenAI:
+    global _llm
+    if _llm is None:
+        with _init_lock:
+            if _llm is None:
+                _llm = ChatOpenAI(
+                    base_url=base_url,
+                    model="qwen-plus",
+                    stream_usage=True   # 流式调用时也返回 token 用量（/metrics 里统计 token 用）
+                )
+    return _llm
 
 # ============================================================================
 # 1. 创建工具
@@ -38,21 +68,107 @@ raw_text = """
     4. 远程办公：每周五允许全员居家办公，但需在钉钉上打卡。
     请注意：所有请假申请必须经过直属经理批准。
 """
-text_splitter = RecursiveCharacterTextSplitter(chunk_size=100, chunk_overlap=20)
-splits = text_splitter.split_text(raw_text)
-embeddings = DashScopeEmbeddings(model="text-embedding-v2", dashscope_api_key=api_key)
-vectorstore = FAISS.from_texts(splits, embeddings)
-retriever = vectorstore.as_retriever()
+
+# ---- 索引模式 ----
+# memory：（默认）每个进程自己切分文本、调用 Embedding、在内存里构建 FAISS
+# mmap：索引只构建一次并保存到 INDEX_DIR，之后每个 worker 都用 mmap 只读打开同一个文件，
+#       索引数据放在操作系统的页缓存里，多个 worker 共享同一份物理内存
+# （另一种方式是 gunicorn --preload：在 master 里构建好再 fork，见 gunicorn.conf.py）
+INDEX_MODE = os.getenv("AGENT_INDEX_MODE", "memory")
+INDEX_DIR = os.getenv("AGENT_INDEX_DIR", "faiss_index")
+
+def _get_embeddings():
+    return DashScopeEmbeddings(model="text-embedding-v2", dashscope_api_key=api_key)
+
+def _build_vectorstore() -> FAISS:
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=100, chunk_overlap=20)
+    splits = text_splitter.split_text(raw_text)
+    return FAISS.from_texts(splits, _get_embeddings())
+
+def build_index_files(folder: str = INDEX_DIR) -> str:
+    """
+    构建索引并保存到磁盘（index.faiss + index.pkl）。
+    多个 worker 同时启动时用文件锁保证只有一个人在构建，其他人等它写完直接用。
+    """
+    import shutil
+    import tempfile
+
+    os.makedirs(os.path.dirname(os.path.abspath(folder)), exist_ok=True)
+    lock_path = os.path.abspath(folder) + ".lock"
+    with open(lock_path, "w") as lock_file:
+        try:
+            import fcntl  # Windows 上没有 fcntl，就不加锁了
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        except ImportError:
+            pass
+
+        # 拿到锁之后再检查一次：可能别的 worker 已经建好了
+        if os.path.exists(os.path.join(folder, "index.faiss")):
+            return folder
+
+        print(f"🔨 正在构建 FAISS 索引并保存到 {folder} ...")
+        # 先写到临时目录，再整体改名，避免别人读到写了一半的文件
+        tmp_dir = tempfile.mkdtemp(prefix=".faiss_tmp_", dir=os.path.dirname(os.path.abspath(folder)))
+        _build_vectorstore().save_local(tmp_dir)
+        if os.path.exists(folder):
+            shutil.rmtree(folder)
+        os.replace(tmp_dir, folder)
+    return folder
+
+def _load_mmap_vectorstore(folder: str = INDEX_DIR) -> FAISS:
+    """ 用 mmap 只读方式打开索引文件，多个进程共享同一份页缓存 """
+    import faiss
+
+    if not os.path.exists(os.path.join(folder, "index.faiss")):
+        build_index_files(folder)
+
+    # index.pkl（docstore）是 pickle 格式，走 load_local 的显式开关，不自己 pickle.load；
+    # 这个目录只放我们自己 build_index_files 写出来的文件，不能放外部来源的索引
+    vectorstore = FAISS.load_local(folder, _get_embeddings(), allow_dangerous_deserialization=True)
+    # load_local 会把整个 index.faiss 读进内存，换成 mmap 打开的版本，读进来的那份随即释放
+    vectorstore.index = faiss.read_index(
+        os.path.join(folder, "index.faiss"),
+        faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY,
+    )
+    return vectorstore
+
+def get_retriever():
+    """ 第一次调用时才切分文本、调用 Embedding、构建（或 mmap 打开）FAISS 索引 """
+    global _retriever
+    if _retriever is None:
+        with _init_lock:
+            if _retriever is None:
+                if INDEX_MODE == "mmap":
+                    vectorstore = _load_mmap_vectorstore(INDEX_DIR)
+                else:
+                    vectorstore = _build_vectorstore()
+                _retriever = vectorstore.as_retriever()
+    return _retriever
 
 @tool
 def query_company_manual(question: str) -> str:
     """ 查询员工手册来回答公司制度问题。输入应该是用户的具体问题。 """
-    docs = retriever.invoke(question)
+    # 问题和用户原话足够像时，直接用 Agent 开始时预取的结果，省掉一次检索
+    docs = take_prefetched(question)
+    if docs is None:
+        docs = get_retriever().invoke(question)
     return "\n\n".join([d.page_content for d in docs])
 
 # 把工具放入列表
 tools = [multiply, query_company_manual]
 
+# 检索预取：Agent 一开始就用用户的原话在后台查手册，和第一次 LLM 调用同时进行
+# 默认关闭（AGENT_RETRIEVAL_PREFETCH=1 打开）：每次预取都要一次 embedding + FAISS 检索；
+# 打开后也只对看起来是制度类的问题预取，纯计算题不预取
+RETRIEVAL_PREFETCH = os.getenv("AGENT_RETRIEVAL_PREFETCH", "0") == "1"
+_MANUAL_HINT = re.compile(r"年假|病假|事假|请假|休假|假期|远程|居家|办公|打卡|制度|规定|手册|公司|员工|经理|审批|工资")
+
+def _prefetch_manual(question: str):
+    return get_retriever().invoke(question)
+
+def _looks_like_manual_question(question: str) -> bool:
+    return bool(_MANUAL_HINT.search(question))
+
 # ============================================================================
 # 2. 创建代理 Agent
 # ============================================================================
@@ -67,18 +183,119 @@ prompt = ChatPromptTemplate.from_messages([
     MessagesPlaceholder(variable_name="agent_scratchpad")
 ])
 
-# 2.1 创建 Agent（大脑）
-# bind_tools 把工具列表告诉 LLM，让 LLM 知道它有哪些能力
-agent = create_tool_calling_agent(llm, tools, prompt)
+def get_agent_executor() -> ParallelAgentExecutor:
+    """ 第一次调用时才创建 Agent 和 AgentExecutor """
+    global _agent_executor
+    if _agent_executor is None:
+        with _init_lock:
+            if _agent_executor is None:
+                # 2.1 创建 Agent（大脑）
+                # 和 create_tool_calling_agent 的结构一样，只是在 prompt 前面多了一个预算检查：
+                # 历史太长时先裁掉最早的几轮，再发给 LLM（中间步骤 agent_scratchpad 不裁）
+                # bind_tools 把工具列表告诉 LLM，让 LLM 知道它有哪些能力
+                agent = (
+                    RunnablePassthrough.assign(
+                        agent_scratchpad=lambda x: format_to_tool_messages(x["intermediate_steps"])
+                    )
+                    | budget_stage(prompt, name="agent", history_key="chat_history")
+                    | prompt
+                    | get_llm().bind_tools(tools)
+                    | ToolsAgentOutputParser()
+                )
+
+                # 2.2 创建 AgentExecutor（执行者）
+                # 同一步里的多个工具调用并行执行（每个工具单独超时，见 parallel_agent.py），
+                # 开始时顺便预取一次员工手册（见 retrieval_prefetch.py）
+                # verbose=True 会打印出 Agent 的思考过程，非常有用！
+                _agent_executor = ParallelAgentExecutor(
+                    agent=agent, tools=tools, verbose=True,
+                    prefetch=_prefetch_manual if RETRIEVAL_PREFETCH else None,
+                    prefetch_when=_looks_like_manual_question,
+                )
+    return _agent_executor
+
+# ============================================================================
+# 3. 预热 & 就绪状态
+# ============================================================================
+def warmup():
+    """ 把所有重资源都创建好（包括联网构建 FAISS），成功后标记为就绪 """
+    global _last_error
+    try:
+        get_retriever()
+        get_agent_executor()
+    except Exception as e:
+        _last_error = repr(e)
+        raise
+    _last_error = None
+    _ready.set()
+
+def start_background_warmup(retry_interval: float = 5.0, max_interval: float = 60.0) -> threading.Thread:
+    """ 在后台线程里 warmup，失败了按指数退避一直重试，不阻塞 worker 启动 """
+    def _run():
+        interval = retry_interval
+        while not _ready.is_set():
+            try:
+                warmup()
+                print("✅ Agent 预热完成，服务已就绪")
+            except Exception as e:
+                print(f"⚠️ Agent 预热失败，{interval:.0f} 秒后重试: {e}")
+                time.sleep(interval)
+                interval = min(interval * 2, max_interval)
 
-# 2.2 创建 AgentExecutor（执行者）
-# verbose=True 会打印出 Agent 的思考过程，非常有用！
-agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=True)
+    thread = threading.Thread(target=_run, name="agent-warmup", daemon=True)
+    thread.start()
+    return thread
+
+def warmup_for_fork():
+    """
+    给 gunicorn --preload 用：在 master 进程里把索引建好再 fork，
+    worker 通过写时复制（copy-on-write）共享这块内存。
+    建索引时会联网调用 embedding 接口（DashScope SDK 每次请求用临时 session，用完就关）；
+    LLM 客户端在 master 里只创建、不发请求，连接池是空的，worker 各自建立自己的连接。
+    如果以后要在 master 里调用 LLM（比如预热请求），得在 gunicorn 的 post_fork 里重新创建客户端，
+    否则多个 worker 会共用从 master 继承下来的同一条连接。
+    """
+    import gc
+
+    warmup()
+    # 把目前所有对象移到 "永久代"，之后 GC 不会再去扫描/改写它们，
+    # 避免引用计数和 GC 标记把共享的内存页弄脏、被逐页复制
+    gc.collect()
+    gc.freeze()
+
+def is_ready() -> bool:
+    return _ready.is_set()
+
+def readiness() -> dict:
+    """ 给 /ready 接口用的详细状态 """
+    return {
+        "ready": _ready.is_set(),
+        "llm": _llm is not None,
+        "retriever": _retriever is not None,
+        "agent_executor": _agent_executor is not None,
+        "last_error": _last_error,
+    }
+
+# 兼容老写法：`from agent_logic import agent_executor` 依然可用（此时才会真正创建）
+def __getattr__(name):
+    if name == "agent_executor":
+        return get_agent_executor()
+    if name == "llm":
+        return get_llm()
+    if name == "retriever":
+        return get_retriever()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # 导出给 server.py 使用
-__all__ = ["agent_executor"]
+__all__ = ["agent_executor", "get_agent_executor", "warmup", "start_background_warmup", "is_ready", "readiness"]
+
+# 部署前可以先单独构建 mmap 索引：python agent_logic.py --build-index
+if __name__ == "__main__":
+    import sys
+    if "--build-index" in sys.argv:
+        print(f"✅ 索引已保存到: {build_index_files(INDEX_DIR)}")
 
-""" 
+"""
 # ============================================================================
 # 3. 测试
 # ============================================================================
@@ -87,9 +304,8 @@ print("========== 测试：复杂的混合问题 ==========")
 # 这个问题需要：
 # 1. 先调用 query_company_manual 查出 “10天”
 # 2. 再调用 multiply 计算 10 * 5 = 50
-response = agent_executor.invoke({"input": "公司规定满十年的年假是多少天？如果我有 5 个同事（其中3个同时满2年，2个同事满10年）一共有多少天年假？"})
+response = get_agent_executor().invoke({"input": "公司规定满十年的年假是多少天？如果我有 5 个同事（其中3个同时满2年，2个同事满10年）一共有多少天年假？"})
 
 print("\n========== 最终答案 ==========")
-print(response["output"]) 
+print(response["output"])
 """
-
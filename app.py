@@ -2,9 +2,32 @@ import streamlit as st
 from typing import cast
 from langchain_core.messages import HumanMessage, AIMessage
 
-# 导入我们刚才写好的 Multi-Agent 图
-# 注意：这里回加载 .env 并初始化模型
-from demo_13_multi_agent import app, TeamState
+from singleflight import normalize_text
+
+
+# =============================================================================
+# 进程级资源缓存：Streamlit 每次交互都会重新执行整个脚本，
+# 用 st.cache_resource 保证图、LLM 客户端、工具只在进程里初始化一次（所有标签页共享）
+# =============================================================================
+@st.cache_resource(show_spinner="🚀 正在初始化 AI 团队...")
+def load_team():
+    # 导入我们刚才写好的 Multi-Agent 图
+    # 注意：这里回加载 .env 并初始化模型
+    import demo_13_multi_agent as team
+    team.warmup()
+    return team
+
+
+@st.cache_resource
+def get_result_cache() -> dict:
+    """ 已完成任务的结果：规范化后的主题 -> 文章（进程内共享，不随标签页丢失） """
+    return {}
+
+
+team = load_team()
+app, TeamState = team.app, team.TeamState
+new_thread_config, can_resume = team.new_thread_config, team.can_resume
+ARTICLE_TAG = team.ARTICLE_TAG
 
 # =============================================================================
 # 辅助函数：提取真正的文章内容
@@ -51,8 +74,146 @@ with st.sidebar:
         with st.expander(f"任务 #{i+1}: {item['topic'][:20]}..."):
             st.text_area("结果", item['result'], height=200, key=f"history_result_{i}")
 
+    # 断点续跑：每次任务都有一个 thread_id，检查点存在本地 SQLite 里，
+    # 任务中途失败后，用 thread_id 可以从最后一个完成的节点继续（不用重新搜索/写作）
+    st.header("继续未完成的任务")
+    resume_thread_id = st.text_input(
+        "thread_id", value=st.session_state.get("failed_thread_id", ""), key="resume_thread_id"
+    )
+    resume_clicked = st.button("♻️ 从断点继续")
+
+    st.header("缓存")
+    force_rerun = st.checkbox("忽略缓存，重新创作", value=False)
+    st.caption(f"已缓存 {len(get_result_cache())} 篇文章")
+
 # =============================================================================
-# 3. 用户输入区
+# 3. 运行 Multi-Agent （核心逻辑）
+# =============================================================================
+def run_team(graph_input, config, topic):
+    """
+    流式运行团队并展示结果。
+    graph_input 为 None 时表示从该 thread 的最后一个检查点继续。
+    """
+    final_result = ""
+    thread_id = config["configurable"]["thread_id"]
+    # 创建状态栏容器
+    # st.status 是一个可以折叠的进度条
+    status = st.status("🏢 团队正在工作中...", expanded=True)
+    # 状态栏下面留一块位置，Writer 写作时把 token 实时显示在这里
+    live_article = st.empty()
+    with status:
+        status.write(f"🧵 thread_id: `{thread_id}`")
+
+        # 开始流式执行
+        # stream_mode=["updates", "values"]：同一次执行里既拿到每个节点的增量（用来显示进度），
+        # 也拿到每一步之后的完整状态（最后一个就是最终结果），不用再 invoke 重跑一遍整个图
+        # "messages"：LLM 每生成一个 token 就推一次，用来实时显示 Writer 正在写的文章
+        try: 
+            final_state = None
+            live_id, live_text = None, ""
+            for mode, chunk in app.stream(graph_input, config, stream_mode=["updates", "values", "messages"]):
+                if mode == "values":
+                    final_state = chunk
+                    continue
+
+                if mode == "messages":
+                    token, metadata = chunk
+                    # 只显示 Writer 整篇写作的输出（修改模式输出的是修改块，不显示）
+                    if metadata.get("langgraph_node") != "writer" or ARTICLE_TAG not in (metadata.get("tags") or []):
+                        continue
+                    if token.id != live_id:
+                        # 新的一次写作（比如被驳回后整篇重写），从头显示
+                        live_id, live_text = token.id, ""
+                    live_text += token.content
+                    live_article.markdown(live_text + "▌")
+                    continue
+
+                for node_name, node_output in chunk.items():
+                    print(f"-->：{node_name}")
+                    if node_name == "__start__" or node_name == "__end__":
+                        continue
+
+                    # 根据节点更新标题和日志
+                    if node_name == "research_branch":
+                        # 并行搜索的每个分支结束时都会来一条
+                        for r in node_output.get("research_results", []):
+                            mark = "✅" if r["ok"] else "⚠️"
+                            status.write(f"{mark} 子查询「{r['query']}」完成（{r['elapsed_s']}s）")
+
+                    elif node_name == "researcher":
+                        status.update(label="🔍 [Researcher] 正在联网搜索...", state="running")
+                        # 🔥 关键：使用 st.write 追加日志，更稳定
+                        status.write("🔍 研究员正在查阅最新资料...")
+
+                    elif node_name == "writer":
+                        status.update(label="✍️  [Writer] 正在撰写文章...", state="running")
+                        status.write("✍️ 作家正在根据资料撰写内容...")
+
+                    elif node_name == "publisher":
+                        status.update(label="📢 [Publisher] 正在审核...", state="running")
+                        # 判断审核结果
+                        msg_content = ""
+                        if isinstance(node_output, dict) and "messages" in node_output:
+                            msg_content = node_output["messages"][-1].content
+                        
+                        if "不通过" in msg_content:
+                            status.write(f"📢 **审核驳回**: {msg_content}")
+                        elif "通过" in msg_content:
+                            status.write(f"📢 **审核通过**: 文章已发布！")
+                        else:
+                            status.write("📢 发布者正在进行质量检查...")
+
+            # 获取最终结果（就是上面流式过程中的最后一个完整状态）
+            # 优先用 state 里的当前稿件（重写是增量修改的，消息里不一定是完整正文）
+            if final_state:
+                final_result = final_state.get("draft") or extract_article(final_state["messages"])
+            else:
+                final_result = "未找到文章内容"
+
+            # 标记完成
+            status.update(label="✅ 任务完成！", state="complete", expanded=False)
+            st.session_state.pop("failed_thread_id", None)
+
+        except Exception as e:
+            live_article.empty()
+            status.update(label="⚠️ 错误！", state="error")
+            status.write(f"⚠️ 错误：{e}")
+            # 记下失败的 thread_id，侧边栏可以一键从断点继续
+            st.session_state.failed_thread_id = thread_id
+            status.write(f"♻️ 可以在侧边栏用 thread_id `{thread_id}` 从断点继续")
+            return
+
+    # 写作过程中的实时预览换成下面的最终文章
+    live_article.empty()
+    get_result_cache()[normalize_text(topic)] = final_result
+
+    # 保存到历史记录
+    st.session_state.history.append({
+        "topic": topic,
+        "result": final_result
+    })
+    show_result(topic, final_result)
+
+
+def show_result(topic, final_result):
+    # ===========================================================================
+    # 展示最终结果
+    # ===========================================================================
+    st.divider()
+    st.subheader("📄 最终文章")
+    st.markdown(final_result)
+
+    # 提供下载按钮
+    st.download_button(
+        label="📥 下载文章",
+        data=final_result,
+        file_name=f"blog_{topic[:10]}.txt",
+        mime="text/plain"
+
+    )
+
+# =============================================================================
+# 4. 用户输入区
 # =============================================================================
 user_input = st.text_area("请输入创作主题：", height=200, placeholder="例如：马斯克的星舰发射...")
 
@@ -60,82 +221,27 @@ if st.button("🚀 开始创作", type="primary"):
     if not user_input:
         st.warning("请先输入一个主题！")
     else:
-        # ===========================================================================
-        # 4. 运行 Multi-Agent （核心逻辑）
-        # ===========================================================================
-
-        # 2. 准备输入
-        inputs = {"messages": [HumanMessage(content=user_input)]}
-        safe_inputs = cast(TeamState, inputs)
-
-        final_result = ""
-        # 3. 创建状态栏容器
-        # st.status 是一个可以折叠的进度条
-        with st.status("🏢 团队正在工作中...", expanded=True) as status:
-
-            # 4. 开始流式执行
-            try: 
-                for event in app.stream(safe_inputs):
-                    for node_name, node_output in event.items():
-                        print(f"-->：{node_name}")
-                        if node_name == "__start__" or node_name == "__end__":
-                            continue
-
-                        # 根据节点更新标题和日志
-                        if node_name == "Researcher":
-                            status.update(label="🔍 [Researcher] 正在联网搜索...", state="running")
-                            # 🔥 关键：使用 st.write 追加日志，更稳定
-                            status.write("🔍 研究员正在查阅最新资料...")
-
-                        elif node_name == "Writer":
-                            status.update(label="✍️  [Writer] 正在撰写文章...", state="running")
-                            status.write("✍️ 作家正在根据资料撰写内容...")
-
-                        elif node_name == "Publisher":
-                            status.update(label="📢 [Publisher] 正在审核...", state="running")
-                            # 判断审核结果
-                            msg_content = ""
-                            if isinstance(node_output, dict) and "messages" in node_output:
-                                msg_content = node_output["messages"][-1].content
-                            
-                            if "不通过" in msg_content:
-                                status.write(f"📢 **审核驳回**: {msg_content}")
-                            elif "通过" in msg_content:
-                                status.write(f"📢 **审核通过**: 文章已发布！")
-                            else:
-                                status.write("📢 发布者正在进行质量检查...")
-
-                # 获取最终结果
-                final_state = app.invoke(safe_inputs)
-                final_result = extract_article(final_state["messages"])
-
-                # 标记完成
-                status.update(label="✅ 任务完成！", state="complete", expanded=False)
-
-            except Exception as e:
-                status.update(label="⚠️ 错误！", state="error")
-                status.write(f"⚠️ 错误：{e}")        
-
-        # ===========================================================================
-        # 5. 展示最终结果
-        # ===========================================================================
-        st.divider()
-        st.subheader("📄 最终文章")
-        st.markdown(final_result)
-
-        # 保存到历史记录
-        st.session_state.history.append({
-            "topic": user_input,
-            "result": final_result
-        })
-
-        # 提供下载按钮
-        st.download_button(
-            label="📥 下载文章",
-            data=final_result,
-            file_name=f"blog_{user_input[:10]}.txt",
-            mime="text/plain"
-
-        )
-
-                       
\ No newline at end of file
+        cached = get_result_cache().get(normalize_text(user_input))
+        if cached is not None and not force_rerun:
+            # 同样的主题已经写过：直接展示，不再跑一遍搜索 / 写作
+            st.info("⚡ 这个主题之前已经创作过，直接展示缓存结果（侧边栏可以选择忽略缓存）。")
+            show_result(user_input, cached)
+        else:
+            # 准备输入
+            inputs = {"messages": [HumanMessage(content=user_input)]}
+            safe_inputs = cast(TeamState, inputs)
+            run_team(safe_inputs, new_thread_config(), user_input)
+
+# =============================================================================
+# 5. 从断点继续
+# =============================================================================
+if resume_clicked:
+    config = new_thread_config(resume_thread_id.strip())
+    if not resume_thread_id.strip():
+        st.warning("请先输入 thread_id！")
+    elif not can_resume(config):
+        st.info("这个任务没有未完成的步骤（可能已经完成，或者 thread_id 不存在）。")
+    else:
+        # 输入传 None：从最后一个检查点继续
+        topic = str(app.get_state(config).values["messages"][0].content)
+        run_team(None, config, topic)
@@ -0,0 +1,281 @@
+"""
+离线批处理：把大量链的输入打包成一个批处理任务，走服务商的异步 Batch 接口
+
+实时调用（chain.invoke / chain.batch）每条都是一次在线请求，夜间批量生成几千条时
+既贵、又会挤占在线业务的限流额度。OpenAI 兼容的 Batch 接口（DashScope 也支持）
+价格更低、不占实时配额，代价是结果要等一段时间（最长 24h）。
+
+流程（每一步都会把文件落到 job 目录里，进程挂了可以接着收结果）：
+    1. export   ：本地执行 prompt 部分，把每条输入变成一行 /v1/chat/completions 请求（requests.jsonl）
+    2. submit   ：上传文件并创建 Batch 任务（OpenAIBatchBackend），
+                  或者用 LocalBatchBackend 在本地逐条调用（没有 Batch 接口时的替代品，也方便调试）
+    3. poll     ：轮询任务状态，完成后下载结果（output.jsonl）
+    4. reassemble：把每条返回的消息交给链里 LLM 后面的部分（比如 StrOutputParser），
+                  按原来的顺序拼回和 chain.invoke 一样的输出
+
+只支持 "prompt | llm | 后处理" 这种一条链里只有一次 LLM 调用的结构；
+多步的链（比如 demo_05）拆成多个阶段，每个阶段跑一次批处理，见 run_stages()。
+
+命令行：
+    python batch_jobs.py demo_04_chain_with_parser inputs.jsonl results.jsonl [--local]
+inputs.jsonl 每行一个链的输入（JSON 对象），模块里需要有 chain 或者 BATCH_STAGES。
+"""
+import importlib
+import inspect
+import json
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.runnables import RunnableBinding, RunnableLambda, RunnableSequence
+from langchain_openai import ChatOpenAI
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_JOBS_DIR = os.getenv("BATCH_JOBS_DIR", "batch_jobs")
+# 轮询间隔（秒）和最长等待时间（秒，默认 24 小时，和 completion_window 一致）
+BATCH_POLL_INTERVAL = float(os.getenv("BATCH_POLL_INTERVAL", "30"))
+BATCH_MAX_WAIT = float(os.getenv("BATCH_MAX_WAIT", str(24 * 3600)))
+
+
+# =============================================================================
+# 1. 把链拆成 "LLM 之前 / LLM / LLM 之后" 三段
+# =============================================================================
+def split_chain(chain):
+    """ 返回 (pre, llm, bound_kwargs, post)；链里必须正好有一个 ChatOpenAI """
+    steps = chain.steps if isinstance(chain, RunnableSequence) else [chain]
+    positions = [i for i, step in enumerate(steps) if _as_chat_openai(step) is not None]
+    if len(positions) != 1:
+        raise ValueError("批处理只支持正好包含一次 ChatOpenAI 调用的链（prompt | llm | 后处理）")
+    i = positions[0]
+    llm, bound_kwargs = _as_chat_openai(steps[i])
+    identity = RunnableLambda(lambda x: x)
+    pre = RunnableSequence(*steps[:i]) if i > 1 else (steps[0] if i == 1 else identity)
+    after = steps[i + 1:]
+    post = RunnableSequence(*after) if len(after) > 1 else (after[0] if after else identity)
+    return pre, llm, bound_kwargs, post
+
+
+def _as_chat_openai(step):
+    """ ChatOpenAI 或者 llm.bind(...) / llm.bind_tools(...) 的结果，返回 (llm, 绑定的参数) """
+    if isinstance(step, ChatOpenAI):
+        return step, {}
+    if isinstance(step, RunnableBinding) and isinstance(step.bound, ChatOpenAI):
+        return step.bound, dict(step.kwargs)
+    return None
+
+
+# =============================================================================
+# 2. 导出请求文件
+# =============================================================================
+def export_requests(chain, inputs, path):
+    """
+    本地执行 prompt 部分，每条输入写成一行 Batch 请求，返回写入的条数。
+    custom_id 是输入的下标，收结果时靠它对应回去。
+    """
+    pre, llm, bound_kwargs, _ = split_chain(chain)
+    with open(path, "w", encoding="utf-8") as f:
+        for index, chain_input in enumerate(inputs):
+            prompt_value = pre.invoke(chain_input)
+            # 和 ChatOpenAI 在线调用时发出去的请求体完全一样（模型、温度、绑定的工具等）。
+            # _get_request_payload / _create_chat_result 是 ChatOpenAI 的私有方法，
+            # 按 requirements.txt 里固定的 langchain-openai==1.1.7 写的，升级时要重新核对
+            body = llm._get_request_payload(prompt_value, **bound_kwargs)
+            body.pop("stream", None)
+            body.pop("stream_options", None)
+            # extra_body 是 openai SDK 的概念，真正发出去的 HTTP 请求体里是平铺的（比如 enable_thinking）
+            body.update(body.pop("extra_body", None) or {})
+            request = {"custom_id": str(index), "method": "POST", "url": BATCH_ENDPOINT, "body": body}
+            f.write(json.dumps(request, ensure_ascii=False) + "\n")
+    return len(inputs)
+
+
+# =============================================================================
+# 3. 批处理后端
+# =============================================================================
+class OpenAIBatchBackend:
+    """ OpenAI 兼容的 Batch 接口（/v1/files + /v1/batches），DashScope 兼容模式同样可用 """
+
+    def __init__(self, client):
+        # client 是 openai.OpenAI，直接用 ChatOpenAI 里的 llm.root_client 即可
+        self.client = client
+
+    def submit(self, requests_path) -> str:
+        with open(requests_path, "rb") as f:
+            uploaded = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=uploaded.id, endpoint=BATCH_ENDPOINT, completion_window="24h"
+        )
+        return batch.id
+
+    def status(self, batch_id) -> str:
+        """ validating / in_progress / finalizing / completed / failed / expired / cancelled """
+        return self.client.batches.retrieve(batch_id).status
+
+    def download(self, batch_id, output_path):
+        batch = self.client.batches.retrieve(batch_id)
+        with open(output_path, "w", encoding="utf-8") as f:
+            # 成功的在 output_file，失败的在 error_file，两个都写进结果文件
+            for file_id in (batch.output_file_id, batch.error_file_id):
+                if file_id:
+                    text = self.client.files.content(file_id).text
+                    f.write(text if text.endswith("\n") or not text else text + "\n")
+
+
+class LocalBatchBackend:
+    """
+    本地替代品：submit 时就在本地逐条调用 /v1/chat/completions（限制并发），
+    结果写成和 Batch 接口一模一样的格式。用于没有 Batch 接口的服务、以及本地调试。
+    """
+
+    def __init__(self, client, max_concurrency: int = 4):
+        self.client = client
+        self.max_concurrency = max_concurrency
+        self._outputs = {}
+
+    def _sdk_kwargs(self, body: dict) -> dict:
+        """ 请求体里 SDK 不认识的字段（服务商自己的参数）放回 extra_body，否则 create() 会报 TypeError """
+        known = inspect.signature(self.client.chat.completions.create).parameters
+        kwargs = {k: v for k, v in body.items() if k in known}
+        extra = {k: v for k, v in body.items() if k not in known}
+        if extra:
+            kwargs["extra_body"] = {**(kwargs.get("extra_body") or {}), **extra}
+        return kwargs
+
+    def _call(self, request):
+        try:
+            response = self.client.chat.completions.create(**self._sdk_kwargs(request["body"]))
+            result = {"status_code": 200, "body": response.model_dump()}
+            error = None
+        except Exception as e:
+            result = None
+            error = {"code": type(e).__name__, "message": str(e)}
+        return {"id": f"local-{uuid.uuid4()}", "custom_id": request["custom_id"], "response": result, "error": error}
+
+    def submit(self, requests_path) -> str:
+        with open(requests_path, "r", encoding="utf-8") as f:
+            requests = [json.loads(line) for line in f if line.strip()]
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            outputs = list(pool.map(self._call, requests))
+        batch_id = f"local-{uuid.uuid4()}"
+        self._outputs[batch_id] = outputs
+        return batch_id
+
+    def status(self, batch_id) -> str:
+        return "completed" if batch_id in self._outputs else "failed"
+
+    def download(self, batch_id, output_path):
+        with open(output_path, "w", encoding="utf-8") as f:
+            for line in self._outputs.pop(batch_id, []):
+                f.write(json.dumps(line, ensure_ascii=False) + "\n")
+
+
+def wait_for_batch(backend, batch_id, poll_interval=BATCH_POLL_INTERVAL, max_wait=BATCH_MAX_WAIT) -> str:
+    """ 轮询直到任务结束，返回最终状态 """
+    start = time.time()
+    while True:
+        status = backend.status(batch_id)
+        if status in ("completed", "failed", "expired", "cancelled"):
+            return status
+        if time.time() - start > max_wait:
+            raise TimeoutError(f"批处理任务 {batch_id} 等待超时（{max_wait}s），最后状态：{status}")
+        print(f"⏳ 批处理任务 {batch_id} 状态：{status}，{poll_interval}s 后再查...")
+        time.sleep(poll_interval)
+
+
+# =============================================================================
+# 4. 收结果：拼回链的输出
+# =============================================================================
+def reassemble(chain, output_path, count):
+    """
+    读取结果文件，按 custom_id 放回原来的位置，交给链里 LLM 后面的部分处理。
+    返回长度为 count 的列表：成功的是链的输出，失败 / 缺失的是异常对象。
+    """
+    _, llm, _, post = split_chain(chain)
+    results = [RuntimeError("批处理结果里没有这一条") for _ in range(count)]
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            index = int(item["custom_id"])
+            response = item.get("response") or {}
+            if item.get("error") or response.get("status_code") != 200:
+                results[index] = RuntimeError(f"批处理请求失败：{item.get('error') or response}")
+                continue
+            try:
+                # 和在线调用一样把响应转成 AIMessage（包括 token 用量、工具调用）
+                message = llm._create_chat_result(response["body"]).generations[0].message
+                results[index] = post.invoke(message)
+            except Exception as e:
+                results[index] = e
+    return results
+
+
+def run_batch_job(chain, inputs, backend=None, job_dir=None, poll_interval=BATCH_POLL_INTERVAL):
+    """ 导出 -> 提交 -> 等待 -> 收结果，一步到位；返回和 inputs 一一对应的结果列表 """
+    _, llm, _, _ = split_chain(chain)
+    backend = backend or OpenAIBatchBackend(llm.root_client)
+    job_dir = job_dir or os.path.join(BATCH_JOBS_DIR, time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6])
+    os.makedirs(job_dir, exist_ok=True)
+
+    requests_path = os.path.join(job_dir, "requests.jsonl")
+    output_path = os.path.join(job_dir, "output.jsonl")
+    count = export_requests(chain, inputs, requests_path)
+    batch_id = backend.submit(requests_path)
+    # 记下任务 id：进程中途退出后，可以用 backend.download(batch_id, ...) + reassemble() 接着收结果
+    with open(os.path.join(job_dir, "job.json"), "w", encoding="utf-8") as f:
+        json.dump({"batch_id": batch_id, "count": count, "backend": type(backend).__name__}, f)
+    print(f"📦 已提交批处理任务 {batch_id}（{count} 条），目录：{job_dir}")
+
+    status = wait_for_batch(backend, batch_id, poll_interval=poll_interval)
+    if status != "completed":
+        raise RuntimeError(f"批处理任务 {batch_id} 结束状态：{status}")
+    backend.download(batch_id, output_path)
+    return reassemble(chain, output_path, count)
+
+
+def run_stages(stages, inputs, backend=None, poll_interval=BATCH_POLL_INTERVAL):
+    """
+    多步链按阶段跑批处理：stages 是 [(chain, build_input), ...]，
+    build_input(上一阶段的输出, 原始输入) 返回这一阶段链的输入（第一阶段的 "上一阶段输出" 是 None）。
+    某一条在中间阶段失败后，后面的阶段就跳过它，结果里保留异常。
+    """
+    results = [None] * len(inputs)
+    alive = list(range(len(inputs)))
+    for stage_no, (chain, build_input) in enumerate(stages, start=1):
+        stage_inputs = [build_input(results[i], inputs[i]) for i in alive]
+        print(f"🧱 第 {stage_no}/{len(stages)} 阶段：{len(stage_inputs)} 条")
+        outputs = run_batch_job(chain, stage_inputs, backend=backend, poll_interval=poll_interval)
+        for i, output in zip(alive, outputs):
+            results[i] = output
+        alive = [i for i in alive if not isinstance(results[i], Exception)]
+    return results
+
+
+if __name__ == "__main__":
+    # python batch_jobs.py <模块名> inputs.jsonl results.jsonl [--local]
+    if len(sys.argv) < 4:
+        print("用法：python batch_jobs.py demo_04_chain_with_parser inputs.jsonl results.jsonl [--local]")
+        sys.exit(1)
+    module = importlib.import_module(sys.argv[1])
+    with open(sys.argv[2], "r", encoding="utf-8") as f:
+        inputs = [json.loads(line) for line in f if line.strip()]
+
+    stages = getattr(module, "BATCH_STAGES", None) or [(module.chain, lambda prev, original: original)]
+    first_llm = split_chain(stages[0][0])[1]
+    backend = LocalBatchBackend(first_llm.root_client) if "--local" in sys.argv else None
+
+    results = run_stages(stages, inputs, backend=backend)
+    failed = 0
+    with open(sys.argv[3], "w", encoding="utf-8") as out:
+        for chain_input, result in zip(inputs, results):
+            if isinstance(result, Exception):
+                failed += 1
+                line = {"input": chain_input, "ok": False, "error": str(result)}
+            else:
+                content = result.content if hasattr(result, "content") else result
+                line = {"input": chain_input, "ok": True, "output": content}
+            out.write(json.dumps(line, ensure_ascii=False) + "\n")
+    print(f"完成：成功 {len(inputs) - failed}，失败 {failed}，结果写入 {sys.argv[3]}")
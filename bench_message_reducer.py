@@ -0,0 +1,73 @@
+"""
+基准测试：对比 `lambda x, y: x + y` 和 append_messages 两种消息 reducer
+
+不需要联网，也不调用 LLM。运行：python bench_message_reducer.py
+每一行是 "消息数达到 N 时，再追加一条消息的平均耗时"：
+- x + y：随消息数线性增长（每次复制整个列表，总开销 O(n²)）
+- append_messages：基本保持不变（每步 O(1)）
+"""
+import time
+from typing import Annotated, TypedDict
+
+from langchain_core.messages import AIMessage
+from langgraph.graph import StateGraph, END
+
+from message_state import append_messages
+
+
+def concat(x, y):
+    return x + y
+
+
+def bench_reducer(reducer, sizes, probe=200):
+    """ 先把消息数堆到 N，再测 probe 次追加的平均耗时（微秒） """
+    results = {}
+    state = []
+    for size in sizes:
+        while len(state) < size:
+            state = reducer(state, [AIMessage(content="x")])
+        new_messages = [[AIMessage(content="y")] for _ in range(probe)]
+        start = time.perf_counter()
+        for msgs in new_messages:
+            state = reducer(state, msgs)
+        results[size] = (time.perf_counter() - start) / probe * 1e6
+    return results
+
+
+def bench_graph(reducer, steps):
+    """ 跑一个 steps 步的 "agent 循环" 图，返回每步平均耗时（微秒） """
+    class State(TypedDict):
+        messages: Annotated[list, reducer]
+        remaining: int
+
+    def step(state):
+        return {"messages": [AIMessage(content="step")], "remaining": state["remaining"] - 1}
+
+    def route(state):
+        return "step" if state["remaining"] > 0 else END
+
+    workflow = StateGraph(State)
+    workflow.add_node("step", step)
+    workflow.set_entry_point("step")
+    workflow.add_conditional_edges("step", route, {"step": "step", END: END})
+    graph = workflow.compile()
+
+    start = time.perf_counter()
+    graph.invoke({"messages": [], "remaining": steps}, {"recursion_limit": steps + 10})
+    return (time.perf_counter() - start) / steps * 1e6
+
+
+if __name__ == "__main__":
+    sizes = [1_000, 5_000, 10_000, 20_000, 40_000]
+
+    print("===== 单次 reducer 调用耗时（微秒/步） =====")
+    print(f"{'消息数':>8} | {'x + y':>10} | {'append_messages':>16}")
+    concat_result = bench_reducer(concat, sizes)
+    append_result = bench_reducer(append_messages, sizes)
+    for size in sizes:
+        print(f"{size:>8} | {concat_result[size]:>10.2f} | {append_result[size]:>16.2f}")
+
+    print("\n===== 整个 LangGraph 循环的平均每步耗时（微秒/步） =====")
+    print(f"{'步数':>8} | {'x + y':>10} | {'append_messages':>16}")
+    for steps in [500, 2_000, 5_000]:
+        print(f"{steps:>8} | {bench_graph(concat, steps):>10.2f} | {bench_graph(append_messages, steps):>16.2f}")
@@ -0,0 +1,328 @@
+"""
+本地持久化的 LangGraph Checkpointer（SQLite）
+
+workflow.compile(checkpointer=get_checkpointer()) 之后，图每跑完一个节点都会存一个检查点，
+进程崩溃 / 超时之后，用同一个 thread_id 再调用 app.invoke(None, config) 就能从最后一个
+完成的节点继续跑，不用把 Researcher 搜索、Writer 写作重新做一遍。
+
+和 LangGraph 自带的 InMemorySaver 一样，每个检查点只保存 "这一步版本号变了的通道"，
+没变的通道直接引用之前的版本。在此基础上，消息通道（MessageLog，见 message_state.py）
+只保存 "比上一个版本多出来的那几条消息"（增量），读取时顺着 base_version 拼回完整列表，
+每隔 FULL_SNAPSHOT_EVERY 个增量存一次完整快照，避免链条太长。
+"""
+import os
+import random
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+
+from message_state import MessageLog
+
+DEFAULT_DB_PATH = os.getenv("LANGGRAPH_CHECKPOINT_DB", "checkpoints.sqlite")
+FULL_SNAPSHOT_EVERY = 50
+# 最多记住多少个通道的 "上一个版本"（挂起的线程很多时，避免把所有消息都留在内存里）
+MAX_TRACKED_LOGS = 256
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    parent_checkpoint_id TEXT,
+    checkpoint_type TEXT,
+    checkpoint BLOB,
+    metadata_type TEXT,
+    metadata BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    channel TEXT NOT NULL,
+    version TEXT NOT NULL,
+    kind TEXT NOT NULL,          -- full / msglog / delta / empty
+    type TEXT,
+    blob BLOB,
+    base_version TEXT,           -- kind=delta 时，增量是在哪个版本的基础上追加的
+    PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    type TEXT,
+    blob BLOB,
+    task_path TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+"""
+
+
+class SqliteDeltaSaver(BaseCheckpointSaver[str]):
+    """ 基于 SQLite 的 checkpointer，消息通道按增量保存 """
+
+    def __init__(self, path: str = DEFAULT_DB_PATH, *, serde=None):
+        super().__init__(serde=serde)
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(_SCHEMA)
+        self.lock = threading.RLock()
+        # (thread_id, ns, channel) -> (版本号, 这个版本的 MessageLog, 增量链长度)
+        # 用来判断新版本是不是在上一个版本后面追加的；记不住的就存完整快照
+        self._last_logs = OrderedDict()
+
+    def _remember(self, key, version, log, depth):
+        self._last_logs[key] = (version, log, depth)
+        self._last_logs.move_to_end(key)
+        while len(self._last_logs) > MAX_TRACKED_LOGS:
+            self._last_logs.popitem(last=False)
+
+    # ------------------------------------------------------------------
+    # 通道值的读写
+    # ------------------------------------------------------------------
+    def _dump_blob(self, thread_id, ns, channel, version, value):
+        """ 返回要写入 blobs 表的一行（kind, type, blob, base_version） """
+        key = (thread_id, ns, channel)
+        if not isinstance(value, MessageLog):
+            self._last_logs.pop(key, None)
+            type_, blob = self.serde.dumps_typed(value)
+            return "full", type_, blob, None
+
+        last = self._last_logs.get(key)
+        if last is not None:
+            base_version, base_log, depth = last
+            # 上一个版本是新版本的前缀（共享同一块存储），只存多出来的部分
+            if (
+                base_log._buf is value._buf
+                and len(base_log) <= len(value)
+                and depth < FULL_SNAPSHOT_EVERY
+            ):
+                tail = value._buf.items[len(base_log):len(value)]
+                type_, blob = self.serde.dumps_typed(tail)
+                self._remember(key, version, value, depth + 1)
+                return "delta", type_, blob, base_version
+
+        type_, blob = self.serde.dumps_typed(value.to_list())
+        self._remember(key, version, value, 0)
+        return "msglog", type_, blob, None
+
+    def _load_blob(self, thread_id, ns, channel, version):
+        """ 读取某个通道某个版本的值；增量的话顺着 base_version 往回拼 """
+        tails = []
+        current = version
+        while True:
+            row = self.conn.execute(
+                "SELECT kind, type, blob, base_version FROM blobs "
+                "WHERE thread_id=? AND checkpoint_ns=? AND channel=? AND version=?",
+                (thread_id, ns, channel, current),
+            ).fetchone()
+            if row is None:
+                return None, False
+            kind, type_, blob, base_version = row
+            if kind == "empty":
+                return None, False
+            if kind == "full":
+                return self.serde.loads_typed((type_, blob)), True
+            if kind == "msglog":
+                log = MessageLog(self.serde.loads_typed((type_, blob)))
+                break
+            tails.append(self.serde.loads_typed((type_, blob)))
+            current = base_version
+
+        for tail in reversed(tails):
+            log = log.extend(tail)
+        # 记下来：从这里恢复运行后，新版本可以继续只存增量
+        self._remember((thread_id, ns, channel), version, log, len(tails))
+        return log, True
+
+    def _load_channel_values(self, thread_id, ns, versions):
+        values = {}
+        for channel, version in versions.items():
+            value, found = self._load_blob(thread_id, ns, channel, str(version))
+            if found:
+                values[channel] = value
+        return values
+
+    # ------------------------------------------------------------------
+    # BaseCheckpointSaver 接口
+    # ------------------------------------------------------------------
+    def _make_tuple(self, thread_id, ns, row):
+        checkpoint_id, parent_id, c_type, c_blob, m_type, m_blob = row
+        checkpoint = self.serde.loads_typed((c_type, c_blob))
+        checkpoint["channel_values"] = self._load_channel_values(
+            thread_id, ns, checkpoint["channel_versions"]
+        )
+        writes = self.conn.execute(
+            "SELECT task_id, channel, type, blob FROM writes "
+            "WHERE thread_id=? AND checkpoint_ns=? AND checkpoint_id=? ORDER BY task_id, idx",
+            (thread_id, ns, checkpoint_id),
+        ).fetchall()
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": ns, "checkpoint_id": checkpoint_id}},
+            checkpoint=checkpoint,
+            metadata=self.serde.loads_typed((m_type, m_blob)),
+            parent_config=(
+                {"configurable": {"thread_id": thread_id, "checkpoint_ns": ns, "checkpoint_id": parent_id}}
+                if parent_id
+                else None
+            ),
+            pending_writes=[(task_id, channel, self.serde.loads_typed((t, b))) for task_id, channel, t, b in writes],
+        )
+
+    def get_tuple(self, config):
+        thread_id = config["configurable"]["thread_id"]
+        ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+        with self.lock:
+            if checkpoint_id:
+                row = self.conn.execute(
+                    "SELECT checkpoint_id, parent_checkpoint_id, checkpoint_type, checkpoint, metadata_type, metadata "
+                    "FROM checkpoints WHERE thread_id=? AND checkpoint_ns=? AND checkpoint_id=?",
+                    (thread_id, ns, checkpoint_id),
+                ).fetchone()
+            else:
+                row = self.conn.execute(
+                    "SELECT checkpoint_id, parent_checkpoint_id, checkpoint_type, checkpoint, metadata_type, metadata "
+                    "FROM checkpoints WHERE thread_id=? AND checkpoint_ns=? ORDER BY checkpoint_id DESC LIMIT 1",
+                    (thread_id, ns),
+                ).fetchone()
+            if row is None:
+                return None
+            return self._make_tuple(thread_id, ns, row)
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        sql = (
+            "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, checkpoint_type, checkpoint, "
+            "metadata_type, metadata FROM checkpoints"
+        )
+        where, params = [], []
+        if config:
+            where.append("thread_id=?")
+            params.append(config["configurable"]["thread_id"])
+            if config["configurable"].get("checkpoint_ns") is not None:
+                where.append("checkpoint_ns=?")
+                params.append(config["configurable"]["checkpoint_ns"])
+            if checkpoint_id := get_checkpoint_id(config):
+                where.append("checkpoint_id=?")
+                params.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            where.append("checkpoint_id<?")
+            params.append(before_id)
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY checkpoint_id DESC"
+
+        with self.lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        for thread_id, ns, *row in rows:
+            if limit is not None and limit <= 0:
+                break
+            if filter:
+                metadata = self.serde.loads_typed((row[4], row[5]))
+                if not all(metadata.get(k) == v for k, v in filter.items()):
+                    continue
+            if limit is not None:
+                limit -= 1
+            with self.lock:
+                item = self._make_tuple(thread_id, ns, row)
+            yield item
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        c = checkpoint.copy()
+        thread_id = config["configurable"]["thread_id"]
+        ns = config["configurable"].get("checkpoint_ns", "")
+        values = c.pop("channel_values")
+        with self.lock, self.conn:
+            # 只保存版本号变了的通道
+            for channel, version in new_versions.items():
+                if channel in values:
+                    kind, type_, blob, base = self._dump_blob(thread_id, ns, channel, str(version), values[channel])
+                else:
+                    kind, type_, blob, base = "empty", None, None, None
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (thread_id, ns, channel, str(version), kind, type_, blob, base),
+                )
+            c_type, c_blob = self.serde.dumps_typed(c)
+            m_type, m_blob = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+            self.conn.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (thread_id, ns, checkpoint["id"], config["configurable"].get("checkpoint_id"),
+                 c_type, c_blob, m_type, m_blob),
+            )
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": ns, "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        thread_id = config["configurable"]["thread_id"]
+        ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        with self.lock, self.conn:
+            for idx, (channel, value) in enumerate(writes):
+                idx = WRITES_IDX_MAP.get(channel, idx)
+                if isinstance(value, MessageLog):
+                    value = value.to_list()
+                type_, blob = self.serde.dumps_typed(value)
+                # 普通写入已经存在就不覆盖（和 InMemorySaver 一致），特殊写入（错误/中断等）总是覆盖
+                verb = "INSERT OR REPLACE" if idx < 0 else "INSERT OR IGNORE"
+                self.conn.execute(
+                    f"{verb} INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (thread_id, ns, checkpoint_id, task_id, idx, channel, type_, blob, task_path),
+                )
+
+    def delete_thread(self, thread_id):
+        with self.lock, self.conn:
+            for table in ("checkpoints", "blobs", "writes"):
+                self.conn.execute(f"DELETE FROM {table} WHERE thread_id=?", (thread_id,))
+            for key in [k for k in self._last_logs if k[0] == thread_id]:
+                del self._last_logs[key]
+
+    def get_next_version(self, current, channel):
+        # 和 InMemorySaver 一样：整数部分递增，后面拼一个随机数
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    # ---- 异步版本：SQLite 本地读写很快，直接复用同步实现 ----
+    async def aget_tuple(self, config):
+        return self.get_tuple(config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        for item in self.list(config, filter=filter, before=before, limit=limit):
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return self.put(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        return self.put_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        return self.delete_thread(thread_id)
+
+
+_savers = {}
+_savers_lock = threading.Lock()
+
+
+def get_checkpointer(path: str = DEFAULT_DB_PATH) -> SqliteDeltaSaver:
+    """ 同一个数据库文件在进程里只打开一次 """
+    with _savers_lock:
+        if path not in _savers:
+            _savers[path] = SqliteDeltaSaver(path)
+        return _savers[path]
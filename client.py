@@ -1,22 +1,103 @@
+import json
+import sys
 from langserve import RemoteRunnable
 
+SERVER_URL = "http://localhost:8000"
+
 # 链接到我们刚刚启动的服务
-remote_agent = RemoteRunnable("http://localhost:8000/agent")
+remote_agent = RemoteRunnable(f"{SERVER_URL}/agent")
+
+
+# =============================================================================
+# 批量模式：调用服务端的 /agent/batch，结果按完成顺序一条条流回来
+# =============================================================================
+def run_batch(questions, session_ids=None, max_concurrency=8, server_url=SERVER_URL, timeout=None):
+    """
+    批量提交问题，逐条 yield 结果（dict）。
+    - questions: 问题列表
+    - session_ids: 可选，和 questions 一一对应；不传就是无记忆的独立任务
+    - 最后一条是汇总：{"summary": {...}}
+    """
+    import httpx
+
+    items = []
+    for i, question in enumerate(questions):
+        item = {"input": question, "id": str(i)}
+        if session_ids is not None and session_ids[i]:
+            item["session_id"] = session_ids[i]
+        items.append(item)
+
+    payload = {"items": items, "max_concurrency": max_concurrency}
+    with httpx.Client(timeout=timeout) as client:
+        with client.stream("POST", f"{server_url}/agent/batch", json=payload) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if line.strip():
+                    yield json.loads(line)
+
+
+def run_batch_file(input_path, output_path, max_concurrency=8):
+    """
+    从文件读取问题（每行一个；也可以是 JSONL，每行 {"input": ..., "session_id": ...}），
+    结果写到 output_path（JSONL），失败的条目会单独统计。
+    """
+    questions, session_ids = [], []
+    with open(input_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                data = json.loads(line)
+                questions.append(data["input"])
+                session_ids.append(data.get("session_id"))
+            else:
+                questions.append(line)
+                session_ids.append(None)
+
+    print(f"📦 共 {len(questions)} 个问题，并发 {max_concurrency}，开始批量提交...")
+    summary = None
+    with open(output_path, "w", encoding="utf-8") as out:
+        for result in run_batch(questions, session_ids, max_concurrency=max_concurrency):
+            if "summary" in result:
+                summary = result["summary"]
+                continue
+            result["input"] = questions[result["index"]]
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            mark = "✅" if result["ok"] else "❌"
+            print(f"{mark} #{result['index']} ({result['latency_s']}s)")
+
+    if summary:
+        print(f"\n完成：成功 {summary['succeeded']}，失败 {summary['failed']}，"
+              f"耗时 {summary['elapsed_s']}s，吞吐 {summary['throughput_per_s']} 条/秒")
+    return summary
+
+
+def demo():
+    print("========== 第一轮对话 ==========")
+    # 像调用本地 chain 一样调用它
+    response = remote_agent.invoke(
+        "我叫小明，今年5岁。",
+        config={"configurable": {"session_id": "user_web_123"}},
+    )
+
+    print(f"AI: {response}")
 
-print("========== 第一轮对话 ==========")
-# 像调用本地 chain 一样调用它
-response = remote_agent.invoke(
-    "我叫小明，今年5岁。",
-    config={"configurable": {"session_id": "user_web_123"}},
-)
 
-print(f"AI: {response}")
+    print("========== 第二轮对话（测试记忆） ==========")
+    response = remote_agent.invoke(
+        "我今年几岁？",
+        config={"configurable": {"session_id": "user_web_123"}},
+    )
+    print(f"AI: {response}")
+    # print(response["output"])   # AgentExecutor 返回的是一个字典，我们要取 output
 
 
-print("========== 第二轮对话（测试记忆） ==========")
-response = remote_agent.invoke(
-    "我今年几岁？",
-    config={"configurable": {"session_id": "user_web_123"}},
-)
-print(f"AI: {response}")
-# print(response["output"])   # AgentExecutor 返回的是一个字典，我们要取 output
\ No newline at end of file
+if __name__ == "__main__":
+    # 批量模式：python client.py --batch questions.txt [results.jsonl] [并发数]
+    if len(sys.argv) > 2 and sys.argv[1] == "--batch":
+        output = sys.argv[3] if len(sys.argv) > 3 else "batch_results.jsonl"
+        concurrency = int(sys.argv[4]) if len(sys.argv) > 4 else 8
+        run_batch_file(sys.argv[2], output, max_concurrency=concurrency)
+    else:
+        demo()
@@ -0,0 +1,243 @@
+"""
+检索结果压缩：把检索回来的片段塞进 prompt 之前先"瘦身"
+
+retriever 返回的 500 字片段直接拼进 {context} 会有很多浪费：
+- chunk_overlap 让相邻片段有 50 字是重复的，同一页的相邻片段经常一起被检索到
+- 一个片段里往往只有一两句话和问题有关
+
+compress_stage() 返回一个放在 prompt（或 budget_stage）前面的 Runnable，做三件事：
+1. 去重：内容完全一样的片段只留一个
+2. 合并：同一个文件、同一页、位置重叠或相邻的片段合并成一段（需要切分时 add_start_index=True）
+3. 过滤：按句子切开，用 embedding 算每句和问题的相似度，低于阈值的句子去掉
+   （被去掉的句子用 "……" 标出来，避免把不相邻的两句话读成连续的）
+
+片段顺序保持 retriever 的相关度顺序（合并后的片段按其中排名最高的那个算）。
+
+用法：
+    chain = (
+        RunnablePassthrough.assign(docs=itemgetter("input") | retriever)
+        | compress_stage(embeddings)
+        | budget_stage(prompt, docs_key="docs", ...)
+        | prompt | llm
+    )
+"""
+import math
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from langchain_core.documents import Document
+from langchain_core.runnables import RunnableLambda
+
+from metrics import REGISTRY
+
+# 句子和问题的最低相似度（余弦），低于它的句子会被去掉；设成 0 只做去重合并
+CONTEXT_MIN_RELEVANCE = float(os.getenv("CONTEXT_MIN_RELEVANCE", "0.3"))
+# 句子（和问题）embedding 的进程内缓存条数（同一份文档的句子会被反复检索到，同一个问题会被反复问到）
+_SENTENCE_CACHE_SIZE = int(os.getenv("CONTEXT_SENTENCE_CACHE_SIZE", "4096"))
+# 比这个还短的碎片（标题、编号）不单独成句，跟着相邻的句子走
+_MIN_SENTENCE_CHARS = 6
+_GAP_MARK = "……"
+
+# 在中英文句末标点和换行后面切开，标点留在句子里
+_SENTENCE_END = re.compile(r"(?<=[。！？!?；;\n])")
+
+CONTEXT_CHARS = REGISTRY.counter(
+    "context_compression_chars_total", "检索上下文的字符数（before 压缩前 / after 压缩后）", ("stage",)
+)
+CONTEXT_DROPPED = REGISTRY.counter(
+    "context_compression_dropped_total", "压缩时去掉的条目数（chunk 重复/合并掉的片段，sentence 不相关的句子）", ("part",)
+)
+
+
+# ============================================================================
+# 1. 去重 + 合并
+# ============================================================================
+def merge_chunks(docs: list[Document]) -> list[Document]:
+    """ 去掉重复片段，把同一页里重叠 / 相邻的片段合并；返回的顺序按原来的排名 """
+    seen = set()
+    unique = []
+    for rank, doc in enumerate(docs):
+        if doc.page_content in seen:
+            continue
+        seen.add(doc.page_content)
+        unique.append((rank, doc))
+
+    # 按 (文件, 页码) 分组，没有 start_index 的片段没法判断位置，单独成组
+    groups = {}
+    for rank, doc in unique:
+        start = doc.metadata.get("start_index")
+        key = (doc.metadata.get("source"), doc.metadata.get("page")) if start is not None else ("#", rank)
+        groups.setdefault(key, []).append((rank, doc))
+
+    merged = []
+    for members in groups.values():
+        members.sort(key=lambda item: item[1].metadata.get("start_index") or 0)
+        best_rank, current = members[0]
+        count = 1
+        for rank, doc in members[1:]:
+            cur_start = current.metadata["start_index"]
+            cur_end = cur_start + len(current.page_content)
+            start = doc.metadata["start_index"]
+            if start > cur_end:
+                # 中间隔着没检索到的内容，不能合并
+                merged.append((best_rank, current, count))
+                best_rank, current, count = rank, doc, 1
+                continue
+            end = start + len(doc.page_content)
+            if end > cur_end:
+                text = current.page_content + doc.page_content[cur_end - start:]
+                current = Document(page_content=text, metadata=dict(current.metadata))
+            best_rank = min(best_rank, rank)
+            count += 1
+        merged.append((best_rank, current, count))
+
+    merged.sort(key=lambda item: item[0])
+    result = []
+    for _, doc, count in merged:
+        if count > 1:
+            doc = Document(page_content=doc.page_content, metadata={**doc.metadata, "merged_chunks": count})
+        result.append(doc)
+    return result
+
+
+# ============================================================================
+# 2. 按句子过滤
+# ============================================================================
+def split_sentences(text: str) -> list[str]:
+    """ 按句末标点切开；太短的碎片（标题、编号、单独的标点）并到前一句里 """
+    sentences = []
+    for piece in _SENTENCE_END.split(text):
+        if not piece.strip():
+            continue
+        if sentences and (len(piece.strip()) < _MIN_SENTENCE_CHARS or len(sentences[-1].strip()) < _MIN_SENTENCE_CHARS):
+            sentences[-1] += piece
+        else:
+            sentences.append(piece)
+    return sentences
+
+
+def _cosine(a, b) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class SentenceFilter:
+    """ 用 embedding 给句子打分，去掉和问题不相关的句子 """
+
+    def __init__(self, embeddings, threshold: float = CONTEXT_MIN_RELEVANCE):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _lookup(self, keys: list) -> dict:
+        with self._lock:
+            found = {}
+            for key in keys:
+                vector = self._cache.get(key)
+                if vector is not None:
+                    self._cache.move_to_end(key)
+                    found[key] = vector
+            return found
+
+    def _store(self, vectors: dict):
+        with self._lock:
+            self._cache.update(vectors)
+            while len(self._cache) > _SENTENCE_CACHE_SIZE:
+                self._cache.popitem(last=False)
+
+    def _embed_sentences(self, sentences: list[str]) -> list[list[float]]:
+        """ 只对没见过的句子调用 embedding 接口（一次批量请求，不在锁里调用） """
+        vectors = self._lookup(list(dict.fromkeys(sentences)))
+        missing = [s for s in dict.fromkeys(sentences) if s not in vectors]
+        if missing:
+            fresh = dict(zip(missing, self.embeddings.embed_documents(missing)))
+            self._store(fresh)
+            # 直接用刚算出来的向量，不再回缓存里取（可能已经被别的线程挤出去了）
+            vectors.update(fresh)
+        return [vectors[s] for s in sentences]
+
+    def _embed_query(self, query: str) -> list[float]:
+        """ 问题的向量也放进同一个 LRU（key 加前缀，和同样文字的句子区分开：query / document 的向量不一样） """
+        key = ("query", query)
+        vector = self._lookup([key]).get(key)
+        if vector is None:
+            vector = self.embeddings.embed_query(query)
+            self._store({key: vector})
+        return vector
+
+    def __call__(self, query: str, docs: list[Document]) -> list[Document]:
+        if self.threshold <= 0 or not docs:
+            return docs
+        doc_sentences = [split_sentences(d.page_content) for d in docs]
+        scored = [s for sentences in doc_sentences for s in sentences]
+        if not scored:
+            return docs
+
+        query_vector = self._embed_query(query)
+        scores = dict(zip(scored, (_cosine(query_vector, v) for v in self._embed_sentences(scored))))
+        best = max(scores, key=scores.get)
+
+        result = []
+        dropped = 0
+        for doc, sentences in zip(docs, doc_sentences):
+            parts = []
+            skipped = False
+            for s in sentences:
+                # 全局最相关的那句无论如何都保留，保证上下文不会被滤空
+                if scores[s] >= self.threshold or s == best:
+                    if skipped and parts:
+                        parts.append(_GAP_MARK)
+                    parts.append(s)
+                    skipped = False
+                else:
+                    skipped = True
+                    dropped += 1
+            if parts:
+                result.append(Document(page_content="".join(parts).strip(), metadata=doc.metadata))
+        if dropped:
+            CONTEXT_DROPPED.inc(dropped, part="sentence")
+        return result
+
+
+# ============================================================================
+# 3. 串成一个 stage
+# ============================================================================
+class ContextCompressor:
+    """
+    embeddings：和向量库用同一个 embedding 模型（相似度才有可比性）
+    threshold：句子相似度阈值，<=0 时只做去重合并，不调用 embedding
+    query_key / docs_key：输入里问题和检索结果的 key，压缩后的结果写回 docs_key
+    """
+
+    def __init__(self, embeddings, threshold: float = CONTEXT_MIN_RELEVANCE, *,
+                 query_key: str = "input", docs_key: str = "docs"):
+        self.sentence_filter = SentenceFilter(embeddings, threshold)
+        self.query_key = query_key
+        self.docs_key = docs_key
+
+    def compress(self, query: str, docs: list[Document]) -> list[Document]:
+        before = sum(len(d.page_content) for d in docs)
+        merged = merge_chunks(docs)
+        if len(merged) < len(docs):
+            CONTEXT_DROPPED.inc(len(docs) - len(merged), part="chunk")
+        try:
+            compressed = self.sentence_filter(query, merged)
+        except Exception as e:
+            # embedding 接口出问题时不影响回答，只是少压缩一步
+            print(f"⚠️ 句子过滤失败，使用合并后的片段: {e}")
+            compressed = merged
+        CONTEXT_CHARS.inc(before, stage="before")
+        CONTEXT_CHARS.inc(sum(len(d.page_content) for d in compressed), stage="after")
+        return compressed
+
+    def __call__(self, inputs: dict) -> dict:
+        return {**inputs, self.docs_key: self.compress(inputs[self.query_key], inputs.get(self.docs_key) or [])}
+
+
+def compress_stage(embeddings, threshold: float = CONTEXT_MIN_RELEVANCE, **kwargs) -> RunnableLambda:
+    """ 返回放在 prompt 前面的 Runnable，参数见 ContextCompressor """
+    return RunnableLambda(ContextCompressor(embeddings, threshold, **kwargs), name="context_compression")
@@ -2,6 +2,7 @@ import os
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
+from llm_cache import cache_if_deterministic
 
 # 加载环境变量
 load_dotenv()
@@ -20,6 +21,8 @@ llm = ChatOpenAI(
     model="qwen-plus",
     temperature=0 # 控制随机性，0最严谨，1最随机
 )
+# temperature=0 的输出是确定的：同样的 prompt 第二次运行直接读本地缓存（llm_cache.sqlite），不再联网
+llm = cache_if_deterministic(llm)
 
 # --- 核心知识点：PromptTemplate ---
 
@@ -3,6 +3,8 @@ from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 
+from model_cascade import ModelCascade, default_tiers
+
 # 加载环境变量
 load_dotenv()
 
@@ -25,10 +27,22 @@ prompt = ChatPromptTemplate.from_template(template)
 # 这里的"|" 符号就像水管，把左边的输出，直接传给右边作为输入
 chain = prompt | llm 
 
-# 4. 调用链
-# 这里的“狗”会替换掉 prompt 中的 {topic}
-# prompt 生成后传给 llm，llm 生成结果
-response = chain.invoke({"topic": "狗"})
+# 3.1 模型级联版本：先让便宜的 qwen-turbo 讲，讲得太短（没讲出来）再换 qwen-plus
+# （上面的 chain 保留给 batch_jobs.py 离线批量用，它需要直接拿到 ChatOpenAI）
+joke_llm = ModelCascade(
+    default_tiers(temperature=0.7),
+    validator=lambda response: len(response.content.strip()) >= 20,
+    name="joke",
+)
+cascade_chain = prompt | joke_llm
+
+# 离线批量生成：python batch_jobs.py demo_03_simple_chain inputs.jsonl results.jsonl
+# （import 本文件拿 chain 时不会执行下面的调用）
+if __name__ == "__main__":
+    # 4. 调用链
+    # 这里的“狗”会替换掉 prompt 中的 {topic}
+    # prompt 生成后传给 llm，llm 生成结果
+    response = cascade_chain.invoke({"topic": "狗"})
 
-# 5. 打印
-print(f"AI 的回复：{response.content}")
\ No newline at end of file
+    # 5. 打印
+    print(f"AI 的回复（{response.response_metadata['cascade_tier']}）：{response.content}")
\ No newline at end of file
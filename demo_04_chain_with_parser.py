@@ -3,6 +3,7 @@ from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
+from stream_parsers import LineListOutputParser
 
 # 加载环境变量
 load_dotenv()
@@ -30,8 +31,20 @@ output_parser = StrOutputParser()
 # Prompt -> LLM（模型）-> OutputParser（解析器）
 chain = prompt | llm | output_parser
 
-# 3. 调用链
-response = chain.invoke({"topic": "猫", "num": 5})
+# 2.1 流式列表版本：把解析器换成 LineListOutputParser
+# chain.stream() 时每写完一行（一个事实）就立刻给出来，下游不用等整段生成完再处理
+list_chain = prompt | llm | LineListOutputParser()
 
-print(f"类型：{type(response)}")
-print(f"内容：\n{response}")
\ No newline at end of file
+# 离线批量生成：python batch_jobs.py demo_04_chain_with_parser inputs.jsonl results.jsonl
+# （import 本文件拿 chain 时不会执行下面的调用）
+if __name__ == "__main__":
+    # 3. 调用链
+    response = chain.invoke({"topic": "猫", "num": 5})
+
+    print(f"类型：{type(response)}")
+    print(f"内容：\n{response}")
+
+    # 4. 流式列表：每个事实一写完就打印（第一条出来的时候，模型还在写后面的）
+    print("\n========== 流式逐条输出 ==========")
+    for i, [fact] in enumerate(list_chain.stream({"topic": "猫", "num": 5}), start=1):
+        print(f"第 {i} 条：{fact}")
\ No newline at end of file
@@ -1,4 +1,6 @@
 import os
+import sys
+import time
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
@@ -47,8 +49,59 @@ full_chain = {"gree": chain_1 | chain_2  } | chain_3
 # 也可以这样写：但需要把 chain_1 后面所有的chain的变量都改成{input}--这是规定：前面链的输出为后面链的输入，后面链的输入为{input}
 # full_chain = chain_1 | chain_2 | chain_3  
 
-# ---- 调用完整链条 ----
-print("正在评价这个翻译的信、达、雅程度...")
-# 我们只需要给最开始的 chain_1 传入 word 即可
-result = full_chain.invoke({"word": "panda"})
-print(result)
\ No newline at end of file
+# ---- 离线批处理：三步拆成三个阶段，每个阶段提交一次 Batch 任务 ----
+# python batch_jobs.py demo_05_sequential_chain words.jsonl results.jsonl（words.jsonl 每行 {"word": "..."}）
+# 每个阶段：(这一步的链, 根据上一步的输出和原始输入构造这一步的输入)
+BATCH_STAGES = [
+    (chain_1, lambda prev, original: original),
+    (chain_2, lambda prev, original: {"line": prev}),
+    (chain_3, lambda prev, original: {"gree": prev}),
+]
+
+# ---- 批量模式：很多单词一起跑 ----
+# 一个单词要串行调 3 次 LLM，一个一个跑的话几千个单词要等很久。
+# batch_as_completed 会用线程池同时跑多个单词（max_concurrency 控制同时在跑的数量，别把接口打爆），
+# 哪个先跑完就先返回哪个，不用等最慢的那个。
+def run_batch(words, max_concurrency=8):
+    """
+    批量处理单词，按完成顺序逐个 yield (下标, 单词, 结果或异常)。
+    单个单词失败不影响其他单词（返回的是异常对象）。
+    """
+    inputs = [{"word": word} for word in words]
+    for index, result in full_chain.batch_as_completed(
+        inputs, config={"max_concurrency": max_concurrency}, return_exceptions=True
+    ):
+        yield index, words[index], result
+
+
+def run_batch_report(words, max_concurrency=8):
+    """ 跑一批单词并打印进度和吞吐量，返回 {下标: 结果} """
+    print(f"📦 共 {len(words)} 个单词，并发 {max_concurrency}，开始批量处理...")
+    results, failed = {}, 0
+    start = time.perf_counter()
+    for done, (index, word, result) in enumerate(run_batch(words, max_concurrency), start=1):
+        results[index] = result
+        if isinstance(result, Exception):
+            failed += 1
+            print(f"❌ [{done}/{len(words)}] {word}: {result}")
+        else:
+            print(f"✅ [{done}/{len(words)}] {word}")
+
+    elapsed = time.perf_counter() - start
+    print(f"\n完成：成功 {len(words) - failed}，失败 {failed}，耗时 {elapsed:.1f}s，"
+          f"吞吐 {len(words) / elapsed:.2f} 个/秒（{3 * len(words) / elapsed:.2f} 次 LLM 调用/秒）")
+    return results
+
+
+if __name__ == "__main__":
+    # 批量模式：python demo_05_sequential_chain.py words.txt [并发数]（每行一个单词）
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], "r", encoding="utf-8") as f:
+            words = [line.strip() for line in f if line.strip()]
+        run_batch_report(words, int(sys.argv[2]) if len(sys.argv) > 2 else 8)
+    else:
+        # ---- 调用完整链条 ----
+        print("正在评价这个翻译的信、达、雅程度...")
+        # 我们只需要给最开始的 chain_1 传入 word 即可
+        result = full_chain.invoke({"word": "panda"})
+        print(result)
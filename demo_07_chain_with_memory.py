@@ -9,6 +9,8 @@ from langchain_core.runnables.history import RunnableWithMessageHistory
 from langchain_core.chat_history import InMemoryChatMessageHistory
 from langchain_core.messages import BaseMessage, messages_from_dict, messages_to_dict
 
+from prompt_budget import budget_stage
+
 load_dotenv()
 api_key = os.environ.get("OPENAI_API_KEY")
 base_url = os.environ.get("DASHSCOPE_BASE_URL")
@@ -30,7 +32,8 @@ prompt = ChatPromptTemplate.from_messages([
 ])
 
 # ---- 2. 定义链 ----
-chain = prompt | llm | StrOutputParser()
+# budget_stage 在发给 LLM 之前数一下 token，历史太长就先丢掉最早的几轮
+chain = budget_stage(prompt, name="demo_07", history_key="messages") | prompt | llm | StrOutputParser()
 
 # ---- 3. 定义一个“获取历史记录”的函数 ----
 # 这是一个工厂函数，根据 session_id 返回对应的历史对象
@@ -266,50 +269,51 @@ memorized_chain = RunnableWithMessageHistory(
 )
 
 # ---- 5. 调用有记忆的链 ----
-print("第一次对话：")
-res1 = memorized_chain.invoke(
-    {"input": "你好，我叫小米，今年5岁，我喜欢吃苹果。"},
-    config = {"configurable": {"session_id": "user_123"}} # 必须传 session_id
-)
-print(f"AI: {res1}")
-
-print("\n第二次对话：")
-res2 = memorized_chain.invoke(
-    {"input": "我叫什么名字？"},
-    config = {"configurable": {"session_id": "user_123"}} # 同一个 session_id
-)
-print(f"AI: {res2}")
-
-print("\n第三次对话（新用户）：")
-res3 = memorized_chain.invoke(
-    {"input": "我叫什么名字？"},
-    config = {"configurable": {"session_id": "user_456"}} # 新的 session_id
-)
-print(f"AI: {res3}（因为是新用户，AI 不知道你是谁）")
-
-print("\n第四次对话：")
-res4 = memorized_chain.invoke(
-    {"input": "我今年几岁？"},
-    config = {"configurable": {"session_id": "user_123"}} # 同一个 session_id
-)
-print(f"AI: {res4}")
-
-print("\n第五次对话：")
-res5 = memorized_chain.invoke(
-    {"input": "我喜欢吃什么？"},
-    config = {"configurable": {"session_id": "user_123"}} # 同一个 session_id
-)
-print(f"AI: {res5}")
-
-# 查看会话统计
-print("\n所有会话统计：")
-stats = get_all_session_stats()
-for session_id, stat in stats.items():
-    print(f"会话 {session_id}: {stat['message_count']} 条消息，"
-          f"创建于 {stat['created_at']}，更新于 {stat['updated_at']}")
-
-# 查看特定会话信息
-print("\n==== 特定会话信息 ====")
-history_user_123 = get_session_history("user_123")
-session_info = history_user_123.get_session_info()
-print(f"会话 user_123 信息: {session_info}")
\ No newline at end of file
+if __name__ == "__main__":
+    print("第一次对话：")
+    res1 = memorized_chain.invoke(
+        {"input": "你好，我叫小米，今年5岁，我喜欢吃苹果。"},
+        config = {"configurable": {"session_id": "user_123"}} # 必须传 session_id
+    )
+    print(f"AI: {res1}")
+
+    print("\n第二次对话：")
+    res2 = memorized_chain.invoke(
+        {"input": "我叫什么名字？"},
+        config = {"configurable": {"session_id": "user_123"}} # 同一个 session_id
+    )
+    print(f"AI: {res2}")
+
+    print("\n第三次对话（新用户）：")
+    res3 = memorized_chain.invoke(
+        {"input": "我叫什么名字？"},
+        config = {"configurable": {"session_id": "user_456"}} # 新的 session_id
+    )
+    print(f"AI: {res3}（因为是新用户，AI 不知道你是谁）")
+
+    print("\n第四次对话：")
+    res4 = memorized_chain.invoke(
+        {"input": "我今年几岁？"},
+        config = {"configurable": {"session_id": "user_123"}} # 同一个 session_id
+    )
+    print(f"AI: {res4}")
+
+    print("\n第五次对话：")
+    res5 = memorized_chain.invoke(
+        {"input": "我喜欢吃什么？"},
+        config = {"configurable": {"session_id": "user_123"}} # 同一个 session_id
+    )
+    print(f"AI: {res5}")
+
+    # 查看会话统计
+    print("\n所有会话统计：")
+    stats = get_all_session_stats()
+    for session_id, stat in stats.items():
+        print(f"会话 {session_id}: {stat['message_count']} 条消息，"
+              f"创建于 {stat['created_at']}，更新于 {stat['updated_at']}")
+
+    # 查看特定会话信息
+    print("\n==== 特定会话信息 ====")
+    history_user_123 = get_session_history("user_123")
+    session_info = history_user_123.get_session_info()
+    print(f"会话 user_123 信息: {session_info}")
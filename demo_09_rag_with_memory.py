@@ -13,6 +13,9 @@ from operator import itemgetter
 
 from datetime import datetime
 
+from context_compression import compress_stage
+from prompt_budget import budget_stage
+
 # ---- 引入 Day 3 的文件存储逻辑 ----
 # 这里为了代码简洁，我们把之前的 FileChatMessageHistory 类直接拿过来用
 # 在实际开发中，应该把它放在单独的 utils.py 文件里导入
@@ -220,7 +223,8 @@ print(f"PDF 加载完成，共 {len(docs)} 页。")
 text_splitter = RecursiveCharacterTextSplitter(
     chunk_size=500,     # 每块 500 字
     chunk_overlap=50,    # 块重叠 50 字，防止语义断裂
-    separators=["\n\n", "\n", "。", "！", "？", "；", "，", " ", ""] # 优先按段落切分
+    separators=["\n\n", "\n", "。", "！", "？", "；", "，", " ", ""], # 优先按段落切分
+    add_start_index=True  # 记录每块在页内的位置，压缩时用来合并重叠 / 相邻的块
 )
 
 # 执行切分
@@ -256,11 +260,14 @@ def format_docs(docs):
 rag_chain = (
     RunnablePassthrough.assign(
         # itemgetter("input") 提取输入
-        # | retriever 进行检索（这一步输出的是 List）
-        # | format_docs 把 List 变成 String
+        # | retriever 进行检索（这一步输出的是 List，按相关度排好序）
         # 注意：这里全程都是 LangChain 对象或函数的组合，符合 LCEL 规范
-        context=itemgetter("input") | retriever | format_docs                                   
+        docs=itemgetter("input") | retriever
     )
+    # 去掉重复的块、合并同一页相邻的块、去掉和问题不相关的句子
+    | compress_stage(embeddings)
+    # 数一下 token：超出预算时先丢最早的历史，再丢排在最后的片段，然后用 format_docs 拼成 context
+    | budget_stage(prompt, name="demo_09", history_key="history", docs_key="docs", format_docs=format_docs)
     | prompt
     | llm
     | StrOutputParser()
@@ -276,19 +283,19 @@ full_chain = RunnableWithMessageHistory(
 )
 
 # -------- 测试 --------
-
-print("========== 第一轮对话 ==========")
-res1 = full_chain.invoke(
-    {"input": "我想在15天内完成必做作业，不做选做作业，帮我安排"},
-    config={"configurable": {"session_id": "user_123"}}
-)
-print(f"AI: {res1}")
-
-# print("========== 第二轮对话（测试 Memory + RAG 结合） ==========")
-# # 注意：这里没有提“年假”两个字，只说了“满十年”
-# # AI 必须集合 Memory（知道我们在聊年假） 和 RAG（知道满十年的规则） 才能给出正确的答案
-# res2 = full_chain.invoke(
-#     {"input": "我想？"},
-#     config={"configurable": {"session_id": "user_789"}}
-# )
-# print(f"AI: {res2}")
\ No newline at end of file
+if __name__ == "__main__":
+    print("========== 第一轮对话 ==========")
+    res1 = full_chain.invoke(
+        {"input": "我想在15天内完成必做作业，不做选做作业，帮我安排"},
+        config={"configurable": {"session_id": "user_123"}}
+    )
+    print(f"AI: {res1}")
+
+    # print("========== 第二轮对话（测试 Memory + RAG 结合） ==========")
+    # # 注意：这里没有提“年假”两个字，只说了“满十年”
+    # # AI 必须集合 Memory（知道我们在聊年假） 和 RAG（知道满十年的规则） 才能给出正确的答案
+    # res2 = full_chain.invoke(
+    #     {"input": "我想？"},
+    #     config={"configurable": {"session_id": "user_789"}}
+    # )
+    # print(f"AI: {res2}")
@@ -11,15 +11,15 @@ from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_community.embeddings import DashScopeEmbeddings
 from langchain_community.vectorstores import FAISS
 from langchain_text_splitters import RecursiveCharacterTextSplitter
+from graph_profiler import profiler_callbacks
   
 load_dotenv()
 api_key = os.getenv("OPENAI_API_KEY")
 base_url = os.getenv("DASHSCOPE_BASE_URL")
 
-os.environ["LANGCHAIN_TRACING_V2"] = "true"
-os.environ["LANGSMITH_ENDPOINT"] = "https://api.smith.langchain.com"
-os.environ["LANGCHAIN_API_KEY"] = "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" # From https://smith.langchain.com
-os.environ["LANGCHAIN_PROJECT"] = "xwg"
+# 不再在代码里写死 LangSmith 的地址和 API Key（Key 不能提交到代码里）。
+# 设置了 GRAPH_PROFILE_PATH 时用本地的 GraphProfiler 记录每个节点的耗时 / token，不联网：python graph_profiler.py 查看报告。
+# 如果还想用 LangSmith，在 .env 里配置 LANGCHAIN_TRACING_V2 / LANGCHAIN_API_KEY / LANGCHAIN_PROJECT 即可。
 
 
 llm = ChatOpenAI(
@@ -101,7 +101,11 @@ print("========== 测试：复杂的混合问题 ==========")
 # 2. 再调用 multiply 计算 10 * 5 = 50
 # response = agent_executor.invoke({"input": "公司规定满十年的年假是多少天？如果我有 22 个同事，一共有多少天年假？"})
 
-response = agent.invoke({"messages": [{"role": "user", "content": "公司规定满十年的年假是多少天？如果我有 10 个同事，2个5年工龄，3个10年工龄，一共有多少天年假？"}]})
+response = agent.invoke(
+    {"messages": [{"role": "user", "content": "公司规定满十年的年假是多少天？如果我有 10 个同事，2个5年工龄，3个10年工龄，一共有多少天年假？"}]},
+    # run_name：报告里这次运行的图显示为 demo_10
+    config={"callbacks": profiler_callbacks(), "run_name": "demo_10"},
+)
 final_msg = response["messages"][-1]
 
 print("\n========== 最终答案 ==========")
@@ -1,4 +1,5 @@
 import os
+import uuid
 from dotenv import load_dotenv
 from typing import Annotated, TypedDict
 from langchain_openai import ChatOpenAI
@@ -6,6 +7,11 @@ from langchain_core.messages import HumanMessage
 from langchain_core.tools import tool
 from langgraph.graph import StateGraph, END
 from langgraph.prebuilt import ToolNode
+from message_state import append_messages
+from checkpoint_store import get_checkpointer
+from llm_cache import cache_if_deterministic
+from graph_profiler import profiler_callbacks
+from fast_router import FastRouter
 
 # ============================================================================
 # 1. 定义 Tools（和之前一样）
@@ -28,7 +34,8 @@ tools = [multiply, query_company_manual]
 # 这个类定义了我们在图里传递的数据结构
 class AgentState(TypedDict):
     # message 是一个列表，包含所有历史消息
-    messages: Annotated[list, lambda x, y: x + y]
+    # append_messages：只追加、结构共享，每步 O(1)，不像 x + y 每次复制整个列表
+    messages: Annotated[list, append_messages]
 
 # ============================================================================
 # 3. 定义 LLM
@@ -39,6 +46,8 @@ llm = ChatOpenAI(
     model="qwen-plus",
     temperature=0
 )
+# temperature=0：同样的消息 + 同样的工具，直接读本地缓存（llm_cache.sqlite），工具循环里的重复调用也不再联网
+llm = cache_if_deterministic(llm)
 
 # 把工具绑定给 LLM
 llm_with_tools = llm.bind_tools(tools)
@@ -55,6 +64,10 @@ def agent_node(state: AgentState):
     # 返回新的消息列表（原来的 + 新生成的）
     return {"messages": [response]}
 
+# 节点 0：快速路由（入口）
+# 简单的乘法题本地用规则直接算出来、用模板回答，不调用 LLM；其他问题交给 Agent
+fast_router = FastRouter(tools)
+
 # 节点 B：工具执行节点
 # LangGraph 提供了预置的 ToolNode，可以直接用
 tool_node = ToolNode(tools)
@@ -84,9 +97,15 @@ workflow = StateGraph(AgentState)
 # 添加节点
 workflow.add_node("agent", agent_node)
 workflow.add_node("tools", tool_node)
+workflow.add_node("fast_path", fast_router.node)
 
-# 设置入口点
-workflow.set_entry_point("agent")
+# 设置入口点：先过快速路由，回答了就直接结束
+workflow.set_entry_point("fast_path")
+workflow.add_conditional_edges(
+    "fast_path",
+    lambda state: END if fast_router.answered(state) else "agent",
+    {END: END, "agent": "agent"}
+)
 
 # 添加边（Conditional Edge：条件边）
 # 从 agent 出发，根据 should_continue 的结果决定去向
@@ -107,7 +126,8 @@ workflow.add_edge("tools", "agent")
 # 7. 编译并运行
 # ===========================================================================
 
-app = workflow.compile()
+# checkpointer：每个节点跑完都存一个检查点（本地 SQLite），崩溃后可以按 thread_id 接着跑
+app = workflow.compile(checkpointer=get_checkpointer())
 
 # 测试
 print("===== LangGraph Agent 启动 =====")
@@ -122,13 +142,24 @@ inputs = {
 from typing import cast
 safe_inputs = cast(AgentState, inputs)
 
+# 有了 checkpointer 就必须传 thread_id，每次运行用一个新的
+# callbacks：设置了 GRAPH_PROFILE_PATH 时记录每个节点的耗时 / token（python graph_profiler.py 查看报告）
+config = {"configurable": {"thread_id": f"demo11-{uuid.uuid4()}"}, "callbacks": profiler_callbacks()}
+
 # 🌟 stream 打印中间过程，这是 LangGraph 最大的魅力
-for event in app.stream(safe_inputs):  
-    for node_name, node_output in event.items():  # 遍历每个节点
+# stream_mode=["updates", "values"]：一次执行同时拿到节点增量和完整状态，
+# 最后一个 "values" 就是最终状态，不需要再 invoke 重跑一遍（省一半的 LLM 调用）
+final_state = None
+for mode, chunk in app.stream(safe_inputs, config, stream_mode=["updates", "values"]):
+    if mode == "values":
+        final_state = chunk
+        continue
+    for node_name, node_output in chunk.items():  # 遍历每个节点
+        if not node_output:     # 快速路由没接手时没有输出
+            continue
         print(f"----- 节点：{node_name} -----")
         # 打印最新的一条消息
         print(f"输出：{node_output['messages'][-1].content}")
 
 print("===== LangGraph Agent 结束 =====")
-final_state = app.invoke(safe_inputs)
 print(final_state["messages"][-1].content)
\ No newline at end of file
@@ -1,4 +1,5 @@
 import os
+import uuid
 from dotenv import load_dotenv
 from typing import Annotated, TypedDict
 from langchain_openai import ChatOpenAI
@@ -6,6 +7,12 @@ from langchain_core.messages import HumanMessage, AIMessage
 from langchain_core.tools import tool
 from langgraph.graph import StateGraph, END
 from langgraph.prebuilt import ToolNode
+from langgraph.types import Command, interrupt
+from message_state import append_messages
+from checkpoint_store import get_checkpointer
+from llm_cache import cache_if_deterministic
+from graph_profiler import profiler_callbacks
+from fast_router import FastRouter
 
 # ============================================================================
 # 1. 定义 Tools（和之前一样）
@@ -28,7 +35,8 @@ tools = [multiply, query_company_manual]
 # 这个类定义了我们在图里传递的数据结构
 class AgentState(TypedDict):
     # message 是一个列表，包含所有历史消息
-    messages: Annotated[list, lambda x, y: x + y]
+    # append_messages：只追加、结构共享，每步 O(1)，不像 x + y 每次复制整个列表
+    messages: Annotated[list, append_messages]
     human_feedback: str # 新增：用来存人工输入 "approve" 或 "reject"
 
 # ============================================================================
@@ -40,6 +48,8 @@ llm = ChatOpenAI(
     model="qwen-plus",
     temperature=0
 )
+# temperature=0：同样的消息 + 同样的工具，直接读本地缓存（llm_cache.sqlite），工具循环里的重复调用也不再联网
+llm = cache_if_deterministic(llm)
 
 # 把工具绑定给 LLM
 llm_with_tools = llm.bind_tools(tools)
@@ -70,6 +80,11 @@ def agent_node(state: AgentState):
     # 返回新的消息列表（原来的 + 新生成的）
     return {"messages": [response]}
 
+# 节点 0：快速路由（入口）
+# "3乘以3等于多少？" 这种问题本地用规则就能认出来：直接调用 multiply，用模板生成回答，
+# 省掉两次 LLM 调用；认不出来或者把握不大（置信度低）就什么都不做，交给 Agent
+fast_router = FastRouter(tools)
+
 # 节点 B：工具执行节点
 # LangGraph 提供了预置的 ToolNode，可以直接用
 tool_node = ToolNode(tools)
@@ -79,14 +94,15 @@ def human_node(state: AgentState):
     # 获取 Agent 的最后一条回复
     last_message = state["messages"][-1]
 
-    print("\n" + "="*30)
-    print(f"👨‍💻 人工审核阶段")
-    print("="*30)
-    print(f"AI 建议：{last_message.content}")
-    print("-"*30)
-
-    # 模拟等待用户输入（在实际 API 中，这里会挂起流程，等待前端传回 config）
-    user_input = input("请审核（输入'ok' 批准，其他任何内容拒绝）：")
+    # 不再用 input() 卡住整个进程：interrupt() 会把图 "挂起"，
+    # 状态由 checkpointer 存到本地 SQLite，不占 CPU，也不占线程。
+    # 审核人回复后，调用方用 Command(resume=审核意见) 按 thread_id 恢复，
+    # 这时 interrupt() 的返回值就是审核意见，节点从这里继续往下走。
+    # （命令行演示见文件末尾，HTTP 接口见 review_server.py）
+    user_input = interrupt({
+        "question": str(state["messages"][0].content),
+        "proposal": last_message.content,
+    })
 
     # 返回一条 HumanMessage，记录审核意见
     # 这条消息会加入 State，并被 Agent 看到
@@ -138,9 +154,17 @@ workflow = StateGraph(AgentState)
 workflow.add_node("agent", agent_node)
 workflow.add_node("tools", tool_node)
 workflow.add_node("human", human_node) # 🔥 添加人工节点
+workflow.add_node("fast_path", fast_router.node)
+
+# 设置入口点：先过快速路由
+workflow.set_entry_point("fast_path")
 
-# 设置入口点
-workflow.set_entry_point("agent")
+# 快速路由回答了，照样要人工审核；没回答就交给 Agent
+workflow.add_conditional_edges(
+    "fast_path",
+    lambda state: "human" if fast_router.answered(state) else "agent",
+    {"human": "human", "agent": "agent"}
+)
 
 # 添加边（Conditional Edge：条件边）
 # 从 agent 出发，根据 should_continue 的结果决定去向
@@ -177,29 +201,57 @@ workflow.add_conditional_edges(
 # 7. 编译并运行
 # ===========================================================================
 
-app = workflow.compile()
-
-# 测试
-print("===== LangGraph 人机协同 Agent 启动 =====")
-inputs = {
-    "messages": [
-        HumanMessage(content="3乘以3等于多少？")
-    ],
-    "human_feedback": ""    # 初始为空
-}
-
-# 🌟 在 inputs 前面加上 AgentState 进行类型断言
-# 这行代码告诉编辑器：“别管了，我确定这是对的”
-from typing import cast
-safe_inputs = cast(AgentState, inputs)
-
-# 🌟 stream 打印中间过程，这是 LangGraph 最大的魅力
-for event in app.stream(safe_inputs):  
-    for node_name, node_output in event.items():  # 遍历每个节点
-        print(f"----- 节点：{node_name} -----")
-        # 打印最新的一条消息
-        print(f"输出：{node_output['messages'][-1].content}")
-
-print("===== LangGraph Agent 结束 =====")
-# final_state = app.invoke(safe_inputs)
-# print(final_state["messages"][-1].content)
\ No newline at end of file
+# checkpointer：每个节点跑完都存一个检查点（本地 SQLite），崩溃后可以按 thread_id 接着跑
+app = workflow.compile(checkpointer=get_checkpointer())
+
+# ============================================================================
+# 8. 命令行演示：只有直接运行本文件时才执行
+# （review_server.py 会 import 这个文件，import 时不要跑测试）
+# ============================================================================
+if __name__ == "__main__":
+    print("===== LangGraph 人机协同 Agent 启动 =====")
+    inputs = {
+        "messages": [
+            HumanMessage(content="3乘以3等于多少？")
+        ],
+        "human_feedback": ""    # 初始为空
+    }
+
+    # 🌟 在 inputs 前面加上 AgentState 进行类型断言
+    # 这行代码告诉编辑器：“别管了，我确定这是对的”
+    from typing import cast
+    safe_inputs = cast(AgentState, inputs)
+
+    # 有了 checkpointer 就必须传 thread_id，每次运行用一个新的
+    # callbacks：设置了 GRAPH_PROFILE_PATH 时记录每个节点的耗时 / token（python graph_profiler.py 查看报告）
+    config = {"configurable": {"thread_id": f"demo12-{uuid.uuid4()}"}, "callbacks": profiler_callbacks()}
+
+    graph_input = safe_inputs
+    while True:
+        # 🌟 stream 打印中间过程，这是 LangGraph 最大的魅力
+        for event in app.stream(graph_input, config):
+            for node_name, node_output in event.items():  # 遍历每个节点
+                # 快速路由没接手时没有输出
+                if node_name == "__interrupt__" or not node_output:
+                    continue
+                print(f"----- 节点：{node_name} -----")
+                # 打印最新的一条消息
+                print(f"输出：{node_output['messages'][-1].content}")
+
+        # 图停在了人工审核（interrupt）：在这里问用户，再用 Command(resume=...) 恢复
+        snapshot = app.get_state(config)
+        if not snapshot.interrupts:
+            break
+
+        pending = snapshot.interrupts[0].value
+        print("\n" + "="*30)
+        print(f"👨‍💻 人工审核阶段")
+        print("="*30)
+        print(f"AI 建议：{pending['proposal']}")
+        print("-"*30)
+        user_input = input("请审核（输入'ok' 批准，其他任何内容拒绝）：")
+        graph_input = Command(resume=user_input)
+
+    print("===== LangGraph Agent 结束 =====")
+    # final_state = app.invoke(safe_inputs)
+    # print(final_state["messages"][-1].content)
@@ -1,17 +1,28 @@
 import os
+import sys
+import time
+import uuid
+import operator
+import re
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from dotenv import load_dotenv
 from typing import Annotated, TypedDict, List
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
-from langgraph.graph import StateGraph, END
-from langchain_community.tools import DuckDuckGoSearchRun
+from langchain_core.tools import tool
+from langgraph.graph import StateGraph, START, END
+from langgraph.types import Send
+from message_state import append_messages
+from checkpoint_store import get_checkpointer
+from search_cache import cached_search, get_search_cache
+from graph_profiler import profiler_callbacks
+from model_cascade import ModelCascade, default_tiers
 
 load_dotenv()
 api_key = os.environ.get("OPENAI_API_KEY")
 base_url = os.environ.get("DASHSCOPE_BASE_URL")
 
-# 使用通过的 ChatOpenAI （在实际 Multi-Agent 中，不同 Agent 可以用不同的模型/温度）
-llm = ChatOpenAI(base_url=base_url, model="qwen-plus")
+# 在实际 Multi-Agent 中，不同 Agent 可以用不同的模型/温度：
+# Writer 用模型级联（先用便宜的模型，不合格再换 qwen-plus），见下面的 writer_llm
 
 # ==========================================
 # 1. 定义 State （团队共享的白板）
@@ -19,47 +30,212 @@ llm = ChatOpenAI(base_url=base_url, model="qwen-plus")
 
 # 🔥 定义一个合并函数
 def merge_messages(left: list[BaseMessage], right: list[BaseMessage] | BaseMessage) -> list[BaseMessage]:
-    # 如果 right 是单个消息，把它包成列表
-    if not isinstance(right, list):
-        right = [right]
-    # 返回拼接后的新列表
-    return left + right
+    # 单条消息、列表都可以；交给 append_messages 做只追加的合并，
+    # 不再用 left + right 每次复制整个列表（重写循环越长越慢）
+    return append_messages(left, right)
 
 class TeamState(TypedDict):
     # messages: 存储所有的交流记录
     messages: Annotated[List[BaseMessage], merge_messages]
     # current_writer: 当前由谁负责（可选，用于路由）
     next_action: str
+    # 并行搜索分支各自的结果，operator.add 把多个分支的返回拼在一起
+    research_results: Annotated[list, operator.add]
+    # 重写循环：当前稿件、审核意见、已重写次数
+    draft: str
+    feedback: str
+    rewrite_count: int
+    # 每一轮写作的 token 用量，operator.add 逐轮追加
+    token_usage: Annotated[list, operator.add]
 
 # ==========================================
 # 2. 定义 Agents（节点）
 # ==========================================
 
-# ---- Agent A：研究员 ----
-def researcher_node(state: TeamState):
-    # 1. 获取用户的原始问题（State 的第一条消息）
+# ---- Agent A：研究员（并行搜索 + 汇总） ----
+
+# 每个子查询一个分支，同时搜索：总耗时 ≈ 最慢的那一次，而不是所有搜索加起来
+RESEARCH_MAX_QUERIES = int(os.environ.get("RESEARCH_MAX_QUERIES", "3"))
+# 单个分支的超时（秒），超时的分支直接放弃，不拖累整个流程
+RESEARCH_TIMEOUT = float(os.environ.get("RESEARCH_TIMEOUT", "15"))
+# RESEARCH_OFFLINE=1：用离线的假搜索工具，不联网也能跑通整个图
+RESEARCH_OFFLINE = os.environ.get("RESEARCH_OFFLINE", "0") == "1"
+
+# 真正执行搜索的线程池：分支只在 future 上等待，超时后分支立刻返回
+_search_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="research")
+
+
+@tool
+def stub_search(query: str) -> str:
+    """ 离线假搜索：返回固定格式的摘要，用于本地调试和测试 """
+    return f"[离线资料] 关于「{query}」：这是一段用于测试的示例摘要。"
+
+
+def get_search_tool():
+    if RESEARCH_OFFLINE:
+        return stub_search
+    # 全进程共享的 DuckDuckGo 搜索工具：结果按查询缓存在本地 SQLite（带 TTL），
+    # 相同题目（包括 Streamlit 每次 rerun）直接命中缓存，不会重复联网、也不容易被限流
+    return cached_search
+
+
+def make_sub_queries(topic: str) -> list[str]:
+    """ 从用户的题目拆出几个子查询（不调用 LLM，纯规则，保证离线可用） """
+    candidates = [topic, f"{topic} 最新消息", f"{topic} 关键数据", f"{topic} 背景介绍"]
+    return candidates[:max(1, RESEARCH_MAX_QUERIES)]
+
+
+def fan_out_research(state: TeamState):
+    """ 入口路由：每个子查询发一个 Send，LangGraph 会并行执行这些分支 """
     query = str(state["messages"][0].content)
+    sub_queries = make_sub_queries(query)
+    print(f"🔍 [Researcher] 拆分成 {len(sub_queries)} 个子查询并行搜索: {sub_queries}")
+    return [Send("research_branch", {"query": q}) for q in sub_queries]
 
-    print(f"🔍 [Researcher] 正在联网搜索: {query}...") 
-    # 2. 初始化搜索工具
-    # DuckDuckGoSearchRun 是一个轻量级、免费的搜索工具
-    search = DuckDuckGoSearchRun()
 
-    # 3. 执行搜索
+def research_branch_node(state: dict):
+    """ 单个搜索分支：超时或出错都只记一条失败结果，不抛异常 """
+    query = state["query"]
+    start = time.perf_counter()
+    future = _search_pool.submit(get_search_tool().invoke, query)
     try:
         # invoke 会返回搜索结果的摘要字符串
-        search_result = search.invoke(query)
+        result = {"query": query, "ok": True, "content": future.result(timeout=RESEARCH_TIMEOUT)}
+    except FutureTimeoutError:
+        future.cancel()
+        result = {"query": query, "ok": False, "content": f"超时（{RESEARCH_TIMEOUT}s）"}
+        print(f"⚠️ 搜索超时: {query}")
     except Exception as e:
-        # 网络错误或超时处理
-        search_result = f"搜索遇到点问题: {e}"
-        print(f"⚠️ 搜索异常: {e}")
+        # 网络错误处理
+        result = {"query": query, "ok": False, "content": str(e)}
+        print(f"⚠️ 搜索异常: {query}: {e}")
+    result["elapsed_s"] = round(time.perf_counter() - start, 3)
+    return {"research_results": [result]}
+
+
+def researcher_node(state: TeamState):
+    """ 汇总（join）：所有分支结束后执行，部分分支失败也照样把成功的资料交给作家 """
+    results = state.get("research_results") or []
+    succeeded = [r for r in results if r["ok"]]
+    print(f"📚 [Researcher] 汇总搜索结果：成功 {len(succeeded)}/{len(results)}")
+
+    if succeeded:
+        search_result = "\n\n".join(f"【{r['query']}】\n{r['content']}" for r in succeeded)
+    else:
+        errors = "; ".join(r["content"] for r in results)
+        search_result = f"搜索遇到点问题: {errors}"
 
-    # 4. 研究员把结果告诉团队
+    # 研究员把结果告诉团队
     message = AIMessage(content=f"这是我从网上查到的实时资料：\n\n{search_result}")
     return {"messages": [message]}
 
 # ---- Agent B：作家 ----
+
+# 被驳回后最多重写几次，超过就直接发布（避免无限循环烧 token）
+MAX_REWRITES = int(os.environ.get("MAX_REWRITES", "3"))
+
+# 输出整篇文章的 LLM 调用打上这个 tag，前端（app.py）只把带这个 tag 的 token 流式显示出来；
+# 修改模式输出的是修改块，不是文章，不打 tag
+ARTICLE_TAG = "article"
+
+# 修改块格式：只输出要改的片段，本地替换到旧稿件里
+_EDIT_BLOCK = re.compile(r"<<<<<<< SEARCH\n(.*?)\n=======\n(.*?)\n>>>>>>> REPLACE", re.S)
+
+REVISE_PROMPT = """你是一个6年级的小学生，下面是你写的文章和老师的审核意见。
+请只修改需要改的地方，不要重写整篇文章。每一处修改用下面的格式输出：
+<<<<<<< SEARCH
+原文中要替换的一段（必须和原文一字不差）
+=======
+修改后的内容
+>>>>>>> REPLACE
+除了修改块不要输出任何其他内容。
+
+【原文】
+{draft}
+
+【审核意见】
+{feedback}"""
+
+
+def apply_edit_blocks(draft: str, text: str) -> str | None:
+    """ 把修改块应用到旧稿件上；没有修改块或者原文对不上时返回 None """
+    blocks = _EDIT_BLOCK.findall(text)
+    if not blocks:
+        return None
+    for search, replace in blocks:
+        if search not in draft:
+            return None
+        draft = draft.replace(search, replace, 1)
+    return draft
+
+
+def _article_ok(response) -> bool:
+    """ 小模型写的文章能不能直接用：长度合适、没有混进修改块的标记 """
+    text = response.content.strip()
+    return 150 <= len(text) <= 800 and "<<<<<<<" not in text and ">>>>>>>" not in text
+
+
+# Writer 用模型级联：先让 qwen-turbo 写，_article_ok 不通过再交给 qwen-plus（MODEL_CASCADE=0 关闭）
+# stream_usage=True：app.py 用流式模式显示写作过程，流式调用时也要拿到 token 用量
+writer_llm = ModelCascade(default_tiers(stream_usage=True), validator=_article_ok, name="writer")
+
+
+def _usage(response, mode: str, cycle: int) -> list[dict]:
+    """
+    记录这一轮调用的 token 用量（模型没返回 usage 时记 0）。
+    走模型级联时每一次尝试记一条：被打回的小模型调用也花了 token，不能漏掉。
+    """
+    attempts = response.response_metadata.get("cascade_attempts")
+    if attempts is None:
+        usage = getattr(response, "usage_metadata", None) or {}
+        attempts = [{
+            "tier": response.response_metadata.get("cascade_tier", ""),
+            "result": "accepted",
+            "input_tokens": usage.get("input_tokens", 0),
+            "output_tokens": usage.get("output_tokens", 0),
+        }]
+    return [
+        {
+            "cycle": cycle,
+            "mode": mode,
+            "model": attempt["tier"],
+            "result": attempt["result"],
+            "input_tokens": attempt["input_tokens"],
+            "output_tokens": attempt["output_tokens"],
+        }
+        for attempt in attempts
+    ]
+
+
 def writer_node(state: TeamState):
+    draft = state.get("draft")
+    feedback = state.get("feedback")
+    cycle = state.get("rewrite_count", 0)
+
+    # 被驳回过：只把旧稿件 + 审核意见发给 LLM，让它输出修改块，不再整篇重写
+    if draft and feedback:
+        print(f"✍️ [Writer] 根据审核意见修改第 {cycle} 稿...")
+        # 修改块能对上原文才算合格，对不上就升级到大模型再改一次
+        revise_llm = writer_llm.with_validator(lambda r: apply_edit_blocks(draft, r.content) is not None)
+        response = revise_llm.invoke([HumanMessage(content=REVISE_PROMPT.format(draft=draft, feedback=feedback))])
+        usage = _usage(response, "revise", cycle)
+        revised = apply_edit_blocks(draft, response.content)
+        if revised is None:
+            # 修改块解析 / 对齐失败：模型如果直接给了整篇文章就用它，否则整篇重写一次
+            if not _EDIT_BLOCK.search(response.content) and len(response.content) > len(draft) // 2:
+                revised = response.content
+            else:
+                print("⚠️ [Writer] 修改块无法应用，改为整篇重写")
+                response = writer_llm.invoke([HumanMessage(content=(
+                    "你是一个6年级的小学生。请根据审核意见重写下面的文章（500字以内），只输出文章：\n"
+                    f"【原文】\n{draft}\n\n【审核意见】\n{feedback}"
+                ))], config={"tags": [ARTICLE_TAG]})
+                usage.extend(_usage(response, "rewrite", cycle))
+                revised = response.content
+
+        print(f"📝 [Writer] 修改完成：{revised[:30]}...")
+        return {"messages": [AIMessage(content=revised)], "draft": revised, "feedback": "", "token_usage": usage}
+
     print("✍️ [Writer] 正在撰写博客...")
     # 1. 获取历史消息（包括研究员的资料）
     messages = state["messages"]
@@ -81,25 +257,39 @@ def writer_node(state: TeamState):
 
     # 4. 让 LLM 根据资料写文章
     # 🔥 修复点：直接传 HumanMessage，不要用奇怪的拼法   
-    response = llm.invoke([HumanMessage(content=prompt_text)])
+    response = writer_llm.invoke([HumanMessage(content=prompt_text)], config={"tags": [ARTICLE_TAG]})
 
     print(f"📝 [Writer] 写作完成：{response.content[:30]}...")
 
     # 5. 🔥 关键修复：必须返回包含 AIMessage 的字典，以更新 State
-    return {"messages": [response]}
+    return {
+        "messages": [response],
+        "draft": response.content,
+        "feedback": "",
+        "token_usage": _usage(response, "full", cycle),
+    }
 
 # ---- Agent C：发布者 ----
 def publisher_node(state: TeamState):
     print("📢 [Publisher] 正在审核文章...")
-    messages = state["messages"]
-    last_message = messages[-1]
-    content = last_message.content
+    # 直接审核当前稿件，不用在消息里翻找
+    content = state.get("draft") or state["messages"][-1].content
 
     # 简单的审核逻辑：检查字数是否超过 10 字
     if len(content) < 10:
+        rewrite_count = state.get("rewrite_count", 0)
+        if rewrite_count >= MAX_REWRITES:
+            print(f"⚠️ [Publisher] 已重写 {rewrite_count} 次，达到上限，直接发布。")
+            return {"messages": [AIMessage(content="已达到最大重写次数，文章已发布。")], "next_action": "end"}
         print("❌ [Publisher] 文章太短，打回重写！")
+        feedback = "文章太短，请扩充。"
         # 返回一条反馈消息
-        return {"messages": [AIMessage(content="审核不通过：文章太短，请扩充。")], "next_action": "rewrite"}
+        return {
+            "messages": [AIMessage(content=f"审核不通过：{feedback}")],
+            "next_action": "rewrite",
+            "feedback": feedback,
+            "rewrite_count": rewrite_count + 1,
+        }
     else:
         print("✅ [Publisher] 审核通过，发布！")
         return {"messages": [AIMessage(content="审核通过！文章已发布。")], "next_action": "end"}
@@ -124,10 +314,8 @@ def route_after_writer(state: TeamState):
 # 3. 发布者干完活，去哪？
 def route_after_publisher(state: TeamState):
     # 检查审核结果
-    # Publisher 的逻辑是：如果不通过，返回消息里会有“不通过”
-    last_msg = state["messages"][-1]
-
-    if "不通过" in last_msg.content:
+    # Publisher 不通过时会把 next_action 设成 "rewrite"（达到重写上限时会直接设成 "end"）
+    if state.get("next_action") == "rewrite":
         # 没过，回炉重造（回 Writer）
         print("🔄 [Router] 审核驳回，退回重写...")
         return "writer"
@@ -143,14 +331,16 @@ def route_after_publisher(state: TeamState):
 workflow = StateGraph(TeamState)
 
 # 添加节点
+workflow.add_node("research_branch", research_branch_node)
 workflow.add_node("researcher", researcher_node)
 workflow.add_node("writer", writer_node)
 workflow.add_node("publisher", publisher_node)
 
-# 设置入口
-workflow.set_entry_point("researcher")
+# 设置入口：先并行搜索（fan-out），所有分支结束后进入 researcher 汇总（join）
+workflow.add_conditional_edges(START, fan_out_research, ["research_branch"])
 
 # --- 添加边 ---
+workflow.add_edge("research_branch", "researcher")
 
 # 研究员 -> 路由 -> 作家
 workflow.add_conditional_edges(
@@ -171,7 +361,36 @@ workflow.add_conditional_edges(
     {"writer": "writer", END: END}
 )
 
-app = workflow.compile()
+# checkpointer：每个节点跑完都存一个检查点（本地 SQLite）。
+# 中途崩溃 / 超时后，用同一个 thread_id 调用 app.invoke(None, config) 就能从最后一个完成的节点继续，
+# 不用重新搜索、重新写作
+app = workflow.compile(checkpointer=get_checkpointer())
+
+
+def new_thread_config(thread_id: str | None = None) -> dict:
+    """ 生成运行配置；不传 thread_id 就新开一个 """
+    return {
+        "configurable": {"thread_id": thread_id or f"team-{uuid.uuid4()}"},
+        # 设置了 GRAPH_PROFILE_PATH 时记录每个节点的耗时 / token（python graph_profiler.py 查看报告）
+        "callbacks": profiler_callbacks(),
+    }
+
+
+def can_resume(config: dict) -> bool:
+    """ 这个 thread 是否有没跑完的节点（上次中途失败了） """
+    snapshot = app.get_state(config)
+    return bool(snapshot.next)
+
+
+def warmup():
+    """
+    提前把重资源准备好（给 app.py 的 st.cache_resource 用，每个进程只执行一次）：
+    图在 import 时已经编译好、LLM 客户端已经创建，这里再打开 checkpointer 和搜索缓存的 SQLite。
+    不发起任何 LLM / 搜索请求。
+    """
+    get_checkpointer()
+    get_search_cache()
+    app.get_graph()
 
 # ==========================================
 # 🌟 修改：只有直接运行本文件时才执行测试
@@ -188,7 +407,15 @@ if __name__ == "__main__":
     from typing import cast
     inputs = cast(TeamState, raw_inputs)
 
-    final_state = app.invoke(inputs)
+    # python demo_13_multi_agent.py <thread_id>：继续上次没跑完的任务
+    config = new_thread_config(sys.argv[1] if len(sys.argv) > 1 else None)
+    print(f"🧵 thread_id: {config['configurable']['thread_id']}")
+
+    if can_resume(config):
+        print("♻️ 检测到未完成的任务，从上次中断的节点继续...")
+        final_state = app.invoke(None, config)
+    else:
+        final_state = app.invoke(inputs, config)
     print(final_state["messages"][-1].content)
 
 
@@ -0,0 +1,201 @@
+"""
+快速路由：能用规则直接回答的简单问题，不走 LLM
+
+"3乘以3等于多少？" 这种问题走完整的 Agent 要两次 LLM 调用：
+一次决定调用 multiply，一次把工具结果组织成回答。其实用正则就能认出来。
+
+FastRouter 在 Agent 前面做一次本地判断：
+- 每条规则（FastRule）用正则从问题里提取工具参数，支持阿拉伯数字和中文数字（三、十二、一百零五、两千）
+- 置信度 = 规则匹配到的部分占问题（去掉"请问""等于多少"这类客套词之后）的比例；
+  问题里还有别的内容（比如先问年假再让乘一下），置信度就低，交给 Agent
+- 置信度达到阈值才直接调用工具，用模板生成回答；否则原样放行（fall-through）
+
+在 LangGraph 里用：
+    router = FastRouter(tools)
+    workflow.add_node("fast_path", router.node)
+    workflow.set_entry_point("fast_path")
+    workflow.add_conditional_edges("fast_path", lambda s: END if router.answered(s) else "agent", ...)
+"""
+import os
+import re
+import uuid
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from metrics import REGISTRY
+
+# 置信度阈值：问题里至少这么大比例的内容要被规则解释掉
+FAST_ROUTE_MIN_CONFIDENCE = float(os.getenv("FAST_ROUTE_MIN_CONFIDENCE", "0.8"))
+# FAST_ROUTE=0 可以整体关闭，所有问题都走 Agent
+FAST_ROUTE_ENABLED = os.getenv("FAST_ROUTE", "1") == "1"
+
+FAST_ROUTE_REQUESTS = REGISTRY.counter(
+    "fast_route_requests_total", "快速路由的结果（hit 直接回答 / low_confidence 置信度不够 / miss 没有规则匹配 / error 工具出错）",
+    ("rule", "result"),
+)
+
+# ============================================================================
+# 1. 中文数字
+# ============================================================================
+_DIGITS = {"零": 0, "〇": 0, "一": 1, "二": 2, "两": 2, "三": 3, "四": 4,
+           "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+_UNITS = {"十": 10, "百": 100, "千": 1000}
+NUMBER = r"(\d+|[零〇一二两三四五六七八九十百千万]+)"
+
+
+def parse_number(text: str):
+    """ "12" / "十二" / "一百零五" / "两千三百" -> int；认不出来返回 None """
+    if text.isdigit():
+        return int(text)
+    if text in ("零", "〇"):
+        return 0
+    total, section, digit = 0, 0, None
+    for ch in text:
+        if ch in ("零", "〇"):
+            # "一百零五" 里的 "零" 只是占位
+            continue
+        if ch in _DIGITS:
+            if digit is not None:
+                # "一二" 这种连着写的数字不是合法的中文数字
+                return None
+            digit = _DIGITS[ch]
+        elif ch in _UNITS:
+            if digit is None and ch != "十":
+                # 只有 "十二" 开头的 "十" 可以省略前面的 "一"，单独的 "百" "千" 不是数字
+                return None
+            section += (1 if digit is None else digit) * _UNITS[ch]
+            digit = None
+        elif ch == "万":
+            if section == 0 and digit is None:
+                # "万" 前面没有数字（单独一个 "万"、"万万"）
+                return None
+            total += (section + (digit or 0)) * 10000
+            section, digit = 0, None
+        else:
+            return None
+    return total + section + (digit or 0)
+
+
+# ============================================================================
+# 2. 规则
+# ============================================================================
+# 不影响意思的客套词、问句尾巴、标点，算置信度之前先去掉
+_FILLER = re.compile(
+    r"请问|请|帮我|麻烦|你|能不能|可以|算一下|算算|计算一下|计算|一下|"
+    r"等于多少|等于几|是多少|是几|得多少|多少|结果|的|呢|吗|啊|呀|"
+    r"[\s?？。.!！,，:：=]"
+)
+
+
+class FastRule:
+    """
+    name：规则名（指标里用）
+    tool_name：要调用的工具
+    pattern：正则，匹配到的部分用来算置信度
+    build_args：match -> 工具参数 dict（参数不合法时返回 None）
+    template：回答模板，可以用工具参数和 {result}
+    """
+
+    def __init__(self, name: str, tool_name: str, pattern: str, build_args, template: str):
+        self.name = name
+        self.tool_name = tool_name
+        self.pattern = re.compile(pattern)
+        self.build_args = build_args
+        self.template = template
+
+
+def _multiply_args(match):
+    a, b = parse_number(match.group(1)), parse_number(match.group(2))
+    if a is None or b is None:
+        return None
+    return {"a": a, "b": b}
+
+
+MULTIPLY_RULE = FastRule(
+    name="multiply",
+    tool_name="multiply",
+    # 前后不能紧挨着数字或小数点："2.5乘以4" 不能被当成 "5乘以4"
+    pattern=r"(?<![\d.])" + NUMBER + r"\s*(?:乘以|乘上|乘|\*|×|✖|x|X)\s*" + NUMBER + r"(?![\d.])",
+    build_args=_multiply_args,
+    template="{a} 乘以 {b} 等于 {result}。",
+)
+
+DEFAULT_RULES = [MULTIPLY_RULE]
+
+
+# ============================================================================
+# 3. 路由器
+# ============================================================================
+class FastAnswer:
+    """ 一次快速路由的结果 """
+
+    def __init__(self, rule: FastRule, args: dict, result, answer: str, confidence: float):
+        self.rule = rule
+        self.args = args
+        self.result = result
+        self.answer = answer
+        self.confidence = confidence
+
+
+class FastRouter:
+    """ 规则命中且置信度够高时直接调用工具、用模板回答；否则返回 None 交给 Agent """
+
+    def __init__(self, tools, rules=None, min_confidence: float = FAST_ROUTE_MIN_CONFIDENCE):
+        self.tools = {t.name: t for t in tools}
+        # 只保留工具真的存在的规则
+        self.rules = [r for r in (rules or DEFAULT_RULES) if r.tool_name in self.tools]
+        self.min_confidence = min_confidence
+
+    def confidence(self, text: str, match) -> float:
+        rest = _FILLER.sub("", text[:match.start()] + text[match.end():])
+        matched = len(_FILLER.sub("", match.group(0)))
+        return matched / (matched + len(rest)) if matched else 0.0
+
+    def route(self, text: str):
+        if not FAST_ROUTE_ENABLED:
+            return None
+        for rule in self.rules:
+            matches = list(rule.pattern.finditer(text))
+            if not matches:
+                continue
+            # 一句话里有好几个算式，说明问题不止一步，交给 Agent
+            args = rule.build_args(matches[0]) if len(matches) == 1 else None
+            score = self.confidence(text, matches[0]) if args is not None else 0.0
+            if score < self.min_confidence:
+                FAST_ROUTE_REQUESTS.inc(rule=rule.name, result="low_confidence")
+                return None
+            try:
+                result = self.tools[rule.tool_name].invoke(args)
+            except Exception as e:
+                print(f"⚠️ 快速路由调用工具 {rule.tool_name} 失败，交给 Agent: {e}")
+                FAST_ROUTE_REQUESTS.inc(rule=rule.name, result="error")
+                return None
+            FAST_ROUTE_REQUESTS.inc(rule=rule.name, result="hit")
+            answer = rule.template.format(**args, result=result)
+            return FastAnswer(rule, args, result, answer, score)
+        FAST_ROUTE_REQUESTS.inc(rule="", result="miss")
+        return None
+
+    # ---- LangGraph 节点（state 里有 messages 列表）----
+    def node(self, state: dict) -> dict:
+        """ 最后一条是用户消息、而且能快速回答时，补上工具调用 + 工具结果 + 回答三条消息 """
+        last_message = state["messages"][-1]
+        if not isinstance(last_message, HumanMessage):
+            return {}
+        fast = self.route(str(last_message.content))
+        if fast is None:
+            return {}
+        print(f"⚡ [快速路由] {fast.rule.name}({fast.args}) 置信度 {fast.confidence:.2f}，跳过 LLM")
+        # 消息格式和 Agent 自己调用工具时一样，后面的节点（以及下一轮对话）看不出区别
+        call_id = f"fast_{uuid.uuid4().hex[:12]}"
+        return {"messages": [
+            AIMessage(content="", tool_calls=[{"name": fast.rule.tool_name, "args": fast.args, "id": call_id}]),
+            ToolMessage(content=str(fast.result), name=fast.rule.tool_name, tool_call_id=call_id),
+            AIMessage(content=fast.answer, response_metadata={"fast_route": fast.rule.name}),
+        ]}
+
+    @staticmethod
+    def answered(state: dict) -> bool:
+        """ node 是否已经直接回答了（用在条件边里） """
+        last_message = state["messages"][-1]
+        return isinstance(last_message, AIMessage) and "fast_route" in last_message.response_metadata
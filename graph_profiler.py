@@ -0,0 +1,333 @@
+"""
+LangGraph 本地性能分析（完全离线，不依赖 LangSmith）
+
+把 GraphProfiler 挂到图的 callbacks 上，每次运行都会记录：
+- 每个节点（agent / tools / researcher / writer / publisher ...）的耗时、成功 / 失败、重试次数
+- 每次 LLM 调用的耗时和 token 用量（归到所在的节点下面）
+- 每次工具调用的耗时
+- 整个图一次运行的总耗时
+
+记录按行写到本地 JSONL 文件（*.jsonl）或 SQLite（*.sqlite / *.db），之后可以出汇总报告：
+    python graph_profiler.py graph_profile.jsonl
+
+用法：
+    from graph_profiler import GraphProfiler
+    app.invoke(inputs, {"callbacks": [GraphProfiler("graph_profile.jsonl")]})
+
+或者设置环境变量 GRAPH_PROFILE_PATH=graph_profile.jsonl，demo 里通过 profiler_callbacks() 自动挂上。
+"""
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import defaultdict
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+DEFAULT_PROFILE_PATH = "graph_profile.jsonl"
+
+
+# =============================================================================
+# 存储：JSONL / SQLite
+# =============================================================================
+class JsonlStore:
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def write(self, record: dict):
+        line = json.dumps(record, ensure_ascii=False)
+        with self.lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def read(self) -> list:
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+
+class SqliteStore:
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS spans (trace_id TEXT, ts REAL, kind TEXT, node TEXT, record TEXT)"
+        )
+        self.lock = threading.Lock()
+
+    def write(self, record: dict):
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO spans (trace_id, ts, kind, node, record) VALUES (?, ?, ?, ?, ?)",
+                (record["trace_id"], record["ts"], record["kind"], record.get("node"),
+                 json.dumps(record, ensure_ascii=False)),
+            )
+            self.conn.commit()
+
+    def read(self) -> list:
+        with self.lock:
+            rows = self.conn.execute("SELECT record FROM spans ORDER BY ts").fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+
+def open_store(path: str):
+    """ 按扩展名选择存储：.sqlite / .db 用 SQLite，其余用 JSONL """
+    if path.endswith((".sqlite", ".db")):
+        return SqliteStore(path)
+    return JsonlStore(path)
+
+
+# =============================================================================
+# 回调：记录节点 / LLM / 工具的耗时
+# =============================================================================
+def _token_usage(response):
+    """ 从 LLMResult 里取 token 用量（和 metrics.py 的取法一致） """
+    input_tokens = output_tokens = 0
+    for generations in response.generations:
+        for gen in generations:
+            usage = getattr(getattr(gen, "message", None), "usage_metadata", None)
+            if usage:
+                input_tokens += usage.get("input_tokens", 0)
+                output_tokens += usage.get("output_tokens", 0)
+    if not (input_tokens or output_tokens):
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        input_tokens = usage.get("prompt_tokens", 0)
+        output_tokens = usage.get("completion_tokens", 0)
+    return input_tokens, output_tokens
+
+
+class GraphProfiler(BaseCallbackHandler):
+    """
+    挂到编译好的图上：
+        app.invoke(inputs, {"callbacks": [GraphProfiler("graph_profile.jsonl")]})
+    一个实例可以反复使用，每次图运行是一个 trace（trace_id 就是根 run 的 id）。
+    """
+
+    def __init__(self, path: str = DEFAULT_PROFILE_PATH, run_name: str = ""):
+        self.store = open_store(path)
+        self.run_name = run_name
+        # run_id -> 正在进行的 span
+        self._spans = {}
+        # (trace_id, checkpoint_ns) -> 这个节点任务已经开始了几次（>1 就是重试）
+        self._attempts = defaultdict(int)
+        # run_id -> on_retry 触发的次数（Runnable.with_retry）
+        self._retries = defaultdict(int)
+        self._lock = threading.Lock()
+
+    # ---- 工具函数 ----
+    def _trace_id(self, run_id, parent_run_id):
+        if parent_run_id is None:
+            return str(run_id)
+        parent = self._spans.get(parent_run_id)
+        if parent is not None:
+            return parent["trace_id"]
+        return str(parent_run_id)
+
+    def _open(self, run_id, parent_run_id, kind, name, metadata, **extra):
+        metadata = metadata or {}
+        with self._lock:
+            span = {
+                "trace_id": self._trace_id(run_id, parent_run_id),
+                "kind": kind,
+                "name": name,
+                "node": metadata.get("langgraph_node"),
+                "step": metadata.get("langgraph_step"),
+                "start": time.perf_counter(),
+                "ts": time.time(),
+                **extra,
+            }
+            self._spans[run_id] = span
+        return span
+
+    def _close(self, run_id, status, error=None, **extra):
+        with self._lock:
+            span = self._spans.pop(run_id, None)
+            retries = self._retries.pop(run_id, 0)
+        if span is None or span["kind"] == "chain":
+            return
+        span["duration_s"] = round(time.perf_counter() - span.pop("start"), 6)
+        span["status"] = status
+        if error is not None:
+            span["error"] = repr(error)[:500]
+        if retries:
+            span["retries"] = span.get("retries", 0) + retries
+        if self.run_name:
+            span["run_name"] = self.run_name
+        span.update(extra)
+        self.store.write(span)
+
+    # ---- Chain：图本身 + 每个节点 ----
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        name = kwargs.get("name") or (serialized or {}).get("name", "")
+        metadata = metadata or {}
+        node = metadata.get("langgraph_node")
+        if parent_run_id is None:
+            self._open(run_id, None, "graph", name, {})
+        elif node is not None and name == node:
+            # 节点本身的 run（节点里面嵌套的 chain 也带着 langgraph_node，但名字不同）
+            key = (self._trace_id(run_id, parent_run_id), metadata.get("langgraph_checkpoint_ns", node))
+            with self._lock:
+                self._attempts[key] += 1
+                attempt = self._attempts[key]
+            # attempt > 1 说明是 RetryPolicy 触发的重试
+            self._open(run_id, parent_run_id, "node", name, metadata, attempt=attempt)
+        else:
+            # 其他 chain 只用来把 trace_id 传下去，不写记录
+            self._open(run_id, parent_run_id, "chain", name, metadata)
+
+    def _end_chain(self, run_id, status, error=None):
+        span = self._spans.get(run_id)
+        self._close(run_id, status, error)
+        if span is not None and span["kind"] == "graph":
+            # 一次图运行结束，清掉这个 trace 的重试计数
+            with self._lock:
+                for key in [k for k in self._attempts if k[0] == span["trace_id"]]:
+                    del self._attempts[key]
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end_chain(run_id, "ok")
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        # GraphInterrupt（人工审核挂起）不算失败
+        if type(error).__name__ == "GraphInterrupt":
+            self._end_chain(run_id, "interrupted")
+        else:
+            self._end_chain(run_id, "error", error)
+
+    def on_retry(self, retry_state, *, run_id, **kwargs):
+        with self._lock:
+            self._retries[run_id] += 1
+
+    # ---- LLM ----
+    def _model_name(self, serialized, kwargs):
+        params = kwargs.get("invocation_params") or {}
+        return params.get("model") or params.get("model_name") or (serialized or {}).get("name", "unknown")
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        self._open(run_id, parent_run_id, "llm", self._model_name(serialized, kwargs), metadata)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        self._open(run_id, parent_run_id, "llm", self._model_name(serialized, kwargs), metadata)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        input_tokens, output_tokens = _token_usage(response)
+        self._close(run_id, "ok", input_tokens=input_tokens, output_tokens=output_tokens)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._close(run_id, "error", error)
+
+    # ---- 工具 ----
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        name = kwargs.get("name") or (serialized or {}).get("name", "unknown")
+        self._open(run_id, parent_run_id, "tool", name, metadata)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._close(run_id, "ok")
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._close(run_id, "error", error)
+
+
+def profiler_callbacks() -> list:
+    """ 设置了环境变量 GRAPH_PROFILE_PATH 时返回 [GraphProfiler]，否则返回空列表 """
+    path = os.getenv("GRAPH_PROFILE_PATH")
+    if not path:
+        return []
+    global _shared_profiler
+    with _shared_lock:
+        if _shared_profiler is None or _shared_profiler.store.path != path:
+            _shared_profiler = GraphProfiler(path)
+        return [_shared_profiler]
+
+
+_shared_profiler = None
+_shared_lock = threading.Lock()
+
+
+# =============================================================================
+# 汇总报告
+# =============================================================================
+def _percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(q * (len(values) - 1))))
+    return values[index]
+
+
+def summarize(records: list) -> dict:
+    """ 按节点汇总：次数、耗时（总 / 平均 / p50 / p95）、LLM 耗时和 token、重试、失败 """
+    nodes = defaultdict(lambda: {
+        "calls": 0, "errors": 0, "retries": 0, "durations": [],
+        "llm_calls": 0, "llm_seconds": 0.0, "input_tokens": 0, "output_tokens": 0,
+        "tool_calls": 0, "tool_seconds": 0.0,
+    })
+    graph_runs = []
+    for r in records:
+        kind = r.get("kind")
+        if kind == "graph":
+            graph_runs.append(r["duration_s"])
+            continue
+        stats = nodes[r.get("node") or "(graph)"]
+        if kind == "node":
+            stats["calls"] += 1
+            stats["durations"].append(r["duration_s"])
+            stats["retries"] += (r.get("attempt", 1) > 1) + r.get("retries", 0)
+            stats["errors"] += r.get("status") == "error"
+        elif kind == "llm":
+            stats["llm_calls"] += 1
+            stats["llm_seconds"] += r["duration_s"]
+            stats["input_tokens"] += r.get("input_tokens", 0)
+            stats["output_tokens"] += r.get("output_tokens", 0)
+            stats["retries"] += r.get("retries", 0)
+        elif kind == "tool":
+            stats["tool_calls"] += 1
+            stats["tool_seconds"] += r["duration_s"]
+
+    summary = {}
+    for node, stats in nodes.items():
+        durations = stats.pop("durations")
+        stats["total_s"] = round(sum(durations), 3)
+        stats["avg_s"] = round(sum(durations) / len(durations), 3) if durations else 0.0
+        stats["p50_s"] = round(_percentile(durations, 0.5), 3)
+        stats["p95_s"] = round(_percentile(durations, 0.95), 3)
+        stats["llm_seconds"] = round(stats["llm_seconds"], 3)
+        stats["tool_seconds"] = round(stats["tool_seconds"], 3)
+        summary[node] = stats
+    return {
+        "graph_runs": len(graph_runs),
+        "graph_total_s": round(sum(graph_runs), 3),
+        "graph_p95_s": round(_percentile(graph_runs, 0.95), 3),
+        "nodes": summary,
+    }
+
+
+def format_report(summary: dict) -> str:
+    lines = [
+        f"图运行次数: {summary['graph_runs']}，总耗时 {summary['graph_total_s']}s，p95 {summary['graph_p95_s']}s",
+        "",
+        f"{'节点':<16}{'次数':>6}{'总耗时':>10}{'平均':>9}{'p95':>9}{'LLM次数':>9}{'LLM耗时':>10}"
+        f"{'输入tok':>10}{'输出tok':>10}{'工具耗时':>10}{'重试':>6}{'失败':>6}",
+    ]
+    ordered = sorted(summary["nodes"].items(), key=lambda kv: kv[1]["total_s"], reverse=True)
+    for node, s in ordered:
+        lines.append(
+            f"{node:<16}{s['calls']:>6}{s['total_s']:>10}{s['avg_s']:>9}{s['p95_s']:>9}{s['llm_calls']:>9}"
+            f"{s['llm_seconds']:>10}{s['input_tokens']:>10}{s['output_tokens']:>10}{s['tool_seconds']:>10}"
+            f"{s['retries']:>6}{s['errors']:>6}"
+        )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    # python graph_profiler.py [graph_profile.jsonl | graph_profile.sqlite]
+    path = sys.argv[1] if len(sys.argv) > 1 else os.getenv("GRAPH_PROFILE_PATH", DEFAULT_PROFILE_PATH)
+    records = open_store(path).read()
+    if not records:
+        print(f"⚠️ {path} 里没有记录")
+    else:
+        print(format_report(summarize(records)))
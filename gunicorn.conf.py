@@ -0,0 +1,28 @@
+"""
+多 worker 部署配置：gunicorn -c gunicorn.conf.py server:app
+
+两种共享索引内存的方式（二选一）：
+1. preload（默认）：master 进程先 import server.py 并构建好 FAISS 索引，再 fork 出 worker，
+   worker 之间通过写时复制共享这块内存，不会每个 worker 各建一份。
+2. mmap：设置 AGENT_INDEX_MODE=mmap，索引只构建一次写到 AGENT_INDEX_DIR，
+   每个 worker 用 mmap 只读打开，由操作系统页缓存共享。
+   可以先用 `python agent_logic.py --build-index` 在部署时构建好。
+"""
+import multiprocessing
+import os
+
+bind = os.getenv("AGENT_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("AGENT_WORKERS", multiprocessing.cpu_count()))
+# uvicorn 0.40 里 uvicorn.workers 已标记废弃，装了 uvicorn-worker 包的话可以换成 "uvicorn_worker.UvicornWorker"
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# 在 master 里加载应用，fork 之后 worker 直接共享已经建好的对象
+preload_app = True
+timeout = 120
+
+
+def when_ready(server):
+    # master 准备好之后、fork worker 之前：确保索引已建好，并冻结 GC，减少写时复制
+    import agent_logic
+    agent_logic.warmup_for_fork()
+    server.log.info("FAISS 索引已在 master 中就绪，开始 fork worker")
@@ -0,0 +1,175 @@
+"""
+LLM 响应缓存（SQLite，持久化）—— 只给确定性调用（temperature=0）用
+
+temperature=0 时同样的输入应该得到同样的输出，demo 每次运行、工具循环里的重复调用
+都在把一模一样的请求重新发给 qwen-plus。这里实现了 LangChain 的 BaseCache：
+- key = (模型 + 参数 + 绑定的工具, 规范化后的消息)，参数和工具由 LangChain 的 llm_string 提供；
+  消息会去掉 id / response_metadata / usage_metadata 这类每次都不一样的字段
+- 结果存在本地 SQLite，带 TTL，条目数超过上限按最近访问时间淘汰（LRU）
+- 命中 / 未命中 / 过期都有指标（/metrics 里能看到）
+
+用法：
+    from llm_cache import cache_if_deterministic
+    llm = cache_if_deterministic(ChatOpenAI(model="qwen-plus", temperature=0))
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+
+from metrics import REGISTRY
+
+DEFAULT_CACHE_PATH = os.getenv("LLM_CACHE_DB", "llm_cache.sqlite")
+# 缓存有效期（秒），默认 7 天；模型升级后可以调短或者直接删库
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000"))
+# LLM_CACHE=0 可以整体关闭
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE", "1") == "1"
+
+LLM_CACHE_REQUESTS = REGISTRY.counter(
+    "llm_cache_requests_total", "LLM 缓存查询次数（hit 命中 / miss 未命中 / expired 已过期）", ("result",)
+)
+LLM_CACHE_EVICTIONS = REGISTRY.counter(
+    "llm_cache_evictions_total", "因为超过条目上限被淘汰的 LLM 缓存条目数"
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_cache (
+    key TEXT PRIMARY KEY,
+    response TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache (last_access);
+"""
+
+# 消息里每次调用都会变、但不影响模型输出的字段
+_VOLATILE_FIELDS = ("id", "response_metadata", "usage_metadata")
+
+
+def _strip_volatile(obj):
+    if isinstance(obj, dict):
+        if obj.get("type") == "constructor" and isinstance(obj.get("kwargs"), dict):
+            kwargs = {k: v for k, v in obj["kwargs"].items() if k not in _VOLATILE_FIELDS}
+            return {**obj, "kwargs": _strip_volatile(kwargs)}
+        return {k: _strip_volatile(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_strip_volatile(v) for v in obj]
+    return obj
+
+
+def normalize_prompt(prompt: str) -> str:
+    """ prompt 是 LangChain 序列化后的消息列表（JSON），去掉易变字段后重新序列化 """
+    try:
+        data = json.loads(prompt)
+    except ValueError:
+        return prompt
+    return json.dumps(_strip_volatile(data), ensure_ascii=False, sort_keys=True)
+
+
+def make_cache_key(prompt: str, llm_string: str) -> str:
+    raw = normalize_prompt(prompt) + "\x00" + llm_string
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class SqliteLLMCache(BaseCache):
+    """ SQLite LLM 缓存：TTL 过期 + 条目数上限（LRU 淘汰） """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, ttl: float = LLM_CACHE_TTL,
+                 max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(_SCHEMA)
+        self.lock = threading.Lock()
+
+    def lookup(self, prompt: str, llm_string: str):
+        key = make_cache_key(prompt, llm_string)
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT response, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                LLM_CACHE_REQUESTS.inc(result="miss")
+                return None
+            response, created_at = row
+            if now - created_at > self.ttl:
+                self.conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self.conn.commit()
+                LLM_CACHE_REQUESTS.inc(result="expired")
+                return None
+            self.conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+        LLM_CACHE_REQUESTS.inc(result="hit")
+        return loads(response)
+
+    def update(self, prompt: str, llm_string: str, return_val) -> None:
+        generations = []
+        for gen in return_val:
+            message = getattr(gen, "message", None)
+            if message is not None:
+                # 不保存消息 id（命中时由调用方重新分配，避免和上次的消息 id 冲突），
+                # 也不保存 token 用量（命中时没有真正消耗 token）
+                gen = gen.model_copy(update={"message": message.model_copy(
+                    update={"id": None, "usage_metadata": None}
+                )})
+            generations.append(gen)
+
+        key = make_cache_key(prompt, llm_string)
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, response, created_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, dumps(generations), now, now),
+            )
+            (count,) = self.conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()
+            overflow = count - self.max_entries
+            if overflow > 0:
+                self.conn.execute(
+                    "DELETE FROM llm_cache WHERE key IN "
+                    "(SELECT key FROM llm_cache ORDER BY last_access LIMIT ?)",
+                    (overflow,),
+                )
+                LLM_CACHE_EVICTIONS.inc(overflow)
+            self.conn.commit()
+
+    def clear(self, **kwargs) -> None:
+        with self.lock:
+            self.conn.execute("DELETE FROM llm_cache")
+            self.conn.commit()
+
+    def size(self) -> int:
+        # 注意不要定义 __len__：LangChain 用 `if self.cache` 判断有没有缓存，空缓存会被当成 False
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> SqliteLLMCache:
+    """ 进程内共享一个缓存实例 """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SqliteLLMCache()
+        return _cache
+
+
+def cache_if_deterministic(llm):
+    """
+    temperature=0 的模型挂上缓存，其他的原样返回（有随机性的输出不能缓存）。
+    只设置这个模型自己的 cache，不影响全局。
+    """
+    if LLM_CACHE_ENABLED and getattr(llm, "temperature", None) == 0:
+        llm.cache = get_llm_cache()
+    return llm
@@ -0,0 +1,195 @@
+"""
+LangGraph 消息列表的线性时间 reducer
+
+原来的写法：
+    messages: Annotated[list, lambda x, y: x + y]
+每个节点返回一条新消息，x + y 都会把整个列表复制一遍，
+工具循环、反复重写的流程越长，总开销就是 O(n²)。
+
+这里的 MessageLog 是一个 "只追加、结构共享" 的消息序列：
+- 新版本和旧版本共享同一块底层存储，追加一条消息是 O(1)
+- 旧版本依然可读（只看得到自己长度以内的部分），不会被新消息影响
+- 支持按消息 id 去重 / 替换（和 LangGraph 的 add_messages 语义一致），
+  也支持 RemoveMessage 删除；这两种情况比较少见，走复制（O(n)）
+
+用法：
+    from message_state import append_messages
+
+    class AgentState(TypedDict):
+        messages: Annotated[list, append_messages]
+
+注意 checkpointer：通道里存的是 MessageLog，LangGraph 默认的序列化器（msgpack）不认识它，
+InMemorySaver / 官方 SqliteSaver / PostgresSaver 直接用会报 "Type is not msgpack serializable"。
+- 推荐 checkpoint_store.get_checkpointer()：它认识 MessageLog，还只存新增的消息
+- 用别的 checkpointer 时传 serde=MessageLogSerializer()：按普通 list 保存，
+  恢复后第一次追加会复制一次（O(n)），之后又回到 O(1) 的追加
+"""
+import threading
+import uuid
+from collections.abc import Sequence
+
+from langchain_core.messages import BaseMessage, RemoveMessage, convert_to_messages
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+
+class _Buffer:
+    """ 多个 MessageLog 版本共享的底层存储（只追加） """
+    __slots__ = ("items", "ids", "lock")
+
+    def __init__(self, items=None):
+        self.items = items if items is not None else []
+        # 消息 id -> 在 items 里的位置
+        self.ids = {m.id: i for i, m in enumerate(self.items) if m.id is not None}
+        self.lock = threading.Lock()
+
+
+class MessageLog(Sequence):
+    """ 只追加、结构共享的消息序列，可以当成只读 list 使用 """
+    __slots__ = ("_buf", "_size")
+
+    def __init__(self, messages=()):
+        items = list(messages)
+        self._buf = _Buffer(items)
+        self._size = len(items)
+
+    @classmethod
+    def _view(cls, buf: _Buffer, size: int) -> "MessageLog":
+        log = cls.__new__(cls)
+        log._buf = buf
+        log._size = size
+        return log
+
+    # ---- 只读 Sequence 接口 ----
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._buf.items[: self._size][index]
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("MessageLog index out of range")
+        return self._buf.items[index]
+
+    def __iter__(self):
+        items = self._buf.items
+        for i in range(self._size):
+            yield items[i]
+
+    def __reversed__(self):
+        items = self._buf.items
+        for i in range(self._size - 1, -1, -1):
+            yield items[i]
+
+    def __eq__(self, other):
+        if isinstance(other, (MessageLog, list, tuple)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __add__(self, other):
+        # 兼容 state["messages"] + [...] 这种写法（得到普通 list）
+        return list(self) + list(other)
+
+    def __repr__(self):
+        return f"MessageLog({list(self)!r})"
+
+    def __reduce__(self):
+        # pickle / deepcopy 时按普通列表保存
+        return (MessageLog, (list(self),))
+
+    def to_list(self) -> list:
+        return self._buf.items[: self._size]
+
+    def index_of(self, message_id: str):
+        """ 按 id 找消息的位置，找不到返回 None """
+        pos = self._buf.ids.get(message_id)
+        if pos is not None and pos < self._size and self._buf.items[pos].id == message_id:
+            return pos
+        return None
+
+    # ---- 追加 ----
+    def extend(self, messages) -> "MessageLog":
+        """ 返回追加了 messages 的新版本，自己不变 """
+        messages = _coerce(messages)
+        if not messages:
+            return self
+
+        buf = self._buf
+        with buf.lock:
+            # 同一批消息在同一个旧版本上再追加一次（LangGraph 算条件边时会先在副本上
+            # 试着应用一次更新），底层存储里已经有了，直接返回对应的版本
+            end = self._size + len(messages)
+            if end <= len(buf.items) and all(
+                buf.items[self._size + i] is m for i, m in enumerate(messages)
+            ):
+                return MessageLog._view(buf, end)
+
+            # 快速路径：自己是最新版本，而且新消息都是 "新的"（没有重复 id、没有删除）
+            if self._size == len(buf.items) and not any(
+                isinstance(m, RemoveMessage) or self.index_of(m.id) is not None for m in messages
+            ) and len({m.id for m in messages}) == len(messages):
+                for m in messages:
+                    buf.ids[m.id] = len(buf.items)
+                    buf.items.append(m)
+                return MessageLog._view(buf, len(buf.items))
+
+        # 慢速路径：从旧版本分叉、替换或删除消息时，复制一份再改
+        return MessageLog(_merge_copy(self.to_list(), messages))
+
+
+def _coerce(messages) -> list:
+    """ 单条消息 / dict / 元组统一转成带 id 的 BaseMessage 列表 """
+    if messages is None:
+        return []
+    if not isinstance(messages, (list, tuple, MessageLog)):
+        messages = [messages]
+    result = []
+    for m in messages:
+        if not isinstance(m, BaseMessage):
+            m = convert_to_messages([m])[0]
+        if m.id is None:
+            m.id = str(uuid.uuid4())
+        result.append(m)
+    return result
+
+
+def _merge_copy(left: list, right: list) -> list:
+    """ 和 add_messages 一样的语义：同 id 替换，RemoveMessage 删除，其余追加 """
+    merged = list(left)
+    positions = {m.id: i for i, m in enumerate(merged)}
+    removed = set()
+    for m in right:
+        pos = positions.get(m.id)
+        if isinstance(m, RemoveMessage):
+            if pos is None:
+                raise ValueError(f"要删除的消息 id={m.id} 不存在")
+            removed.add(pos)
+        elif pos is not None:
+            merged[pos] = m
+            removed.discard(pos)
+        else:
+            positions[m.id] = len(merged)
+            merged.append(m)
+    if removed:
+        merged = [m for i, m in enumerate(merged) if i not in removed]
+    return merged
+
+
+def append_messages(left, right) -> MessageLog:
+    """
+    LangGraph 的 reducer：left 是当前状态里的消息，right 是节点返回的新消息。
+    第一次调用时 left 是普通 list（或 None），之后都是 MessageLog。
+    """
+    if not isinstance(left, MessageLog):
+        left = MessageLog(_coerce(left))
+    return left.extend(right)
+
+
+class MessageLogSerializer(JsonPlusSerializer):
+    """ 给其他 checkpointer 用的序列化器：MessageLog 按普通 list 保存，其他类型和默认的一样 """
+
+    def dumps_typed(self, obj):
+        if isinstance(obj, MessageLog):
+            obj = obj.to_list()
+        return super().dumps_typed(obj)
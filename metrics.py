@@ -0,0 +1,290 @@
+"""
+轻量级 Prometheus 指标模块
+
+不依赖 prometheus_client，自己实现最常用的 Counter / Histogram，
+并按 Prometheus 文本格式（text/plain; version=0.0.4）输出，
+server.py 里的 /metrics 接口直接返回 REGISTRY.render() 即可。
+"""
+import threading
+import time
+from contextlib import contextmanager
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# 默认的直方图分桶（单位：秒），覆盖从几毫秒的本地操作到几十秒的 LLM 调用
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value) -> str:
+    """ 标签值转义：反斜杠、双引号、换行 """
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(label_names, label_values, extra=None):
+    """ 把标签拼成 {a="1",b="2"} 的形式 """
+    pairs = list(zip(label_names, label_values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    body = ",".join(f'{k}="{_escape(v)}"' for k, v in pairs)
+    return "{" + body + "}"
+
+
+class Counter:
+    """ 只增不减的计数器，例如 token 总数 """
+
+    def __init__(self, name: str, help_text: str, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        key = tuple(str(labels.get(n, "")) for n in self.label_names)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, key)} {value}")
+        return lines
+
+
+class Histogram:
+    """ 直方图：记录耗时分布，Prometheus 端可以算 P50/P95/P99 """
+
+    def __init__(self, name: str, help_text: str, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [每个桶的计数..., 总和, 总次数]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.label_names)
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                data = [0] * len(self.buckets) + [0.0, 0]
+                self._values[key] = data
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data[i] += 1
+            data[-2] += value
+            data[-1] += 1
+
+    def count(self, **labels) -> int:
+        """ 某组标签下一共记录了多少次 """
+        key = tuple(str(labels.get(n, "")) for n in self.label_names)
+        with self._lock:
+            data = self._values.get(key)
+            return data[-1] if data else 0
+
+    @contextmanager
+    def time(self, **labels):
+        """ 用法：with hist.time(stage="prep"): ... """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, data in sorted(self._values.items()):
+                for i, bound in enumerate(self.buckets):
+                    labels = _format_labels(self.label_names, key, ("le", bound))
+                    lines.append(f"{self.name}_bucket{labels} {data[i]}")
+                labels = _format_labels(self.label_names, key, ("le", "+Inf"))
+                lines.append(f"{self.name}_bucket{labels} {data[-1]}")
+                labels = _format_labels(self.label_names, key)
+                lines.append(f"{self.name}_sum{labels} {data[-2]}")
+                lines.append(f"{self.name}_count{labels} {data[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    """ 指标注册表：同名指标只创建一次，方便在多个模块里取用 """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, help_text, label_names, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = cls(name, help_text, label_names, **kwargs)
+                self._metrics[name] = metric
+            return metric
+
+    def counter(self, name: str, help_text: str, label_names=()) -> Counter:
+        return self._get_or_create(Counter, name, help_text, label_names)
+
+    def histogram(self, name: str, help_text: str, label_names=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help_text, label_names, buckets=buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# 全局注册表
+REGISTRY = MetricsRegistry()
+
+# ============================================================================
+# Agent 相关的常用指标
+# ============================================================================
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "http_request_duration_seconds", "HTTP 请求耗时", ("method", "path", "status")
+)
+AGENT_STAGE_SECONDS = REGISTRY.histogram(
+    "agent_stage_duration_seconds", "agent_app 各阶段耗时（prep/history_load/agent_step/tool/history_save/extract）", ("stage",)
+)
+LLM_CALL_SECONDS = REGISTRY.histogram(
+    "llm_call_duration_seconds", "单次 LLM 调用耗时", ("model",)
+)
+TOOL_CALL_SECONDS = REGISTRY.histogram(
+    "tool_call_duration_seconds", "单次工具调用耗时", ("tool",)
+)
+LLM_TOKENS_TOTAL = REGISTRY.counter(
+    "llm_tokens_total", "LLM 消耗的 token 数", ("model", "type")
+)
+LLM_ERRORS_TOTAL = REGISTRY.counter(
+    "llm_errors_total", "LLM 调用失败次数", ("model",)
+)
+TOOL_ERRORS_TOTAL = REGISTRY.counter(
+    "tool_errors_total", "工具调用失败次数", ("tool",)
+)
+
+
+# ============================================================================
+# LangChain 回调：自动记录 LLM、工具、Agent 每一步的耗时和 token
+# ============================================================================
+# 回调里的 run name 是类名（Chain.get_name()），并行执行工具的子类也要算进来（见 parallel_agent.py）
+AGENT_EXECUTOR_NAMES = ("AgentExecutor", "ParallelAgentExecutor")
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """
+    挂到 Runnable 的 callbacks 上即可：
+        agent_app.with_config(callbacks=[MetricsCallbackHandler()])
+
+    - LLM 调用：记录耗时和 token 用量
+    - 工具调用：按工具名记录耗时
+    - Agent 步骤：AgentExecutor（包括 ParallelAgentExecutor）每一轮 "思考"（调用 agent runnable）记为一个 agent_step
+    """
+
+    def __init__(self):
+        # run_id -> (开始时间, 标签)
+        self._starts = {}
+        # 正在运行的 AgentExecutor 的 run_id，用来识别它下面的 "思考" 步骤
+        self._executor_runs = set()
+        self._lock = threading.Lock()
+
+    # ---- 工具函数 ----
+    def _start(self, run_id: UUID, kind: str, label: str):
+        with self._lock:
+            self._starts[run_id] = (time.perf_counter(), kind, label)
+
+    def _stop(self, run_id: UUID):
+        with self._lock:
+            item = self._starts.pop(run_id, None)
+        if item is None:
+            return None
+        start, kind, label = item
+        return time.perf_counter() - start, kind, label
+
+    # ---- Chain（用于识别 Agent 步骤） ----
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        name = kwargs.get("name") or (serialized or {}).get("name", "")
+        with self._lock:
+            if name in AGENT_EXECUTOR_NAMES:
+                self._executor_runs.add(run_id)
+                return
+            is_step = parent_run_id is not None and parent_run_id in self._executor_runs
+        if is_step:
+            self._start(run_id, "agent_step", name)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        with self._lock:
+            self._executor_runs.discard(run_id)
+        item = self._stop(run_id)
+        if item is not None:
+            AGENT_STAGE_SECONDS.observe(item[0], stage="agent_step")
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            self._executor_runs.discard(run_id)
+        self._stop(run_id)
+
+    # ---- LLM ----
+    def _model_name(self, serialized, kwargs):
+        params = kwargs.get("invocation_params") or {}
+        return params.get("model") or params.get("model_name") or (serialized or {}).get("name", "unknown")
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(run_id, "llm", self._model_name(serialized, kwargs))
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(run_id, "llm", self._model_name(serialized, kwargs))
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        item = self._stop(run_id)
+        model = item[2] if item else "unknown"
+        if item is not None:
+            LLM_CALL_SECONDS.observe(item[0], model=model)
+
+        # token 用量：优先读消息上的 usage_metadata（流式/非流式都有），
+        # 没有的话再看 llm_output 里的 token_usage
+        input_tokens = output_tokens = 0
+        for generations in response.generations:
+            for gen in generations:
+                usage = getattr(getattr(gen, "message", None), "usage_metadata", None)
+                if usage:
+                    input_tokens += usage.get("input_tokens", 0)
+                    output_tokens += usage.get("output_tokens", 0)
+        if not (input_tokens or output_tokens):
+            usage = (response.llm_output or {}).get("token_usage") or {}
+            input_tokens = usage.get("prompt_tokens", 0)
+            output_tokens = usage.get("completion_tokens", 0)
+
+        if input_tokens:
+            LLM_TOKENS_TOTAL.inc(input_tokens, model=model, type="input")
+        if output_tokens:
+            LLM_TOKENS_TOTAL.inc(output_tokens, model=model, type="output")
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        item = self._stop(run_id)
+        LLM_ERRORS_TOTAL.inc(model=item[2] if item else "unknown")
+
+    # ---- 工具 ----
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        name = kwargs.get("name") or (serialized or {}).get("name", "unknown")
+        self._start(run_id, "tool", name)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        item = self._stop(run_id)
+        if item is not None:
+            TOOL_CALL_SECONDS.observe(item[0], tool=item[2])
+            AGENT_STAGE_SECONDS.observe(item[0], stage="tool")
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        item = self._stop(run_id)
+        TOOL_ERRORS_TOTAL.inc(tool=item[2] if item else "unknown")
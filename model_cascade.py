@@ -0,0 +1,169 @@
+"""
+模型级联：先用便宜的小模型，不合格再升级到大模型
+
+项目里所有节点都直接用 qwen-plus，不管任务难不难。很多请求（写一段短文、讲个笑话）
+qwen-turbo 就能做好，又快又便宜。
+
+ModelCascade 是一个 Runnable，用法和 ChatOpenAI 一样（invoke / ainvoke，输入消息或字符串，输出 AIMessage）：
+- tiers：从便宜到贵排好的模型列表
+- validator：检查某一层的输出合不合格（response -> bool），不合格就换下一层再来一次；
+  最后一层的输出不再检查，直接返回
+- 某一层调用出错也会升级到下一层（最后一层出错才往上抛）
+- 每一层的调用次数（accepted 通过 / rejected 被 validator 打回 / error 出错 / final 最后一层）、
+  耗时、token 费用都记到 /metrics，返回的消息里 response_metadata["cascade_tier"] 标明用的是哪一层，
+  response_metadata["cascade_attempts"] 记录每一次尝试（包括被打回的）的 token 用量，方便调用方自己记账
+
+用法：
+    writer_llm = ModelCascade(default_tiers(), validator=lambda msg: len(msg.content) > 200, name="writer")
+    response = writer_llm.invoke([HumanMessage(content="...")])
+"""
+import os
+import time
+
+from langchain_core.runnables import Runnable
+from langchain_core.runnables.config import ensure_config, patch_config
+from langchain_openai import ChatOpenAI
+
+from metrics import REGISTRY
+
+# 便宜模型 / 主力模型，可以用环境变量换
+CASCADE_CHEAP_MODEL = os.getenv("CASCADE_CHEAP_MODEL", "qwen-turbo")
+CASCADE_MAIN_MODEL = os.getenv("CASCADE_MAIN_MODEL", "qwen-plus")
+# MODEL_CASCADE=0 时只用主力模型（相当于关闭级联）
+MODEL_CASCADE_ENABLED = os.getenv("MODEL_CASCADE", "1") == "1"
+
+# 每千 token 价格（元）：(输入, 输出)，按百炼的价目表填写，价格调整了改这里
+MODEL_PRICES = {
+    "qwen-turbo": (0.0003, 0.0006),
+    "qwen-plus": (0.0008, 0.002),
+    "qwen-max": (0.0024, 0.0096),
+}
+
+CASCADE_CALLS = REGISTRY.counter(
+    "model_cascade_calls_total", "模型级联每一层的调用结果（accepted / rejected / error / final）",
+    ("cascade", "tier", "result"),
+)
+CASCADE_LATENCY = REGISTRY.histogram(
+    "model_cascade_latency_seconds", "模型级联每一层的调用耗时（秒）", ("cascade", "tier")
+)
+CASCADE_COST = REGISTRY.counter(
+    "model_cascade_cost_yuan_total", "模型级联每一层花掉的费用（元，按 MODEL_PRICES 估算）", ("cascade", "tier")
+)
+
+
+class CascadeTier:
+    """ 级联里的一层：名字（指标里用）+ 模型 + 每千 token 价格 """
+
+    def __init__(self, name: str, llm, price_per_1k: tuple = None):
+        self.name = name
+        self.llm = llm
+        model = getattr(llm, "model_name", None) or name
+        self.price_per_1k = price_per_1k or MODEL_PRICES.get(model, (0.0, 0.0))
+
+    def cost(self, response) -> float:
+        usage = getattr(response, "usage_metadata", None) or {}
+        input_price, output_price = self.price_per_1k
+        return (usage.get("input_tokens", 0) * input_price + usage.get("output_tokens", 0) * output_price) / 1000
+
+
+def default_tiers(**llm_kwargs) -> list[CascadeTier]:
+    """ qwen-turbo -> qwen-plus（MODEL_CASCADE=0 时只有 qwen-plus）；llm_kwargs 传给每一层的 ChatOpenAI """
+    base_url = os.environ.get("DASHSCOPE_BASE_URL")
+    models = [CASCADE_CHEAP_MODEL, CASCADE_MAIN_MODEL] if MODEL_CASCADE_ENABLED else [CASCADE_MAIN_MODEL]
+    return [CascadeTier(m, ChatOpenAI(base_url=base_url, model=m, **llm_kwargs)) for m in models]
+
+
+class ModelCascade(Runnable):
+    """ 按顺序尝试每一层模型，直到 validator 认可（或者到了最后一层） """
+
+    def __init__(self, tiers: list[CascadeTier], validator=None, name: str = "cascade"):
+        if not tiers:
+            raise ValueError("ModelCascade 至少需要一层模型")
+        self.tiers = tiers
+        self.validator = validator or (lambda response: bool(str(response.content).strip()))
+        self.name = name
+
+    def with_validator(self, validator) -> "ModelCascade":
+        """ 同样的模型层，换一个 validator（比如校验要用到当前请求里的数据时） """
+        return ModelCascade(self.tiers, validator, self.name)
+
+    def _accept(self, tier: CascadeTier, response, elapsed: float, is_last: bool) -> bool:
+        CASCADE_LATENCY.observe(elapsed, cascade=self.name, tier=tier.name)
+        CASCADE_COST.inc(tier.cost(response), cascade=self.name, tier=tier.name)
+        if is_last:
+            CASCADE_CALLS.inc(cascade=self.name, tier=tier.name, result="final")
+            return True
+        try:
+            ok = bool(self.validator(response))
+        except Exception as e:
+            print(f"⚠️ [{self.name}] 校验 {tier.name} 的输出时出错，当作不合格: {e}")
+            ok = False
+        CASCADE_CALLS.inc(cascade=self.name, tier=tier.name, result="accepted" if ok else "rejected")
+        if not ok:
+            print(f"⬆️ [{self.name}] {tier.name} 的输出没通过校验，升级到下一层模型")
+        return ok
+
+    def _on_error(self, tier: CascadeTier, error: Exception, is_last: bool):
+        CASCADE_CALLS.inc(cascade=self.name, tier=tier.name, result="error")
+        if is_last:
+            raise error
+        print(f"⬆️ [{self.name}] {tier.name} 调用失败（{error!r}），升级到下一层模型")
+
+    @staticmethod
+    def _attempt(tier: CascadeTier, result: str, elapsed: float, response=None) -> dict:
+        usage = getattr(response, "usage_metadata", None) or {}
+        return {
+            "tier": tier.name,
+            "result": result,
+            "input_tokens": usage.get("input_tokens", 0),
+            "output_tokens": usage.get("output_tokens", 0),
+            "latency_s": round(elapsed, 3),
+        }
+
+    @staticmethod
+    def _mark(response, tier: CascadeTier, attempts: list):
+        response.response_metadata["cascade_tier"] = tier.name
+        response.response_metadata["cascade_attempts"] = attempts
+        return response
+
+    def _invoke(self, input, run_manager, config):
+        attempts = []
+        for index, tier in enumerate(self.tiers):
+            is_last = index == len(self.tiers) - 1
+            tier_config = patch_config(config, callbacks=run_manager.get_child(f"tier:{tier.name}"))
+            start = time.perf_counter()
+            try:
+                response = tier.llm.invoke(input, tier_config)
+            except Exception as e:
+                attempts.append(self._attempt(tier, "error", time.perf_counter() - start))
+                self._on_error(tier, e, is_last)
+                continue
+            elapsed = time.perf_counter() - start
+            accepted = self._accept(tier, response, elapsed, is_last)
+            attempts.append(self._attempt(tier, "accepted" if accepted else "rejected", elapsed, response))
+            if accepted:
+                return self._mark(response, tier, attempts)
+
+    async def _ainvoke(self, input, run_manager, config):
+        attempts = []
+        for index, tier in enumerate(self.tiers):
+            is_last = index == len(self.tiers) - 1
+            tier_config = patch_config(config, callbacks=run_manager.get_child(f"tier:{tier.name}"))
+            start = time.perf_counter()
+            try:
+                response = await tier.llm.ainvoke(input, tier_config)
+            except Exception as e:
+                attempts.append(self._attempt(tier, "error", time.perf_counter() - start))
+                self._on_error(tier, e, is_last)
+                continue
+            elapsed = time.perf_counter() - start
+            accepted = self._accept(tier, response, elapsed, is_last)
+            attempts.append(self._attempt(tier, "accepted" if accepted else "rejected", elapsed, response))
+            if accepted:
+                return self._mark(response, tier, attempts)
+
+    def invoke(self, input, config=None, **kwargs):
+        return self._call_with_config(self._invoke, input, ensure_config(config))
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        return await self._acall_with_config(self._ainvoke, input, ensure_config(config))
@@ -0,0 +1,195 @@
+"""
+并行执行工具的 AgentExecutor
+
+qwen-plus 一步里经常返回好几个工具调用（比如查两次员工手册再算一次乘法），
+AgentExecutor 的同步路径是一个一个执行的，总耗时 = 所有工具耗时之和。
+
+ParallelAgentExecutor 把同一步里的工具调用一起执行：
+- 同步调用（invoke / stream）：放到线程池里，每个任务带上当前的 contextvars
+- 异步调用（ainvoke / astream）：每个工具一个 asyncio task
+- max_concurrency：一步里最多同时执行几个工具
+- 超时：每个工具单独计时（tool_timeouts 按工具名配置，没配的用 tool_timeout），从开始执行算起，
+  排队等并发名额的时间另有上限（前面每一轮最多等一个超时）；超时的工具返回一段说明文字作为 observation，让 LLM 继续往下走，
+  不会卡住整个请求。同步路径里已经在跑的工具没法中断，只是被放弃（线程跑完自己退出）
+- 工具抛异常的行为和 AgentExecutor 一样（往上抛），结果顺序和 LLM 给出的调用顺序一致
+- prefetch：可选，invoke / ainvoke 开始时就用用户的原始输入在后台执行它，
+  和第一次 LLM 调用同时进行，工具里用 retrieval_prefetch.take_prefetched 取结果；
+  prefetch_when(input) 返回 False 时这次不预取
+
+实现方式：父类在 _iter_next_step 里调用 _perform_agent_action 执行每个工具，
+这里让 _perform_agent_action 只做登记（返回一个占位的 AgentStep），
+等这一步的调用全部登记完，再在 _iter_next_step 里一起执行。
+"""
+import asyncio
+import contextvars
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Optional
+
+from langchain_classic.agents import AgentExecutor
+from langchain_core.agents import AgentStep
+
+from metrics import REGISTRY
+from retrieval_prefetch import prefetching
+
+TOOL_MAX_CONCURRENCY = int(os.getenv("AGENT_TOOL_MAX_CONCURRENCY", "4"))
+# 单个工具的超时（秒）
+TOOL_TIMEOUT = float(os.getenv("AGENT_TOOL_TIMEOUT", "30"))
+
+STEP_TOOL_CALLS = REGISTRY.histogram(
+    "agent_step_tool_calls", "Agent 每一步里同时发起的工具调用数", buckets=(1, 2, 3, 4, 6, 8, 12)
+)
+STEP_TOOL_SECONDS = REGISTRY.histogram(
+    "agent_step_tool_seconds", "Agent 每一步执行全部工具的耗时（秒，并行执行）"
+)
+TOOL_TIMEOUTS = REGISTRY.counter(
+    "agent_tool_timeouts_total", "Agent 工具调用超时次数", ("tool",)
+)
+
+# 占位 observation：表示这个调用只登记了、还没执行
+_DEFERRED = object()
+
+
+class ParallelAgentExecutor(AgentExecutor):
+    """ 同一步里的多个工具调用并行执行的 AgentExecutor """
+
+    max_concurrency: int = TOOL_MAX_CONCURRENCY
+    tool_timeout: float = TOOL_TIMEOUT
+    tool_timeouts: dict[str, float] = {}
+    prefetch: Optional[Callable[[str], Any]] = None
+    prefetch_when: Optional[Callable[[str], bool]] = None
+
+    def _call(self, inputs, run_manager=None):
+        if self.prefetch is None:
+            return super()._call(inputs, run_manager)
+        with prefetching(self.prefetch, inputs.get("input", ""), self.prefetch_when):
+            return super()._call(inputs, run_manager)
+
+    async def _acall(self, inputs, run_manager=None):
+        if self.prefetch is None:
+            return await super()._acall(inputs, run_manager)
+        with prefetching(self.prefetch, inputs.get("input", ""), self.prefetch_when):
+            return await super()._acall(inputs, run_manager)
+
+    def _timeout_for(self, tool_name: str) -> float:
+        return self.tool_timeouts.get(tool_name, self.tool_timeout)
+
+    def _timeout_step(self, agent_action) -> AgentStep:
+        timeout = self._timeout_for(agent_action.tool)
+        TOOL_TIMEOUTS.inc(tool=agent_action.tool)
+        print(f"⏱️ 工具 {agent_action.tool} 超过 {timeout:g} 秒没有返回，已跳过")
+        return AgentStep(
+            action=agent_action,
+            observation=f"工具 {agent_action.tool} 调用超时（{timeout:g} 秒），请不要依赖这个结果。",
+        )
+
+    # ---- 同步：线程池 ----
+    def _perform_agent_action(self, name_to_tool_map, color_mapping, agent_action, run_manager=None):
+        return AgentStep(action=agent_action, observation=_DEFERRED)
+
+    def _iter_next_step(self, name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager=None):
+        pending = []
+        for item in super()._iter_next_step(
+            name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager
+        ):
+            if isinstance(item, AgentStep) and item.observation is _DEFERRED:
+                pending.append(item.action)
+            else:
+                yield item
+        if pending:
+            yield from self._run_actions(name_to_tool_map, color_mapping, pending, run_manager)
+
+    def _run_actions(self, name_to_tool_map, color_mapping, actions, run_manager):
+        STEP_TOOL_CALLS.observe(len(actions))
+        start = time.perf_counter()
+        workers = min(self.max_concurrency, len(actions))
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="agent-tool")
+        # 每个工具的截止时间：提交时按排队的位置算（前面每一轮最多等 max_timeout，再加上自己的超时），
+        # 真正开始执行时改成 "开始时间 + 超时"。前面的工具超时被放弃后会一直占着线程，
+        # 排在后面的工具就靠提交时的截止时间兜底，不会无限等下去
+        timeouts = [self._timeout_for(action.tool) for action in actions]
+        max_timeout = max(timeouts)
+        submitted = time.monotonic()
+        deadlines = [submitted + (index // workers) * max_timeout + timeout for index, timeout in enumerate(timeouts)]
+
+        def _perform(index, action):
+            deadlines[index] = time.monotonic() + timeouts[index]
+            return AgentExecutor._perform_agent_action(self, name_to_tool_map, color_mapping, action, run_manager)
+
+        steps = [None] * len(actions)
+        try:
+            # 每个任务带上当前上下文的副本（回调、tracing 等都依赖 contextvars）
+            futures = {
+                pool.submit(contextvars.copy_context().run, _perform, index, action): index
+                for index, action in enumerate(actions)
+            }
+            pending = set(futures)
+            while pending:
+                now = time.monotonic()
+                for future in [f for f in pending if deadlines[futures[f]] <= now]:
+                    # 还在排队的会被取消；已经在跑的没法强行停掉，只能不再等它（见下面 finally）
+                    future.cancel()
+                    pending.discard(future)
+                    steps[futures[future]] = self._timeout_step(actions[futures[future]])
+                if not pending:
+                    break
+                done, _ = wait(pending, timeout=min(deadlines[futures[f]] for f in pending) - now,
+                               return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.discard(future)
+                    steps[futures[future]] = future.result()
+        finally:
+            # 超时的工具会被放弃而不是取消：它的线程会一直跑到工具自己返回。
+            # 线程池是这一步专用的，不等它、也不再复用，所以不会占住后面的请求；
+            # 工具本身（HTTP 请求等）最好有自己的超时，避免线程越积越多
+            pool.shutdown(wait=False, cancel_futures=True)
+        STEP_TOOL_SECONDS.observe(time.perf_counter() - start)
+        return steps
+
+    # ---- 异步：asyncio task ----
+    async def _aperform_agent_action(self, name_to_tool_map, color_mapping, agent_action, run_manager=None):
+        return AgentStep(action=agent_action, observation=_DEFERRED)
+
+    async def _aiter_next_step(self, name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager=None):
+        pending = []
+        async for item in super()._aiter_next_step(
+            name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager
+        ):
+            if isinstance(item, AgentStep) and item.observation is _DEFERRED:
+                pending.append(item.action)
+            else:
+                yield item
+        if pending:
+            for step in await self._arun_actions(name_to_tool_map, color_mapping, pending, run_manager):
+                yield step
+
+    async def _arun_actions(self, name_to_tool_map, color_mapping, actions, run_manager):
+        STEP_TOOL_CALLS.observe(len(actions))
+        start = time.perf_counter()
+        limit = asyncio.Semaphore(self.max_concurrency)
+
+        async def _run(action):
+            async with limit:
+                try:
+                    return await asyncio.wait_for(
+                        AgentExecutor._aperform_agent_action(
+                            self, name_to_tool_map, color_mapping, action, run_manager
+                        ),
+                        timeout=self._timeout_for(action.tool),
+                    )
+                except asyncio.TimeoutError:
+                    return self._timeout_step(action)
+
+        tasks = [asyncio.create_task(_run(action)) for action in actions]
+        try:
+            steps = await asyncio.gather(*tasks)
+        except BaseException:
+            # 有一个工具抛异常（或者整个请求被取消）时，这一步已经失败了，
+            # 把其余还在跑的工具也取消掉并等它们退出，和同步路径关掉线程池一样
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        STEP_TOOL_SECONDS.observe(time.perf_counter() - start)
+        return steps
@@ -0,0 +1,164 @@
+"""
+Prompt 预算：调用 LLM 之前先数 token，超了就裁剪
+
+链在把 prompt 发给模型之前，并不知道拼出来的 prompt 有多大：历史越聊越长、检索回来的片段越来越多，
+超长的 prompt 要么在服务商那边慢慢失败，要么白白浪费 token。
+
+budget_stage() 返回一个放在 prompt 前面的 Runnable：
+- 用本地分词器（tiktoken）数 system + 历史 + 检索片段 + 当前问题一共多少 token；
+  没装 tiktoken 或者加载词表失败（离线）时，按字符估算（中文 1 字≈1 token，其余 4 字符≈1 token）
+- 超过预算时按优先级从低到高裁剪：先丢最早的历史消息，再丢排名最靠后的检索片段；
+  system 提示词、当前问题、Agent 的中间步骤（scratchpad）不裁剪
+- 裁剪前后的 token 数、被裁掉的条数都记到 /metrics
+
+用法：
+    chain = budget_stage(prompt, history_key="messages") | prompt | llm
+"""
+import os
+import threading
+
+from langchain_core.messages import HumanMessage
+from langchain_core.runnables import RunnableLambda
+
+from metrics import REGISTRY
+
+# 默认预算（token）：system + 历史 + 上下文 + 问题，不含模型输出
+PROMPT_MAX_TOKENS = int(os.getenv("PROMPT_MAX_TOKENS", "6000"))
+# tiktoken 的编码名：qwen 的分词器和 cl100k_base 不完全一样，用来估算预算足够了
+PROMPT_TOKENIZER = os.getenv("PROMPT_TOKENIZER", "cl100k_base")
+# 每条消息的格式开销（角色、分隔符等）
+_PER_MESSAGE_TOKENS = 4
+
+PROMPT_TOKENS = REGISTRY.histogram(
+    "prompt_tokens", "发送给 LLM 的 prompt token 数（before 裁剪前 / after 裁剪后）", ("chain", "stage"),
+    buckets=(128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536),
+)
+PROMPT_TRIMMED = REGISTRY.counter(
+    "prompt_budget_trimmed_total", "为了满足预算被裁掉的条目数（history 历史消息 / docs 检索片段）", ("chain", "part")
+)
+PROMPT_OVER_BUDGET = REGISTRY.counter(
+    "prompt_budget_exceeded_total", "裁剪完仍然超过预算的次数（不可裁剪的部分本身就太大）", ("chain",)
+)
+
+_encoding = None
+_encoding_lock = threading.Lock()
+_encoding_failed = False
+
+
+def _get_encoding():
+    """ 第一次用到时才加载 tiktoken 词表；失败了就记下来，以后都用估算 """
+    global _encoding, _encoding_failed
+    if _encoding is None and not _encoding_failed:
+        with _encoding_lock:
+            if _encoding is None and not _encoding_failed:
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.get_encoding(PROMPT_TOKENIZER)
+                except Exception as e:
+                    _encoding_failed = True
+                    print(f"⚠️ tiktoken 不可用（{e}），改用按字符估算 token 数")
+    return _encoding
+
+
+def estimate_tokens(text: str) -> int:
+    """ 不依赖分词器的估算：中日韩字符按 1 个 token，其余每 4 个字符 1 个 token """
+    cjk = sum(1 for ch in text if "⺀" <= ch <= "鿿" or "豈" <= ch <= "﫿")
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def count_tokens(text: str) -> int:
+    encoding = _get_encoding()
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(messages) -> int:
+    total = 0
+    for message in messages:
+        content = message.content if isinstance(message.content, str) else str(message.content)
+        total += count_tokens(content) + _PER_MESSAGE_TOKENS
+        # 工具调用的参数也会发给模型
+        for call in getattr(message, "tool_calls", None) or []:
+            total += count_tokens(str(call.get("args", ""))) + count_tokens(call.get("name", ""))
+    return total
+
+
+def _default_format_docs(docs) -> str:
+    return "\n\n".join(d.page_content for d in docs)
+
+
+class PromptBudget:
+    """
+    prompt：后面要用的 ChatPromptTemplate（用来算固定部分的大小）
+    history_key：输入里历史消息的 key（可裁剪，先丢最早的）
+    docs_key：输入里检索结果（按相关度排序的 Document 列表）的 key（可裁剪，先丢排在最后的）
+    context_key：裁剪后的检索结果用 format_docs 拼成字符串，放到这个 key 给 prompt 用
+    """
+
+    def __init__(self, prompt, max_tokens: int = None, *, name: str = "chain", history_key: str = None,
+                 docs_key: str = None, context_key: str = "context", format_docs=_default_format_docs):
+        self.prompt = prompt
+        self.max_tokens = max_tokens or PROMPT_MAX_TOKENS
+        self.name = name
+        self.history_key = history_key
+        self.docs_key = docs_key
+        self.context_key = context_key
+        self.format_docs = format_docs
+
+    def __call__(self, inputs: dict) -> dict:
+        inputs = dict(inputs)
+        history = list(inputs.get(self.history_key) or []) if self.history_key else []
+        docs = list(inputs.get(self.docs_key) or []) if self.docs_key else []
+
+        # 固定部分：历史为空、上下文为空时 prompt 的大小
+        empty = dict(inputs)
+        if self.history_key:
+            empty[self.history_key] = []
+        if self.docs_key:
+            empty[self.context_key] = ""
+        fixed = count_message_tokens(self.prompt.format_messages(**empty))
+
+        history_tokens = [count_message_tokens([m]) for m in history]
+        doc_tokens = [count_tokens(d.page_content) + 2 for d in docs]
+        total = fixed + sum(history_tokens) + sum(doc_tokens)
+        PROMPT_TOKENS.observe(total, chain=self.name, stage="before")
+
+        # 1. 先丢最早的历史；为了不让历史以 AI / 工具消息开头，一直丢到下一条用户消息为止
+        dropped_history = 0
+        while total > self.max_tokens and history:
+            total -= history_tokens.pop(0)
+            history.pop(0)
+            dropped_history += 1
+            while history and not isinstance(history[0], HumanMessage):
+                total -= history_tokens.pop(0)
+                history.pop(0)
+                dropped_history += 1
+
+        # 2. 再丢排名最靠后的检索片段（至少保留一条）
+        dropped_docs = 0
+        while total > self.max_tokens and len(docs) > 1:
+            total -= doc_tokens.pop()
+            docs.pop()
+            dropped_docs += 1
+
+        if dropped_history:
+            PROMPT_TRIMMED.inc(dropped_history, chain=self.name, part="history")
+        if dropped_docs:
+            PROMPT_TRIMMED.inc(dropped_docs, chain=self.name, part="docs")
+        if total > self.max_tokens:
+            PROMPT_OVER_BUDGET.inc(chain=self.name)
+        PROMPT_TOKENS.observe(total, chain=self.name, stage="after")
+
+        if self.history_key:
+            inputs[self.history_key] = history
+        if self.docs_key:
+            inputs[self.docs_key] = docs
+            inputs[self.context_key] = self.format_docs(docs)
+        return inputs
+
+
+def budget_stage(prompt, max_tokens: int = None, **kwargs) -> RunnableLambda:
+    """ 返回放在 prompt 前面的 Runnable，参数见 PromptBudget """
+    budget = PromptBudget(prompt, max_tokens, **kwargs)
+    return RunnableLambda(budget, name=f"prompt_budget[{budget.name}]")
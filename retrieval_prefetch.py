@@ -0,0 +1,124 @@
+"""
+检索预取：LLM 还在思考要不要查员工手册的时候，先把手册查了
+
+Agent 回答制度类问题时要先花一整轮 LLM 调用决定调用 query_company_manual，
+然后检索才开始。其实用户的原始问题本身就是一个很好的检索词。
+
+用法：
+    with prefetching(retrieve, user_input):   # 在后台线程里开始检索，立刻返回
+        ...第一次调用 LLM...
+        # 工具里：
+        docs = take_prefetched(question)       # 问题和预取时用的足够像就直接用预取结果
+        if docs is None:
+            docs = retrieve(question)
+
+预取结果放在 contextvar 里，只对当前这次请求可见；工具在线程池里执行时
+（parallel_agent.py 会复制 contextvars）也能拿到。预取结果只给一次：同一步里 LLM
+查了好几次手册（检索词各不相同），只有第一个够像的调用用预取结果，其余的自己检索。
+
+"足够像"用字符二元组判断，两个方向的包含度取较小的那个：检索词只是原问题里的一小段
+（比如只查 "年假"）时不算像，否则整句话的检索结果会被当成这一小段的结果。
+"""
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from metrics import REGISTRY
+from singleflight import normalize_text
+
+# 检索词和原始问题的最低相似度，低于它就不用预取结果
+# （LLM 改写的检索词通常比原问题短一截，"满十年的年假天数" 对 "公司规定满十年的年假是多少天？" 约 0.36，单独的 "年假" 约 0.07）
+PREFETCH_MIN_OVERLAP = float(os.getenv("PREFETCH_MIN_OVERLAP", "0.35"))
+# 工具等预取结果最多等几秒，超过了自己查；大约一次检索的耗时就够了，等得更久还不如重新查
+PREFETCH_WAIT = float(os.getenv("PREFETCH_WAIT", "1.5"))
+
+PREFETCH_REQUESTS = REGISTRY.counter(
+    "retrieval_prefetch_total",
+    "检索预取的使用情况（hit 用上了 / miss 检索词不够像 / taken 已经被别的调用用过 / error 预取失败或没来得及 / unused 没有工具来取 / skipped 问题不像要查手册）",
+    ("result",),
+)
+
+_pool = ThreadPoolExecutor(max_workers=int(os.getenv("PREFETCH_WORKERS", "4")), thread_name_prefix="prefetch")
+_current = contextvars.ContextVar("retrieval_prefetch", default=None)
+
+
+class _Prefetch:
+    def __init__(self, query: str, future):
+        self.query = query
+        self.future = future
+        self.used = False
+        self.lock = threading.Lock()
+
+    def claim(self) -> bool:
+        """ 第一次调用返回 True，之后都返回 False（预取结果只给一个工具调用） """
+        with self.lock:
+            if self.used:
+                return False
+            self.used = True
+            return True
+
+
+def _bigrams(text: str) -> set:
+    text = "".join(ch for ch in normalize_text(text) if ch.isalnum())
+    if len(text) < 2:
+        return {text} if text else set()
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def overlap(query: str, source: str) -> float:
+    """ 两段文字的相似度（0 ~ 1）：共同的字符二元组数 / 二元组较多的那一方的数量 """
+    query_grams, source_grams = _bigrams(query), _bigrams(source)
+    if not query_grams or not source_grams:
+        return 0.0
+    return len(query_grams & source_grams) / max(len(query_grams), len(source_grams))
+
+
+@contextmanager
+def prefetching(retrieve, query: str, when=None):
+    """
+    在后台开始 retrieve(query)，with 块里的工具可以用 take_prefetched 拿结果。
+    when(query) 返回 False 时不预取（比如问题里没有和手册相关的词），省掉一次 embedding + 检索。
+    """
+    if not query:
+        yield
+        return
+    if when is not None and not when(query):
+        PREFETCH_REQUESTS.inc(result="skipped")
+        yield
+        return
+    prefetch = _Prefetch(query, _pool.submit(retrieve, query))
+    token = _current.set(prefetch)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+        if not prefetch.used:
+            PREFETCH_REQUESTS.inc(result="unused")
+
+
+def take_prefetched(query: str):
+    """ 返回预取的检索结果；没有预取、检索词不够像、已经被用过或者预取失败时返回 None """
+    prefetch = _current.get()
+    if prefetch is None:
+        return None
+    if overlap(query, prefetch.query) < PREFETCH_MIN_OVERLAP:
+        PREFETCH_REQUESTS.inc(result="miss")
+        return None
+    if not prefetch.claim():
+        PREFETCH_REQUESTS.inc(result="taken")
+        return None
+    if not prefetch.future.running() and not prefetch.future.done():
+        # 预取还在线程池里排队（池子被别的请求占满了），等它不如自己查
+        prefetch.future.cancel()
+        PREFETCH_REQUESTS.inc(result="error")
+        return None
+    try:
+        result = prefetch.future.result(timeout=PREFETCH_WAIT)
+    except Exception as e:
+        print(f"⚠️ 预取的检索结果不可用，重新检索: {e!r}")
+        PREFETCH_REQUESTS.inc(result="error")
+        return None
+    PREFETCH_REQUESTS.inc(result="hit")
+    return result
@@ -0,0 +1,148 @@
+"""
+人工审核服务：把 demo_12 的 "人机协同" 流程做成 HTTP 接口
+
+demo_12 的 human_node 用 interrupt() 把图挂起，状态存在 SQLite checkpointer 里，
+等待审核期间不占 CPU、不占线程，挂起几千个待审核任务也没关系。
+审核人随时通过 thread_id 批准 / 驳回，图从中断的地方继续跑。
+
+接口：
+    POST /reviews                      提交问题，跑到人工审核为止，返回 thread_id 和 AI 建议
+    GET  /reviews/{thread_id}          查看状态（pending 待审核 / done 已完成）
+    POST /reviews/{thread_id}/approve  批准，流程结束
+    POST /reviews/{thread_id}/reject   驳回并附上意见，Agent 重新生成，再次进入待审核
+
+approve / reject 都要带上查看时拿到的 interrupt_id：驳回之后 Agent 会生成新的建议、
+产生新的 interrupt_id，审核人没看过的建议不能被批准 / 驳回（409）。
+
+接口都是普通 def：checkpointer（checkpoint_store.SqliteDeltaSaver）的读写是同步的 SQLite 操作，
+FastAPI 会把 def 接口放到线程池里跑，不会卡住事件循环。
+
+运行：uvicorn review_server:app --port 8001
+"""
+import threading
+import uuid
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel
+from langchain_core.messages import HumanMessage
+from langgraph.types import Command
+
+# import 时只会编译图，不会跑命令行演示
+from demo_12_human_in_loop import app as review_graph
+
+app = FastAPI(
+    title="Human Review Server",
+    version="1.0",
+    description="基于 LangGraph interrupt 的非阻塞人工审核",
+)
+
+
+class SubmitRequest(BaseModel):
+    question: str
+
+
+class ApproveRequest(BaseModel):
+    interrupt_id: str
+
+
+class RejectRequest(BaseModel):
+    interrupt_id: str
+    feedback: str = "请重新回答"
+
+
+# 每个 thread_id 一把锁：两个审核人同时批准 / 驳回同一个任务时，只有一个能恢复，另一个直接拿到 409（不排队）
+# （只在当前进程内有效，review_server 需要单进程部署）
+_resume_locks: dict[str, threading.Lock] = {}
+_resume_locks_guard = threading.Lock()
+
+
+def _resume_lock(thread_id: str) -> threading.Lock:
+    with _resume_locks_guard:
+        return _resume_locks.setdefault(thread_id, threading.Lock())
+
+
+def _config(thread_id: str) -> dict:
+    return {"configurable": {"thread_id": thread_id}}
+
+
+def _status(thread_id: str, snapshot) -> dict:
+    """ 把图的状态快照转成接口返回值 """
+    if snapshot.interrupts:
+        pending = snapshot.interrupts[0].value
+        return {
+            "thread_id": thread_id,
+            "status": "pending",
+            "interrupt_id": snapshot.interrupts[0].id,
+            "question": pending.get("question"),
+            "proposal": pending.get("proposal"),
+        }
+    messages = snapshot.values.get("messages", [])
+    # 最后一条是 "人工审核结果：ok"，倒数第二条才是通过审核的回答
+    answer = messages[-2].content if len(messages) >= 2 else None
+    return {"thread_id": thread_id, "status": "done", "answer": answer}
+
+
+def _load(thread_id: str):
+    snapshot = review_graph.get_state(_config(thread_id))
+    if not snapshot.values:
+        raise HTTPException(status_code=404, detail=f"thread_id={thread_id} 不存在")
+    return snapshot
+
+
+def _resume(thread_id: str, interrupt_id: str, decision: str) -> dict:
+    """
+    只有待审核、而且审核人看到的就是当前这条建议（interrupt_id 一致）时才能恢复，否则 409；
+    检查和恢复在同一把锁里，另一个请求正在处理同一个任务时直接 409，不会排在后面恢复下一轮
+    """
+    lock = _resume_lock(thread_id)
+    if not lock.acquire(blocking=False):
+        raise HTTPException(status_code=409, detail=f"thread_id={thread_id} 正在被其他审核请求处理")
+    try:
+        snapshot = _load(thread_id)
+        if not snapshot.interrupts:
+            raise HTTPException(status_code=409, detail=f"thread_id={thread_id} 当前没有待审核的内容")
+        if snapshot.interrupts[0].id != interrupt_id:
+            raise HTTPException(status_code=409, detail=f"thread_id={thread_id} 的待审核内容已经更新，请重新查看")
+        config = _config(thread_id)
+        review_graph.invoke(Command(resume=decision), config)
+        snapshot = review_graph.get_state(config)
+        if not snapshot.interrupts:
+            # 流程结束了，锁也用不着了
+            with _resume_locks_guard:
+                _resume_locks.pop(thread_id, None)
+        return _status(thread_id, snapshot)
+    finally:
+        lock.release()
+
+
+@app.post("/reviews")
+def submit(request: SubmitRequest):
+    thread_id = f"review-{uuid.uuid4()}"
+    config = _config(thread_id)
+    inputs = {"messages": [HumanMessage(content=request.question)], "human_feedback": ""}
+    # 跑到 human_node 的 interrupt() 就会返回，状态已经存进 checkpointer
+    review_graph.invoke(inputs, config)
+    return _status(thread_id, review_graph.get_state(config))
+
+
+@app.get("/reviews/{thread_id}")
+def get_review(thread_id: str):
+    return _status(thread_id, _load(thread_id))
+
+
+@app.post("/reviews/{thread_id}/approve")
+def approve(thread_id: str, request: ApproveRequest):
+    return _resume(thread_id, request.interrupt_id, "ok")
+
+
+@app.post("/reviews/{thread_id}/reject")
+def reject(thread_id: str, request: RejectRequest):
+    feedback = request.feedback.strip() or "请重新回答"
+    # "ok" 会被路由当成批准，驳回意见不能是 "ok"
+    if feedback == "ok":
+        raise HTTPException(status_code=400, detail="驳回意见不能是 'ok'")
+    return _resume(thread_id, request.interrupt_id, feedback)
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="localhost", port=8001)
@@ -0,0 +1,190 @@
+"""
+搜索结果缓存（SQLite，持久化）
+
+Researcher 每次都会联网搜索，同样的题目（包括 Streamlit 每次 rerun）会重复请求
+DuckDuckGo，既慢又容易被限流。这里做了三件事：
+- 规范化查询（全角/半角、空白、大小写）作为缓存 key，结果存到本地 SQLite，带 TTL
+  （没搜到结果的只缓存 SEARCH_CACHE_NEGATIVE_TTL 秒）
+- 条目数超过上限时按最近访问时间淘汰（LRU）
+- 全进程共享一个搜索工具：每个线程复用同一个 DDGS 客户端（内部缓存了 HTTP 连接），
+  同一个查询同时到达时只真正搜索一次（single-flight）
+
+用法：
+    from search_cache import cached_search
+    cached_search.invoke("特斯拉财报")
+"""
+import os
+import sqlite3
+import threading
+import time
+
+from langchain_core.tools import tool
+
+from metrics import REGISTRY
+from singleflight import SingleFlight, normalize_text
+
+DEFAULT_CACHE_PATH = os.getenv("SEARCH_CACHE_DB", "search_cache.sqlite")
+# 缓存有效期（秒），默认 6 小时；新闻类题目可以调短
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", str(6 * 3600)))
+# 没搜到结果（多半是被限流或者临时出错）只缓存很短时间，既不会连着重复请求，也不会把空结果记上 6 小时
+SEARCH_CACHE_NEGATIVE_TTL = float(os.getenv("SEARCH_CACHE_NEGATIVE_TTL", "60"))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "5000"))
+SEARCH_MAX_RESULTS = int(os.getenv("SEARCH_MAX_RESULTS", "5"))
+# 没搜到结果时返回的文字（和 DuckDuckGoSearchRun 一致）
+NO_RESULT = "No good DuckDuckGo Search Result was found"
+
+SEARCH_CACHE_REQUESTS = REGISTRY.counter(
+    "search_cache_requests_total", "搜索缓存查询次数（hit 命中 / miss 未命中 / expired 已过期）", ("result",)
+)
+SEARCH_CACHE_EVICTIONS = REGISTRY.counter(
+    "search_cache_evictions_total", "因为超过条目上限被淘汰的缓存条目数"
+)
+SEARCH_EMPTY_RESULTS = REGISTRY.counter(
+    "search_empty_results_total", "联网搜索没有返回结果的次数（只做短时间缓存）"
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS search_cache (
+    key TEXT PRIMARY KEY,
+    query TEXT NOT NULL,
+    result TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL,
+    ttl REAL
+);
+CREATE INDEX IF NOT EXISTS idx_search_cache_last_access ON search_cache (last_access);
+"""
+
+
+class SearchCache:
+    """ SQLite 搜索结果缓存：TTL 过期 + 条目数上限（LRU 淘汰） """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, ttl: float = SEARCH_CACHE_TTL,
+                 max_entries: int = SEARCH_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(_SCHEMA)
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(search_cache)")]
+        if "ttl" not in columns:
+            # 老版本建的表没有 ttl 列（NULL 表示用默认的 self.ttl）
+            self.conn.execute("ALTER TABLE search_cache ADD COLUMN ttl REAL")
+            self.conn.commit()
+        self.lock = threading.Lock()
+
+    def get(self, query: str):
+        """ 命中返回结果字符串，未命中 / 过期返回 None """
+        key = normalize_text(query)
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT result, created_at, ttl FROM search_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                SEARCH_CACHE_REQUESTS.inc(result="miss")
+                return None
+            result, created_at, ttl = row
+            if now - created_at > (self.ttl if ttl is None else ttl):
+                self.conn.execute("DELETE FROM search_cache WHERE key = ?", (key,))
+                self.conn.commit()
+                SEARCH_CACHE_REQUESTS.inc(result="expired")
+                return None
+            self.conn.execute("UPDATE search_cache SET last_access = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+        SEARCH_CACHE_REQUESTS.inc(result="hit")
+        return result
+
+    def put(self, query: str, result: str, ttl: float = None):
+        """ ttl 不传时用默认有效期 """
+        key = normalize_text(query)
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO search_cache (key, query, result, created_at, last_access, ttl) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, query, result, now, now, ttl),
+            )
+            (count,) = self.conn.execute("SELECT COUNT(*) FROM search_cache").fetchone()
+            overflow = count - self.max_entries
+            if overflow > 0:
+                self.conn.execute(
+                    "DELETE FROM search_cache WHERE key IN "
+                    "(SELECT key FROM search_cache ORDER BY last_access LIMIT ?)",
+                    (overflow,),
+                )
+                SEARCH_CACHE_EVICTIONS.inc(overflow)
+            self.conn.commit()
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM search_cache")
+            self.conn.commit()
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM search_cache").fetchone()[0]
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_search_cache() -> SearchCache:
+    """ 进程内共享一个缓存实例 """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SearchCache()
+        return _cache
+
+
+# =============================================================================
+# 共享的 DuckDuckGo 客户端
+# =============================================================================
+# DuckDuckGoSearchRun 每次调用都会 new 一个 DDGS()，连接没法复用。
+# DDGS 实例内部缓存了各个搜索引擎的 HTTP 客户端，这里每个线程保留一个，重复使用。
+_local = threading.local()
+_flight = SingleFlight("search")
+
+
+def _ddgs():
+    client = getattr(_local, "ddgs", None)
+    if client is None:
+        from ddgs import DDGS
+        client = _local.ddgs = DDGS()
+    return client
+
+
+def _search_uncached(query: str) -> str:
+    results = _ddgs().text(query, max_results=SEARCH_MAX_RESULTS)
+    if not results:
+        return NO_RESULT
+    # 和 DuckDuckGoSearchRun 的返回格式一致：把摘要拼起来
+    return " ".join(r["body"] for r in results)
+
+
+def search(query: str) -> str:
+    """ 先查缓存，未命中再联网；同一查询同时到达时只搜索一次 """
+    cache = get_search_cache()
+    result = cache.get(query)
+    if result is not None:
+        return result
+
+    def fetch():
+        text = _search_uncached(query)
+        if text == NO_RESULT or not text.strip():
+            SEARCH_EMPTY_RESULTS.inc()
+            cache.put(query, text, ttl=SEARCH_CACHE_NEGATIVE_TTL)
+        else:
+            cache.put(query, text)
+        return text
+
+    return _flight.do(normalize_text(query), fetch)
+
+
+@tool
+def cached_search(query: str) -> str:
+    """ 联网搜索（DuckDuckGo），相同的问题会直接返回缓存结果。输入是搜索关键词。 """
+    return search(query)
@@ -1,22 +1,35 @@
-from fastapi import FastAPI
+import asyncio
+import tempfile
+import threading
+import time
+import json
+import os
+from contextlib import asynccontextmanager, nullcontext
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+from typing import List, Optional
 from langserve import add_routes
-from agent_logic import agent_executor
 from langchain_core.runnables import RunnableLambda # 用于包装
 from langchain_core.runnables.history import RunnableWithMessageHistory
-from agent_logic import agent_executor
-import json
-import os
+import agent_logic
 from datetime import datetime
 from langchain_core.chat_history import InMemoryChatMessageHistory
 from langchain_core.messages import BaseMessage, messages_from_dict, messages_to_dict
 
 import traceback
 
+# 指标：/metrics 接口 + LangChain 回调
+from metrics import REGISTRY, HTTP_REQUEST_SECONDS, AGENT_STAGE_SECONDS, MetricsCallbackHandler
+from singleflight import SingleFlight, make_key
+
 
 print(f"⚠️ 当前工作目录 (文件将保存在这里): {os.getcwd()}")
 
 # 复用 Day 3 的文件存储类
 HISTORY_FILE = "agent_chat_history.json"
+# 所有 session 共用一个文件：读 -> 改 -> 写 必须整体加锁，否则两个 session 同时保存会丢掉一方的更新
+_history_file_lock = threading.Lock()
 
 # 初始化文件
 if not os.path.exists(HISTORY_FILE): # 如果文件不存在
@@ -24,20 +37,37 @@ if not os.path.exists(HISTORY_FILE): # 如果文件不存在
         json.dump({}, f)
 
 class FileChatMessageHistory(InMemoryChatMessageHistory):
-    def __init__(self, session_id: str):
+    """
+    所有 session 存在同一个 JSON 文件里。
+    异步路径（ainvoke / 批量接口）里文件读写和 _history_file_lock 都放到线程里做（aget_messages / aadd_messages），
+    不在事件循环上等锁、读写整个文件；load=False 时第一次用到消息才读文件。
+    """
+
+    def __init__(self, session_id: str, load: bool = True):
         super().__init__()
         object.__setattr__(self, "_session_id", session_id)
         object.__setattr__(self, "_file_path", HISTORY_FILE)
-        self._load_messages()
+        object.__setattr__(self, "_loaded", False)
+        if load:
+            self._ensure_loaded()
     
     @property
     def session_id(self):
         # 提供一个只读属性方便访问
         return getattr(self, "_session_id", None)
 
+    def _ensure_loaded(self):
+        if not self._loaded:
+            object.__setattr__(self, "_loaded", True)
+            self._load_messages()
+
     def _load_messages(self):
+        with AGENT_STAGE_SECONDS.time(stage="history_load"):
+            self._do_load_messages()
+
+    def _do_load_messages(self):
         try: 
-            with open(HISTORY_FILE, "r", encoding="utf-8") as f: # 读取文件
+            with _history_file_lock, open(HISTORY_FILE, "r", encoding="utf-8") as f: # 读取文件
                 data = json.load(f) # 解析 JSON
                 # 把 JSON 转成 LangChain 的消息列表
             raw = data.get(self.session_id, {}).get("messages", [])
@@ -53,12 +83,32 @@ class FileChatMessageHistory(InMemoryChatMessageHistory):
             print(f"❌ 加载历史失败 (文件可能为空或格式错误): {e}")
 
     def add_message(self, message: BaseMessage):
+        self._ensure_loaded()
         super().add_message(message)
         # 🌟 调试步骤 2: 确认是否进入保存逻辑
         print(f"💾 正在保存消息... 类型: {message.type}, 内容预览: {message.content[:20]}...")
         self._save_to_file()
+
+    def add_messages(self, messages):
+        # 一轮对话的问题和回答一起加进来，只写一次文件
+        self._ensure_loaded()
+        for message in messages:
+            super().add_message(message)
+        print(f"💾 正在保存 {len(messages)} 条消息...")
+        self._save_to_file()
+
+    async def aget_messages(self):
+        await asyncio.to_thread(self._ensure_loaded)
+        return list(self.messages)
+
+    async def aadd_messages(self, messages):
+        await asyncio.to_thread(self.add_messages, messages)
     
     def _save_to_file(self):
+        with AGENT_STAGE_SECONDS.time(stage="history_save"), _history_file_lock:
+            self._do_save_to_file()
+
+    def _do_save_to_file(self):
         # 🌟 调试步骤 3: 去除所有 try...except 的 pass，让报错直接炸出来        
         try:
             with open(HISTORY_FILE, "r", encoding="utf-8") as f: # 读取文件
@@ -85,8 +135,15 @@ class FileChatMessageHistory(InMemoryChatMessageHistory):
             # 更新并保存
             all_data[self.session_id] = current_session_dict
 
-            with open(HISTORY_FILE, "w", encoding="utf-8") as f: # 创建文件
-                json.dump(all_data, f, ensure_ascii=False, indent=4)
+            # 先写临时文件再整体替换：写到一半崩溃也不会留下半截的 JSON
+            fd, tmp_path = tempfile.mkstemp(prefix=".agent_chat_history_", dir=os.path.dirname(os.path.abspath(HISTORY_FILE)))
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(all_data, f, ensure_ascii=False, indent=4)
+                os.replace(tmp_path, HISTORY_FILE)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
 
             print(f"✅ 保存成功！文件路径: {HISTORY_FILE}")
             
@@ -96,30 +153,87 @@ class FileChatMessageHistory(InMemoryChatMessageHistory):
             print(traceback.format_exc())
 
 def get_session_history(session_id: str) -> FileChatMessageHistory:
-    return FileChatMessageHistory(session_id)
+    # RunnableWithMessageHistory 在 ainvoke 时也是同步调用这个工厂（就在事件循环上），
+    # 这时先不读文件，等 aget_messages 在线程里读
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return FileChatMessageHistory(session_id)
+    return FileChatMessageHistory(session_id, load=False)
+
+
+# 快速启动模式：AGENT_LAZY_INIT=1 时，import 阶段不再联网构建 FAISS / 创建 LLM，
+# 而是在服务启动后由后台线程预热（第一次请求如果先到，也会按需创建）。
+# 默认（0）保持原来的行为：启动时就把所有资源准备好。
+LAZY_INIT = os.getenv("AGENT_LAZY_INIT", "0") == "1"
+
+if not LAZY_INIT:
+    agent_logic.warmup()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if LAZY_INIT:
+        agent_logic.start_background_warmup()
+    yield
 
 # 1. 定义 FastAPI 应用
 app = FastAPI(
     title="LangChain Agent Server V2",
     description="带记忆的 Agent API 服务",
     version="2.0",
+    lifespan=lifespan,
 )
 
 # 包装 Agent
 # 定义一个预处理函数，把字符串转成字典
 def prep_input(x: str) -> dict:
-    return {"input": x}
+    with AGENT_STAGE_SECONDS.time(stage="prep"):
+        return {"input": x}
 
 # 2. 🌟 后处理：提取回答文本，不传复杂字典
 def extract_output(x: dict) -> str:
     # 从返回的大字典里只拿出 'output' 对应的字符串
     # 如果没有 output，返回一个默认提示
-    return x.get("output", "无回复")
+    with AGENT_STAGE_SECONDS.time(stage="extract"):
+        return x.get("output", "无回复")
+
+# 请求合并：同样的问题 + 同样的历史，同时只真正跑一次 Agent，其他请求共享结果
+# 设置 AGENT_SINGLE_FLIGHT=0 可以关闭
+SINGLE_FLIGHT = os.getenv("AGENT_SINGLE_FLIGHT", "1") == "1"
+agent_flight = SingleFlight("agent")
+
+def _flight_key(x: dict) -> str:
+    return make_key(x["input"], x.get("chat_history"))
+
+def _own_result(result: dict, x: dict) -> dict:
+    # 共享的是 leader 的结果，把 input / chat_history 换回当前请求自己的
+    return {**result, **x}
+
+# 通过函数拿 agent_executor：延迟初始化模式下，第一次调用时才真正创建
+def run_agent(x: dict, config) -> dict:
+    if not SINGLE_FLIGHT:
+        return agent_logic.get_agent_executor().invoke(x, config)
+    result = agent_flight.do(
+        _flight_key(x), lambda: agent_logic.get_agent_executor().invoke(x, config)
+    )
+    return _own_result(result, x)
+
+async def arun_agent(x: dict, config) -> dict:
+    async def _run():
+        # 还没预热完时，创建过程会联网，放到线程里做，避免卡住事件循环
+        executor = await asyncio.to_thread(agent_logic.get_agent_executor)
+        return await executor.ainvoke(x, config)
+
+    if not SINGLE_FLIGHT:
+        return await _run()
+    result = await agent_flight.ado(_flight_key(x), _run)
+    return _own_result(result, x)
+
+agent_runnable = RunnableLambda(run_agent, afunc=arun_agent, name="agent")
 
 # 1. 包装 Agent，加上记忆
 agent_with_history = RunnableWithMessageHistory(
-    agent_executor, 
+    agent_runnable, 
     get_session_history,    # 告诉它怎么存取历史
     input_messages_key="input", # 对应 AgentExecutor 的输入 key
     history_messages_key="chat_history" # 必须和 Agent 的 prompt 兼容
@@ -136,12 +250,43 @@ agent_with_history = RunnableWithMessageHistory(
 # 注意 Swagger UI 就会知道它需要接收一个 String，然后返回一个字典 Dict
 agent_app = RunnableLambda(prep_input) | agent_with_history | RunnableLambda(extract_output)
 
+# 挂上指标回调：LLM 耗时、token、每个 agent_step、每个工具的耗时都会自动记录
+metrics_handler = MetricsCallbackHandler()
+agent_app = agent_app.with_config(callbacks=[metrics_handler])
+
+# 不带记忆的版本：批量任务里没有 session_id 的条目用它，不读写历史文件
+stateless_agent_app = (
+    RunnableLambda(prep_input) | agent_runnable | RunnableLambda(extract_output)
+).with_config(callbacks=[metrics_handler])
+
+# 中间件：记录每个 HTTP 请求的耗时
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # 用路由模板（/agent/c/{config_hash}/invoke）而不是实际路径做标签，否则每个不同的路径都是一条新时间序列；
+        # 没匹配到路由的（404 扫描之类）统一记成 unmatched
+        route = request.scope.get("route")
+        HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - start,
+            method=request.method,
+            path=getattr(route, "path", None) or "unmatched",
+            status=status,
+        )
+
 # 2. 添加 LangChain 路由
 # path="/agent" 是接口路径前缀
+# 注意：LangServe 自带的 /agent/batch 被关掉了，换成下面自己实现的流式批量接口
 add_routes(
     app, 
     agent_app, 
-    path="/agent"
+    path="/agent",
+    disabled_endpoints=["batch"],
 )
 
 # 3. （可选）根路径提示
@@ -149,6 +294,110 @@ add_routes(
 def read_root():
     return {"message": "请访问 /docs 查看接口文档"}
 
+# 4. 存活 / 就绪检查
+# /healthz：进程活着就返回 200（给 liveness probe 用）
+# /ready：FAISS、LLM、AgentExecutor 都准备好了才返回 200，否则 503（给 readiness probe 用）
+@app.get("/healthz")
+def healthz():
+    return {"status": "ok"}
+
+@app.get("/ready")
+def ready():
+    status = agent_logic.readiness()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+# 5. Prometheus 指标接口
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+# 6. 批量接口：POST /agent/batch
+# - 每条任务可以带自己的 session_id（有就走带记忆的链，没有就走无状态的链）
+# - 服务端限制并发（全局上限 + 单次请求的 max_concurrency）
+# - 某条失败不影响其他条，失败原因写在结果里
+# - 结果按完成顺序以 NDJSON（一行一个 JSON）流式返回，最后一行是汇总
+BATCH_MAX_CONCURRENCY = int(os.getenv("AGENT_BATCH_MAX_CONCURRENCY", "8"))
+BATCH_MAX_ITEMS = int(os.getenv("AGENT_BATCH_MAX_ITEMS", "10000"))
+_batch_semaphore = None   # 所有批量请求共享，保证整个 worker 的并发不超过上限
+
+class BatchItem(BaseModel):
+    input: str
+    session_id: Optional[str] = None
+    id: Optional[str] = None    # 调用方自己的编号，原样返回
+
+class BatchRequest(BaseModel):
+    items: List[BatchItem]
+    max_concurrency: Optional[int] = None
+
+async def _run_batch_item(index: int, item: BatchItem, limit: asyncio.Semaphore, session_locks: dict) -> dict:
+    global _batch_semaphore
+    if _batch_semaphore is None:
+        _batch_semaphore = asyncio.Semaphore(BATCH_MAX_CONCURRENCY)
+
+    result = {"index": index, "id": item.id, "session_id": item.session_id}
+    # 同一个 session 的任务要按顺序跑，否则会同时读写同一份历史
+    # （不同 session 之间写同一个文件由 _history_file_lock 保证不丢更新，读写都在线程里，不卡事件循环）
+    # （先排 session 的队，再占并发名额，避免排队时白白占着名额）
+    session_lock = session_locks[item.session_id] if item.session_id else nullcontext()
+    async with session_lock, limit, _batch_semaphore:
+        start = time.perf_counter()
+        try:
+            if item.session_id:
+                output = await agent_app.ainvoke(
+                    item.input, config={"configurable": {"session_id": item.session_id}}
+                )
+            else:
+                output = await stateless_agent_app.ainvoke(item.input)
+            result.update({"ok": True, "output": output})
+        except Exception as e:
+            result.update({"ok": False, "error": f"{type(e).__name__}: {e}"})
+        result["latency_s"] = round(time.perf_counter() - start, 3)
+    return result
+
+@app.post("/agent/batch")
+async def agent_batch(request: BatchRequest):
+    if len(request.items) > BATCH_MAX_ITEMS:
+        return JSONResponse(
+            {"error": f"一次最多提交 {BATCH_MAX_ITEMS} 条，本次 {len(request.items)} 条"}, status_code=413
+        )
+
+    concurrency = min(request.max_concurrency or BATCH_MAX_CONCURRENCY, BATCH_MAX_CONCURRENCY)
+    limit = asyncio.Semaphore(max(concurrency, 1))
+    session_locks = {item.session_id: asyncio.Lock() for item in request.items if item.session_id}
+
+    async def stream_results():
+        start = time.perf_counter()
+        succeeded = failed = 0
+        tasks = [
+            asyncio.create_task(_run_batch_item(i, item, limit, session_locks))
+            for i, item in enumerate(request.items)
+        ]
+        try:
+            # 谁先完成先返回谁
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                if result["ok"]:
+                    succeeded += 1
+                else:
+                    failed += 1
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+        finally:
+            # 客户端断开时，把还没跑完的任务取消掉
+            for task in tasks:
+                task.cancel()
+
+        elapsed = time.perf_counter() - start
+        summary = {
+            "total": len(tasks),
+            "succeeded": succeeded,
+            "failed": failed,
+            "elapsed_s": round(elapsed, 3),
+            "throughput_per_s": round(len(tasks) / elapsed, 3) if elapsed > 0 else None,
+        }
+        yield json.dumps({"summary": summary}, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
 if __name__ == "__main__":
     import uvicorn
     # 启动服务：host=t = 0.0.0.0 允许外网访问，port=8000 
@@ -0,0 +1,120 @@
+"""
+Single-flight（请求合并）
+
+多个完全相同的请求同时到达时（客户端重试、很多人同时问同一个问题），
+只让第一个（leader）真正去跑 Agent，其余的（follower）直接等它的结果，
+省掉重复的 LLM / 工具调用。请求结束后立刻从表里删掉，不做结果缓存。
+"""
+import asyncio
+import hashlib
+import threading
+import unicodedata
+
+from metrics import REGISTRY
+
+SINGLEFLIGHT_REQUESTS = REGISTRY.counter(
+    "singleflight_requests_total", "进入 single-flight 的请求数（leader 真正执行，follower 共享结果）", ("name", "role")
+)
+SINGLEFLIGHT_SAVED = REGISTRY.counter(
+    "singleflight_saved_calls_total", "因为共享结果而省下的上游调用次数", ("name",)
+)
+
+
+def normalize_text(text: str) -> str:
+    """ 全角/半角统一、去首尾空白、合并连续空白、转小写 """
+    text = unicodedata.normalize("NFKC", str(text))
+    return " ".join(text.split()).lower()
+
+
+def fingerprint_messages(messages) -> str:
+    """ 对历史消息算一个指纹：只看消息类型和内容，不看 id / 时间戳等元数据 """
+    digest = hashlib.sha256()
+    for msg in messages or []:
+        digest.update(getattr(msg, "type", "").encode("utf-8"))
+        digest.update(b"\x00")
+        digest.update(str(getattr(msg, "content", msg)).encode("utf-8"))
+        digest.update(b"\x01")
+    return digest.hexdigest()
+
+
+def make_key(text: str, history=None) -> str:
+    """ 请求的 key = (规范化后的输入, 历史指纹) """
+    raw = normalize_text(text) + "\x00" + fingerprint_messages(history)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    用法：
+        flight = SingleFlight("agent")
+        result = flight.do(key, lambda: agent.invoke(x))            # 同步（线程）
+        result = await flight.ado(key, lambda: agent.ainvoke(x))    # 异步（协程）
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls = {}        # 同步调用：key -> _Call
+        self._tasks = {}        # 异步调用：key -> asyncio.Task
+        self._lock = threading.Lock()
+
+    def _record(self, role: str):
+        SINGLEFLIGHT_REQUESTS.inc(name=self.name, role=role)
+        if role == "follower":
+            SINGLEFLIGHT_SAVED.inc(name=self.name)
+
+    def do(self, key: str, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            self._record("follower")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        self._record("leader")
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    async def ado(self, key: str, afn):
+        task = self._tasks.get(key)
+        if task is not None and not task.done():
+            self._record("follower")
+        else:
+            self._record("leader")
+            # 真正的执行放在独立的 Task 里：某个等待者断开（被取消）不会影响其他人
+            task = asyncio.ensure_future(afn())
+            self._tasks[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: asyncio.Task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        # 所有等待者都走了的情况下，取一下异常，避免 "exception was never retrieved" 警告
+        if not task.cancelled():
+            task.exception()
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls) + len(self._tasks)
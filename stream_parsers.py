@@ -0,0 +1,48 @@
+"""
+流式列表解析器
+
+StrOutputParser 要等模型把整段话生成完才返回；列表类的输出（"列出 5 个事实"）
+其实每写完一行就可以交给下游处理了。
+
+LineListOutputParser 继承 LangChain 的 ListOutputParser：
+- chain.stream(...) 时，每一行（一个条目）一写完就 yield [条目]，不用等后面的行
+- chain.invoke(...) 时，返回完整的条目列表
+- 自动去掉行首的编号 / 列表符号："1." "2、" "3)" "-" "*" "•"，空行跳过
+  （列表符号后面必须有空格，"**粗体** 开头" 这种 Markdown 粗体不会被当成列表符号）
+
+用法：
+    chain = prompt | llm | LineListOutputParser()
+    for [item] in chain.stream({"topic": "猫", "num": 5}):
+        print(item)
+"""
+import re
+from typing import Iterator
+
+from langchain_core.output_parsers import ListOutputParser
+
+# 一个完整的非空行（必须以换行结尾），group(1) 是去掉编号 / 列表符号后的内容
+_LINE_PATTERN = re.compile(
+    r"^[ \t]*(?:(?:\d+|[一二三四五六七八九十]+)[.、)）](?!\d)|[-*•](?=[ \t]))?[ \t]*(\S[^\n]*?)[ \t]*\n",
+    re.M,
+)
+_SENTINEL = re.compile("")
+
+
+class LineListOutputParser(ListOutputParser):
+    """ 按行解析列表，流式时每行写完就输出一个条目 """
+
+    def get_format_instructions(self) -> str:
+        return "每个条目单独一行，不要开场白和总结。"
+
+    def parse(self, text: str) -> list[str]:
+        return [m.group(1) for m in _LINE_PATTERN.finditer(text + "\n")]
+
+    def parse_iter(self, text: str) -> Iterator[re.Match]:
+        yield from _LINE_PATTERN.finditer(text)
+        # ListOutputParser 总是把最后一个匹配留到下一轮（怕它还没写完），
+        # 这里的匹配都是以换行结尾的完整行，所以最后补一个空的 "哨兵"，让写完的行立刻输出
+        yield _SENTINEL.match("")
+
+    @property
+    def _type(self) -> str:
+        return "line-list"
@@ -0,0 +1,61 @@
+from typing import Annotated, TypedDict
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.graph import END, StateGraph
+
+from checkpoint_store import SqliteDeltaSaver
+from message_state import append_messages
+
+
+class State(TypedDict):
+    messages: Annotated[list, append_messages]
+    turns: int
+
+
+def _build(saver):
+    def reply(state):
+        return {"messages": [AIMessage(content=f"第{state['turns'] + 1}轮回答")], "turns": state["turns"] + 1}
+
+    workflow = StateGraph(State)
+    workflow.add_node("reply", reply)
+    workflow.set_entry_point("reply")
+    workflow.add_edge("reply", END)
+    return workflow.compile(checkpointer=saver)
+
+
+def _run_turns(app, config, count):
+    for i in range(count):
+        turns = app.get_state(config).values.get("turns", 0)
+        app.invoke({"messages": [HumanMessage(content=f"第{i + 1}个问题")], "turns": turns}, config)
+
+
+def test_messages_are_stored_as_deltas_and_read_back(tmp_path):
+    path = str(tmp_path / "checkpoints.sqlite")
+    config = {"configurable": {"thread_id": "t1"}}
+    saver = SqliteDeltaSaver(path)
+    _run_turns(_build(saver), config, 4)
+
+    kinds = {kind for (kind,) in saver.conn.execute("SELECT kind FROM blobs WHERE channel = 'messages'")}
+    assert "delta" in kinds
+
+    # 新的 saver（相当于进程重启）只能从数据库里把增量拼回来
+    reloaded = _build(SqliteDeltaSaver(path)).get_state(config).values
+    contents = [m.content for m in reloaded["messages"]]
+    assert contents == [text for i in range(4) for text in (f"第{i + 1}个问题", f"第{i + 1}轮回答")]
+    assert reloaded["turns"] == 4
+
+
+def test_history_and_threads_are_isolated(tmp_path):
+    saver = SqliteDeltaSaver(str(tmp_path / "checkpoints.sqlite"))
+    app = _build(saver)
+    _run_turns(app, {"configurable": {"thread_id": "a"}}, 2)
+    _run_turns(app, {"configurable": {"thread_id": "b"}}, 1)
+
+    history = list(app.get_state_history({"configurable": {"thread_id": "a"}}))
+    lengths = [len(snapshot.values.get("messages", [])) for snapshot in history]
+    # 从新到旧，消息数只减不增
+    assert lengths == sorted(lengths, reverse=True) and lengths[0] == 4
+    assert len(app.get_state({"configurable": {"thread_id": "b"}}).values["messages"]) == 2
+
+    saver.delete_thread("a")
+    assert not app.get_state({"configurable": {"thread_id": "a"}}).values
@@ -0,0 +1,106 @@
+import threading
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from context_compression import ContextCompressor, SentenceFilter, merge_chunks, split_sentences
+
+PAGE = "第一条：员工满一年享有五天年假。第二条：病假需要提供医院证明。第三条：每周可以远程办公一天。"
+
+
+def _chunk(start, end, page=0, source="manual.pdf"):
+    return Document(page_content=PAGE[start:end], metadata={"source": source, "page": page, "start_index": start})
+
+
+class KeywordEmbeddings(Embeddings):
+    """ 按关键词出现次数生成向量，记录调用次数 """
+    vocab = ["年假", "病假", "远程"]
+
+    def __init__(self):
+        self.document_calls = 0
+        self.query_calls = 0
+
+    def _vector(self, text):
+        return [text.count(word) for word in self.vocab] + [0.01]
+
+    def embed_documents(self, texts):
+        self.document_calls += 1
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text):
+        self.query_calls += 1
+        return self._vector(text)
+
+
+def test_merge_removes_duplicates_and_joins_overlapping_chunks():
+    docs = [_chunk(10, 30), _chunk(0, 16), _chunk(10, 30), _chunk(28, 45)]
+    merged = merge_chunks(docs)
+    assert len(merged) == 1
+    assert merged[0].page_content == PAGE[0:45]
+    assert merged[0].metadata["start_index"] == 0
+    assert merged[0].metadata["merged_chunks"] == 3
+
+
+def test_merge_keeps_gaps_pages_and_rank_order():
+    docs = [_chunk(30, 45), _chunk(0, 10), _chunk(5, 20, page=1), Document(page_content="没有位置信息的片段")]
+    merged = merge_chunks(docs)
+    # 和第一段之间隔着没检索到的内容、不同页的片段都不能合并
+    assert [d.page_content for d in merged] == [PAGE[30:45], PAGE[0:10], PAGE[5:20], "没有位置信息的片段"]
+    assert [d.metadata.get("page") for d in merged] == [0, 0, 1, None]
+    assert all("merged_chunks" not in d.metadata for d in merged)
+
+
+def test_merge_drops_identical_text_even_across_pages():
+    assert len(merge_chunks([_chunk(0, 10), _chunk(0, 10, page=1)])) == 1
+
+
+def test_merge_contained_chunk_does_not_grow_text():
+    merged = merge_chunks([_chunk(0, 40), _chunk(5, 20)])
+    assert [d.page_content for d in merged] == [PAGE[0:40]]
+
+
+def test_split_sentences_attaches_short_fragments():
+    assert split_sentences("一、\n员工满一年享有五天年假。好。病假需要证明。") == [
+        "一、\n员工满一年享有五天年假。好。", "病假需要证明。"
+    ]
+
+
+def test_sentence_filter_drops_irrelevant_sentences_and_marks_gaps():
+    docs = [Document(page_content=PAGE, metadata={"source": "manual.pdf"})]
+    out = SentenceFilter(KeywordEmbeddings(), threshold=0.5)("年假有几天", docs)
+    assert out[0].page_content == "第一条：员工满一年享有五天年假。"
+    assert out[0].metadata == docs[0].metadata
+
+    out = SentenceFilter(KeywordEmbeddings(), threshold=0.5)("年假和远程办公", docs)
+    assert out[0].page_content == "第一条：员工满一年享有五天年假。……第三条：每周可以远程办公一天。"
+
+
+def test_sentence_and_query_embeddings_are_cached():
+    embeddings = KeywordEmbeddings()
+    compressor = ContextCompressor(embeddings, threshold=0.5)
+    inputs = {"input": "年假有几天", "docs": [_chunk(0, 16), _chunk(10, 30)]}
+    first = compressor(inputs)
+    second = compressor(inputs)
+    assert first == second
+    assert embeddings.document_calls == 1
+    assert embeddings.query_calls == 1
+
+
+def test_concurrent_calls_share_the_cache():
+    embeddings = KeywordEmbeddings()
+    sentence_filter = SentenceFilter(embeddings, threshold=0.5)
+    docs = [Document(page_content=PAGE)]
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(sentence_filter("年假", docs))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len({r[0].page_content for r in results}) == 1
+
+
+def test_threshold_zero_only_merges():
+    embeddings = KeywordEmbeddings()
+    out = ContextCompressor(embeddings, threshold=0).compress("年假", [_chunk(0, 16), _chunk(0, 16)])
+    assert [d.page_content for d in out] == [PAGE[0:16]]
+    assert embeddings.document_calls == 0 and embeddings.query_calls == 0
@@ -0,0 +1,53 @@
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.tools import tool
+
+from fast_router import FastRouter, parse_number
+
+
+@tool
+def multiply(a: int, b: int) -> int:
+    """ 两数相乘 """
+    return a * b
+
+
+def test_parse_number():
+    assert parse_number("12") == 12
+    assert parse_number("三") == 3
+    assert parse_number("十二") == 12
+    assert parse_number("一百零五") == 105
+    assert parse_number("两千三百") == 2300
+    assert parse_number("三万") == 30000
+    assert parse_number("一万零五") == 10005
+
+
+def test_parse_number_rejects_malformed():
+    assert parse_number("一二") is None
+    assert parse_number("万") is None
+    assert parse_number("百") is None
+    assert parse_number("万万") is None
+
+
+def test_route_answers_simple_multiplication():
+    fast = FastRouter([multiply]).route("请问三乘以12等于多少？")
+    assert fast is not None
+    assert fast.args == {"a": 3, "b": 12}
+    assert fast.answer == "3 乘以 12 等于 36。"
+
+
+def test_route_falls_through():
+    router = FastRouter([multiply])
+    assert router.route("万乘以3等于多少") is None
+    assert router.route("2.5乘以4") is None
+    assert router.route("2乘以3再乘以4") is None
+    assert router.route("满十年的年假是多少天？顺便算一下3乘以3") is None
+    assert router.route("公司可以远程办公吗") is None
+
+
+def test_node_appends_tool_call_and_answer():
+    router = FastRouter([multiply])
+    update = router.node({"messages": [HumanMessage(content="3*3")]})
+    call, result, answer = update["messages"]
+    assert isinstance(call, AIMessage) and call.tool_calls[0]["args"] == {"a": 3, "b": 3}
+    assert isinstance(result, ToolMessage) and result.tool_call_id == call.tool_calls[0]["id"]
+    assert router.answered({"messages": [answer]})
+    assert router.node({"messages": [HumanMessage(content="你好")]}) == {}
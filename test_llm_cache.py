@@ -0,0 +1,84 @@
+import httpx
+import pytest
+from langchain_core.messages import HumanMessage
+from langchain_core.tools import tool
+from langchain_openai import ChatOpenAI
+
+import llm_cache
+from llm_cache import SqliteLLMCache, cache_if_deterministic
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = SqliteLLMCache(str(tmp_path / "llm_cache.sqlite"))
+    monkeypatch.setattr(llm_cache, "_cache", cache)
+    return cache
+
+
+def _llm(temperature, calls):
+    """ 用 MockTransport 代替真实的 HTTP 接口，calls 记录发出去的请求数 """
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(200, json={
+            "id": f"chatcmpl-{len(calls)}", "object": "chat.completion", "created": 1, "model": "qwen-plus",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": f"回答{len(calls)}"},
+                         "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+        })
+
+    return ChatOpenAI(model="qwen-plus", api_key="test", base_url="http://llm.test/v1", temperature=temperature,
+                      max_retries=0, http_client=httpx.Client(transport=httpx.MockTransport(handler)))
+
+
+@tool
+def multiply(a: int, b: int) -> int:
+    """ 两数相乘 """
+    return a * b
+
+
+def test_deterministic_llm_is_served_from_cache(cache):
+    calls = []
+    llm = cache_if_deterministic(_llm(0, calls))
+    first = llm.invoke("3 乘以 3 等于多少？")
+    second = llm.invoke("3 乘以 3 等于多少？")
+    assert len(calls) == 1
+    assert second.content == first.content
+    # 命中时没有消耗 token，也不能复用上次的消息 id
+    assert not (second.usage_metadata or {}).get("input_tokens")
+    assert second.id != first.id
+    assert cache.size() == 1
+
+
+def test_message_ids_do_not_affect_the_key(cache):
+    calls = []
+    llm = cache_if_deterministic(_llm(0, calls))
+    llm.invoke([HumanMessage(content="你好", id="a")])
+    llm.invoke([HumanMessage(content="你好", id="b")])
+    assert len(calls) == 1
+
+
+def test_bound_tools_are_part_of_the_key(cache):
+    calls = []
+    llm = cache_if_deterministic(_llm(0, calls))
+    llm.invoke("你好")
+    llm.bind_tools([multiply]).invoke("你好")
+    assert len(calls) == 2
+
+
+def test_non_deterministic_llm_is_not_cached(cache):
+    calls = []
+    llm = cache_if_deterministic(_llm(0.7, calls))
+    assert llm.cache is None
+    llm.invoke("讲个笑话")
+    llm.invoke("讲个笑话")
+    assert len(calls) == 2
+    assert cache.size() == 0
+
+
+def test_expired_entries_are_refetched(cache):
+    calls = []
+    llm = cache_if_deterministic(_llm(0, calls))
+    llm.invoke("你好")
+    cache.ttl = -1
+    llm.invoke("你好")
+    assert len(calls) == 2
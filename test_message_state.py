@@ -0,0 +1,88 @@
+import copy
+import pickle
+
+from langchain_core.messages import AIMessage, HumanMessage, RemoveMessage
+from langgraph.graph.message import add_messages
+
+from message_state import MessageLog, append_messages
+
+
+def test_append_matches_add_messages():
+    left = [HumanMessage(content="你好", id="1")]
+    right = [AIMessage(content="你好！", id="2"), HumanMessage(content="再见", id="3")]
+    assert append_messages(left, right).to_list() == add_messages(left, right)
+
+
+def test_single_message_and_dict_are_coerced():
+    log = append_messages(None, HumanMessage(content="a"))
+    log = append_messages(log, {"role": "assistant", "content": "b"})
+    assert [m.content for m in log] == ["a", "b"]
+    assert all(m.id for m in log)
+
+
+def test_old_versions_are_unchanged():
+    v1 = append_messages([], [HumanMessage(content="a", id="1")])
+    v2 = append_messages(v1, [AIMessage(content="b", id="2")])
+    v3 = append_messages(v2, [HumanMessage(content="c", id="3")])
+    assert [m.content for m in v1] == ["a"]
+    assert [m.content for m in v2] == ["a", "b"]
+    assert [m.content for m in v3] == ["a", "b", "c"]
+    # 追加走的是共享存储，不复制
+    assert v1._buf is v3._buf
+
+
+def test_fork_from_old_version_does_not_leak():
+    v1 = append_messages([], [HumanMessage(content="a", id="1")])
+    v2 = append_messages(v1, [AIMessage(content="b", id="2")])
+    fork = append_messages(v1, [AIMessage(content="x", id="9")])
+    assert [m.content for m in v2] == ["a", "b"]
+    assert [m.content for m in fork] == ["a", "x"]
+
+
+def test_reapplying_same_update_is_idempotent():
+    v1 = append_messages([], [HumanMessage(content="a", id="1")])
+    update = [AIMessage(content="b", id="2")]
+    assert append_messages(v1, update) == append_messages(v1, update)
+    assert len(append_messages(v1, update)) == 2
+
+
+def test_replace_and_remove_by_id():
+    log = append_messages([], [HumanMessage(content="a", id="1"), AIMessage(content="b", id="2")])
+    replaced = append_messages(log, [AIMessage(content="b2", id="2")])
+    assert [m.content for m in replaced] == ["a", "b2"]
+    removed = append_messages(replaced, [RemoveMessage(id="1")])
+    assert [m.content for m in removed] == ["b2"]
+    assert [m.content for m in log] == ["a", "b"]
+
+
+def test_pickle_and_deepcopy_round_trip():
+    log = append_messages([], [HumanMessage(content="a", id="1")])
+    for copied in (pickle.loads(pickle.dumps(log)), copy.deepcopy(log)):
+        assert isinstance(copied, MessageLog)
+        assert copied == log
+
+
+def test_other_checkpointers_work_with_message_log_serializer():
+    from typing import Annotated, TypedDict
+
+    from langgraph.checkpoint.memory import InMemorySaver
+    from langgraph.graph import END, StateGraph
+
+    from message_state import MessageLogSerializer
+
+    class State(TypedDict):
+        messages: Annotated[list, append_messages]
+
+    workflow = StateGraph(State)
+    workflow.add_node("reply", lambda state: {"messages": [AIMessage(content=f"回答{len(state['messages'])}")]})
+    workflow.set_entry_point("reply")
+    workflow.add_edge("reply", END)
+    app = workflow.compile(checkpointer=InMemorySaver(serde=MessageLogSerializer()))
+
+    config = {"configurable": {"thread_id": "t"}}
+    for question in ("一", "二"):
+        app.invoke({"messages": [HumanMessage(content=question)]}, config)
+    messages = app.get_state(config).values["messages"]
+    assert [m.content for m in messages] == ["一", "回答1", "二", "回答3"]
+    # 从 checkpointer 读回来的是普通 list，reducer 会重新包成 MessageLog
+    assert isinstance(append_messages(messages, [HumanMessage(content="三")]), MessageLog)
@@ -0,0 +1,64 @@
+import uuid
+
+import pytest
+from langchain_classic.agents import create_tool_calling_agent
+from langchain_core.language_models.fake_chat_models import FakeMessagesListChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.tools import tool
+
+from metrics import AGENT_STAGE_SECONDS, LLM_ERRORS_TOTAL, TOOL_ERRORS_TOTAL, MetricsCallbackHandler
+from parallel_agent import ParallelAgentExecutor
+
+
+class ToolCallingFake(FakeMessagesListChatModel):
+    """ 按顺序返回预先写好的消息；bind_tools 什么也不做 """
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+
+@tool
+def multiply(a: int, b: int) -> int:
+    """ 两数相乘 """
+    return a * b
+
+
+def test_agent_steps_of_parallel_executor_are_recorded():
+    llm = ToolCallingFake(responses=[
+        AIMessage(content="", tool_calls=[{"name": "multiply", "args": {"a": 3, "b": 3}, "id": "call_1"}]),
+        AIMessage(content="3 乘以 3 等于 9。"),
+    ])
+    prompt = ChatPromptTemplate.from_messages([("human", "{input}"), MessagesPlaceholder("agent_scratchpad")])
+    executor = ParallelAgentExecutor(agent=create_tool_calling_agent(llm, [multiply], prompt), tools=[multiply])
+
+    steps_before = AGENT_STAGE_SECONDS.count(stage="agent_step")
+    tools_before = AGENT_STAGE_SECONDS.count(stage="tool")
+    result = executor.invoke({"input": "3乘以3"}, config={"callbacks": [MetricsCallbackHandler()]})
+
+    assert result["output"] == "3 乘以 3 等于 9。"
+    # 两轮 "思考"：一次决定调用 multiply，一次给出回答
+    assert AGENT_STAGE_SECONDS.count(stage="agent_step") - steps_before == 2
+    assert AGENT_STAGE_SECONDS.count(stage="tool") - tools_before == 1
+
+
+@tool
+def broken(x: str) -> str:
+    """ 总是出错的工具 """
+    raise ValueError("boom")
+
+
+def test_llm_and_tool_errors_are_counted_separately():
+    handler = MetricsCallbackHandler()
+    llm_before = LLM_ERRORS_TOTAL.value(model="broken-model")
+    tool_before = TOOL_ERRORS_TOTAL.value(tool="broken")
+
+    with pytest.raises(ValueError):
+        broken.invoke({"x": "a"}, config={"callbacks": [handler]})
+    assert TOOL_ERRORS_TOTAL.value(tool="broken") - tool_before == 1
+
+    run_id = uuid.uuid4()
+    handler.on_chat_model_start({}, [], run_id=run_id, invocation_params={"model": "broken-model"})
+    handler.on_llm_error(RuntimeError("boom"), run_id=run_id)
+    assert LLM_ERRORS_TOTAL.value(model="broken-model") - llm_before == 1
+    assert TOOL_ERRORS_TOTAL.value(tool="broken") - tool_before == 1
@@ -0,0 +1,87 @@
+import asyncio
+import time
+
+import pytest
+from langchain_classic.agents import create_tool_calling_agent
+from langchain_core.language_models.fake_chat_models import FakeMessagesListChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.tools import tool
+
+from parallel_agent import ParallelAgentExecutor
+
+
+class ToolCallingFake(FakeMessagesListChatModel):
+    """ 按顺序返回预先写好的消息；bind_tools 什么也不做 """
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+
+finished = []
+
+
+@tool
+def slow(x: str) -> str:
+    """ 慢工具 """
+    time.sleep(0.3 if x != "hang" else 1.0)
+    return x
+
+
+@tool
+async def aslow(x: str) -> str:
+    """ 慢的异步工具 """
+    await asyncio.sleep(0.3)
+    finished.append(x)
+    return x
+
+
+@tool
+async def afail(x: str) -> str:
+    """ 马上出错的异步工具 """
+    raise ValueError("boom")
+
+
+def _executor(calls, **kwargs):
+    llm = ToolCallingFake(responses=[AIMessage(content="", tool_calls=calls), AIMessage(content="完成")])
+    prompt = ChatPromptTemplate.from_messages([("human", "{input}"), MessagesPlaceholder("agent_scratchpad")])
+    tools = [slow, aslow, afail]
+    return ParallelAgentExecutor(agent=create_tool_calling_agent(llm, tools, prompt), tools=tools,
+                                 return_intermediate_steps=True, **kwargs)
+
+
+def _calls(name, *args):
+    return [{"name": name, "args": {"x": x}, "id": f"{name}_{i}"} for i, x in enumerate(args)]
+
+
+def test_tools_of_one_step_run_concurrently_in_order():
+    start = time.perf_counter()
+    result = _executor(_calls("slow", "a", "b", "c")).invoke({"input": "q"})
+    assert time.perf_counter() - start < 0.6
+    assert [step[1] for step in result["intermediate_steps"]] == ["a", "b", "c"]
+
+
+def test_timeout_counts_from_start_not_queue():
+    # 并发 1：三个 0.3 秒的工具排队跑完（共 0.9 秒），每个都没有超过 0.5 秒的超时
+    result = _executor(_calls("slow", "a", "b", "c"), max_concurrency=1, tool_timeouts={"slow": 0.5}).invoke({"input": "q"})
+    assert [step[1] for step in result["intermediate_steps"]] == ["a", "b", "c"]
+
+
+def test_hanging_tool_times_out():
+    result = _executor(_calls("slow", "a", "hang"), tool_timeouts={"slow": 0.5}).invoke({"input": "q"})
+    observations = [step[1] for step in result["intermediate_steps"]]
+    assert observations[0] == "a"
+    assert "超时" in observations[1]
+
+
+def test_async_failure_cancels_sibling_tools():
+    finished.clear()
+    executor = _executor(_calls("aslow", "a", "b") + _calls("afail", "x"))
+
+    async def main():
+        with pytest.raises(ValueError):
+            await executor.ainvoke({"input": "q"})
+        await asyncio.sleep(0.5)
+
+    asyncio.run(main())
+    assert finished == []
@@ -0,0 +1,76 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+import retrieval_prefetch
+from retrieval_prefetch import overlap, prefetching, take_prefetched
+
+QUESTION = "公司规定满十年的年假是多少天？"
+
+
+def _retrieve(query):
+    return [f"docs for {query}"]
+
+
+@contextmanager
+def started_prefetch(retrieve, query):
+    """ 真实场景里工具调用前隔着一次 LLM 调用，预取早就开始了；这里等它真的开始执行 """
+    with prefetching(retrieve, query):
+        prefetch = retrieval_prefetch._current.get()
+        while not (prefetch.future.running() or prefetch.future.done()):
+            time.sleep(0.001)
+        yield
+
+
+def test_overlap_is_symmetric():
+    assert overlap("满十年的年假是多少天", QUESTION) == overlap(QUESTION, "满十年的年假是多少天")
+    assert overlap(QUESTION, QUESTION) == 1.0
+    assert overlap("", QUESTION) == 0.0
+
+
+def test_rephrased_question_gets_prefetched_result():
+    with started_prefetch(_retrieve, QUESTION):
+        assert take_prefetched("满十年的年假是多少天") == [f"docs for {QUESTION}"]
+
+
+def test_short_sub_query_retrieves_on_its_own():
+    with started_prefetch(_retrieve, QUESTION):
+        assert take_prefetched("年假") is None
+        # 没被用掉，后面够像的调用还能拿到
+        assert take_prefetched(QUESTION) == [f"docs for {QUESTION}"]
+
+
+def test_prefetch_is_served_only_once():
+    with started_prefetch(_retrieve, QUESTION):
+        assert take_prefetched(QUESTION) is not None
+        assert take_prefetched(QUESTION) is None
+
+
+def test_concurrent_tool_calls_get_prefetch_at_most_once():
+    def slow_retrieve(query):
+        time.sleep(0.05)
+        return [query]
+
+    results = []
+    with started_prefetch(slow_retrieve, QUESTION):
+        threads = [
+            threading.Thread(target=contextvars.copy_context().run, args=(lambda: results.append(take_prefetched(QUESTION)),))
+            for _ in range(4)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    assert sum(r is not None for r in results) == 1
+
+
+def test_nothing_outside_prefetching_or_when_gated_off():
+    assert take_prefetched(QUESTION) is None
+    with prefetching(_retrieve, QUESTION, when=lambda q: False):
+        assert take_prefetched(QUESTION) is None
+
+
+def test_rewritten_query_still_hits():
+    with started_prefetch(_retrieve, QUESTION):
+        assert take_prefetched("满十年的年假天数") == [f"docs for {QUESTION}"]
@@ -0,0 +1,21 @@
+from stream_parsers import LineListOutputParser
+
+
+def test_parse_strips_numbers_and_bullets():
+    text = "1. 第一条\n2、第二条\n3) 第三条\n- 第四条\n* 第五条\n• 第六条\n"
+    assert LineListOutputParser().parse(text) == ["第一条", "第二条", "第三条", "第四条", "第五条", "第六条"]
+
+
+def test_parse_keeps_bold_and_plain_lines():
+    text = "**粗体** 开头\n普通的一行\n\n  * **粗体条目**\n"
+    assert LineListOutputParser().parse(text) == ["**粗体** 开头", "普通的一行", "**粗体条目**"]
+
+
+def test_parse_does_not_strip_decimal_numbers():
+    assert LineListOutputParser().parse("3.5 天年假") == ["3.5 天年假"]
+
+
+def test_stream_yields_each_line_once_it_is_complete():
+    parser = LineListOutputParser()
+    chunks = ["1. 猫会", "呼噜\n2. 猫", "爱睡觉\n", "3. 最后一行"]
+    assert list(parser.transform(iter(chunks))) == [["猫会呼噜"], ["猫爱睡觉"], ["最后一行"]]